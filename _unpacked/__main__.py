@@ -1,26 +1,70 @@
+import sys
+import time
+
+_started = time.perf_counter()
+
+# Command-line mode never needs tkinter; dispatch before importing it
+if __name__ == "__main__" and len(sys.argv) > 1:
+    import _cli
+    sys.exit(_cli.main())
+
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import messagebox as tkmsg
-import re
+from tkinter import simpledialog as tksimp
 import os
-import operator
+import math
 import sqlite3
+import threading
+import functools
+import collections
 import configparser
-import urllib.request
-import urllib.error
-import datetime
-import pprint
 import _build
-import _countries
+import _query
+import _obsstore
+import _timing
+import _instrument
+import _spatial
+import _polygon
+import _saved
+import _export
+
+# Set GHCND_STARTUP_TIMES to print a per-phase breakdown of startup
+startup = _timing.PhaseTimer(_started)
+startup.add("imports", _started)
 
 class GHCNDailyFinder(_build.Build):
     def __init__(self):
-        self.window = tk.Tk()
-        self.config = configparser.ConfigParser()
-        self.window.minsize(380, 500)
-        self.window.resizable(False, False)
-        self.window.title("GHCN-Daily Downloader Tk")
-        self.results = []
+        with startup.phase("window"):
+            self.window = tk.Tk()
+            self.config = configparser.ConfigParser()
+            self.window.minsize(380, 500)
+            self.window.resizable(False, False)
+            self.window.title("GHCN-Daily Downloader Tk")
+        self.stations = {}
+        # the stations in a fixed order, so results can be kept as positions
+        self.station_table = _query.StationTable(self.stations)
+        self.results = _query.ResultSet(self.station_table)
+        self.stations_loaded = False
+        # set once the loading thread has assigned the stations and table
+        self.stations_ready = threading.Event()
+        # built in the background once the stations have loaded
+        self.station_index = None
+        self.index_ready = threading.Event()
+        # the region (_polygon.Polygon) queries are limited to, if any
+        self.polygon = None
+        self.polygon_path = None
+        # station id : distance (km) for the results of a proximity query
+        self.distances = {}
+        # started on the first 'Download All' (see download_all)
+        self.downloader = None
+        self.batch = None
+        # progress of 'Extract Results From Archive' (see extract_all)
+        self.extraction = None
+        # the map of results, while open (see show_map)
+        self.map_view = None
+        self.recorder = _instrument.Recorder()
+        self.profiler = None
 
         if os.path.exists("ghcnd.ini") is False:
             # This implies that it is the user's first time running the program...
@@ -40,16 +84,38 @@ class GHCNDailyFinder(_build.Build):
                 self.window.destroy()
                 return None
 
-        self.load_defaults()
-
-        self.build_stations()
+        with startup.phase("load_defaults"):
+            self.load_defaults()
+
+        # Set GHCND_PROFILE (to a path prefix) to profile the main callbacks
+        #   for the session, plus GHCND_PROFILE_MEMORY to trace allocations;
+        #   the reports are written on exit. The callbacks are wrapped before
+        #   the menus and widgets bind them.
+        if os.environ.get("GHCND_PROFILE"):
+            import _profile
+            self.profiler = _profile.SessionProfiler(
+                os.environ["GHCND_PROFILE"],
+                bool(os.environ.get("GHCND_PROFILE_MEMORY"))
+            )
+            for name in [
+                "search", "resort_results", "download", "display_station_info"
+            ]:
+                setattr(self, name, self.profiler.wrap(getattr(self, name)))
+
+        # The window is built first; the station database then loads in the
+        #   background (see load_stations)
+        with startup.phase("build_menu"):
+            self.build_menu()
+        with startup.phase("build_app"):
+            self.build_app()
         self.window.bind(
             "<Destroy>",
             self.del_tempfile_database
         )
+        with startup.phase("first paint"):
+            self.window.update_idletasks()
 
-        self.build_menu()
-        self.build_app()
+        self.load_stations()
 
         self.window.mainloop()
 
@@ -58,12 +124,89 @@ class GHCNDailyFinder(_build.Build):
         method ensures the deletion of the temporary database used by the
         program.
         """
+        self.closing = True
+        if self.profiler is not None and self.profiler.written is False:
+            for path in self.profiler.write():
+                print("* Wrote profile report '{}'".format(path),
+                    file=sys.stderr)
+        if self.downloader is not None:
+            self.downloader.close()
+            self.downloader = None
+        if hasattr(self, "stations_db") is False:
+            return
         self.stations_db.close()
         try:
             os.remove(self.stations_db.name)
         except:
             pass
 
+    def load_stations(self):
+        """Starts loading the station database on a background thread,
+        displaying its progress until it completes. Queries remain disabled
+        until then.
+        """
+        self.closing = False
+        self.stations_error = None
+        self.stations_progress = 0
+        self.stations_started = time.perf_counter()
+        self.modify_results_label(
+            "Loading station database...",
+            {"foreground": "blue"}
+        )
+        self.loading_bar.pack(fill=tk.X, padx=30, before=self.results_label)
+
+        def load():
+            try:
+                self.build_stations(progress=self.set_stations_progress)
+                self.stations_ready.set()
+                self.station_index = _spatial.SpatialIndex.from_stations(
+                    self.stations.values()
+                )
+                self.index_ready.set()
+            except Exception as e:
+                self.stations_error = e
+            # The window may have closed before loading finished
+            if self.closing is True:
+                self.del_tempfile_database()
+
+        threading.Thread(target=load, daemon=True).start()
+        self.window.after(50, self.poll_stations)
+
+    def set_stations_progress(self, fraction):
+        """Progress callback for build_stations; safe to call from the
+        loading thread as the bar is only updated from poll_stations.
+        """
+        self.stations_progress = fraction
+
+    def poll_stations(self):
+        """Periodically updates the loading progress from the tk event loop
+        until the station database has been loaded.
+        """
+        self.loading_bar["value"] = self.stations_progress * 100
+        if self.stations_error is not None:
+            self.loading_bar.pack_forget()
+            self.modify_results_label(
+                "* The station database could not be loaded! *",
+                {"foreground": "red"}
+            )
+        elif self.stations_ready.is_set() is False:
+            # (progress reaches 1 before the stations are assigned)
+            self.window.after(50, self.poll_stations)
+        else:
+            startup.add("stations (background)", self.stations_started)
+            # each station's list label and info text, formatted once
+            self.labels = _query.StationText(self.stations)
+            self.infos = _query.StationText(self.stations, _query.station_info)
+            self.stations_loaded = True
+            self.loading_bar.pack_forget()
+            self.modify_results_label(
+                "{} stations loaded".format(len(self.stations)),
+                {"foreground": "blue"}
+            )
+            self.query_ready(self.entry, self.entry.get())
+            if os.environ.get("GHCND_STARTUP_TIMES"):
+                print(startup.report(), file=sys.stderr)
+
     def load_defaults(self):
         """While initializing the program, this method checks for and, if
         necessary, creates a file, 'ghcnd.ini': a file containing default
@@ -95,6 +238,28 @@ class GHCNDailyFinder(_build.Build):
         self.overwrite = tk.BooleanVar(
             value=self.config.getboolean("DEFAULT", "overwrite")
         )
+        # Set GHCND_INSTRUMENT to record timings regardless of the option
+        self.instrument = tk.BooleanVar(
+            value=self.config.getboolean(
+                "DEFAULT",
+                "instrument",
+                fallback=False
+            ) or bool(os.environ.get("GHCND_INSTRUMENT"))
+        )
+        self.recorder.enabled = self.instrument.get()
+        # 'Download All' ordering (see _download.ORDERS) and concurrency
+        self.download_order = tk.StringVar(
+            value=self.config.get("DEFAULT", "downloadorder", fallback="listed")
+        )
+        self.adaptive = tk.BooleanVar(
+            value=self.config.getboolean("DEFAULT", "adaptive", fallback=True)
+        )
+        # local observation store (see 'ingest') for observation filters
+        self.obs_store = self.config.get(
+            "DEFAULT",
+            "obsstore",
+            fallback="ghcnd-obs.db"
+        )
 
     def save_defaults(self):
         """Saves the current settings from the option menu for subsequent use
@@ -104,6 +269,10 @@ class GHCNDailyFinder(_build.Build):
         self.config["DEFAULT"]["sortmethod"] = self.sort_method.get()
         self.config["DEFAULT"]["descending"] = str(self.sort_direction.get())
         self.config["DEFAULT"]["overwrite"] = str(self.overwrite.get()).lower()
+        self.config["DEFAULT"]["instrument"] = str(self.instrument.get()).lower()
+        self.config["DEFAULT"]["downloadorder"] = self.download_order.get()
+        self.config["DEFAULT"]["adaptive"] = str(self.adaptive.get()).lower()
+        self.config["DEFAULT"]["obsstore"] = self.obs_store
 
         with open("ghcnd.ini", "w") as w:
             self.config.write(w)
@@ -117,14 +286,164 @@ class GHCNDailyFinder(_build.Build):
         self.lat_entry2.delete(0, tk.END)
         self.lon_entry2.delete(0, tk.END)
         self.filter_elevation.delete(0, tk.END)
-        self.query_ready(self.entry, "")
+        for widget in self.coverage_entries + self.observation_entries \
+            + self.proximity_entries:
+            widget.delete(0, tk.END)
+        self.clear_polygon()
 
     def query_ready(self, widget, change, event=None):
         """This method determines when the 'Submit Query' button can be pressed
         by the user.
         """
         # print("'{}'".format(widget), "'{}'".format(change), len(change))
-        if (
+        if widget in self.coverage_entries + self.observation_entries \
+            + self.proximity_entries:
+            ready = self.polygon is not None \
+                or self.coverage_ready(widget, change) \
+                or self.observations_ready(widget, change) \
+                or self.proximity_ready(widget, change) \
+                or self.filters_ready(self.entry, self.entry.get())
+        else:
+            ready = self.polygon is not None \
+                or self.coverage_ready() \
+                or self.observations_ready() \
+                or self.proximity_ready() \
+                or self.filters_ready(widget, change)
+
+        if ready is True:
+            # queries wait on the station database
+            if self.stations_loaded is False:
+                self.entry_btn["state"] = tk.DISABLED
+                return False
+            self.entry_btn["state"] = tk.NORMAL
+            # reset incomplete entries
+
+            return True
+        else:
+            self.entry_btn["state"] = tk.DISABLED
+            return False
+
+    def choose_polygon(self):
+        """Prompts for a region file (GeoJSON, WKT, or a list of 'lat, lon'
+        vertices) to limit queries to.
+        """
+        from tkinter import filedialog as tkfile
+        path = tkfile.askopenfilename(
+            parent = self.window,
+            title = "Choose Region",
+            filetypes = [
+                ("Regions", "*.geojson *.json *.wkt *.txt *.csv"),
+                ("All Files", "*"),
+            ],
+        )
+        if path:
+            self.set_polygon(path)
+
+    def set_polygon(self, path):
+        """Limits queries to the region in a file, returning a bool
+        indicating whether it could be read.
+        """
+        try:
+            self.polygon = _polygon.load_polygon(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            tkmsg.showerror(
+                title = "Region Not Loaded",
+                message = "'{}' couldn't be read as a region:\n\n{}".format(
+                    os.path.basename(path),
+                    e
+                ),
+                parent = self.window
+            )
+            return False
+        self.polygon_path = os.path.abspath(path)
+        self.region_label["text"] = "{} ({} vertices)".format(
+            os.path.basename(path),
+            sum(len(ring) for ring in self.polygon.rings)
+        )
+        self.region_label["foreground"] = "SystemWindowText"
+        self.query_ready(self.entry, self.entry.get())
+        return True
+
+    def clear_polygon(self):
+        """Removes the region queries are limited to."""
+        self.polygon = None
+        self.polygon_path = None
+        self.region_label["text"] = "(none)"
+        self.region_label["foreground"] = "gray"
+        self.query_ready(self.entry, self.entry.get())
+
+    def coverage_ready(self, widget=None, change=None):
+        """Returns a bool indicating if the data-coverage entries form a
+        filter: a complete year in either. 'change', if given, is the pending
+        content of 'widget'.
+        """
+        return any(
+            len(change if w == widget else w.get()) == 4
+            for w in self.coverage_entries
+        )
+
+    def observations_ready(self, widget=None, change=None):
+        """Returns a bool indicating if the observation entries form a
+        filter: a value, and both years for completeness. 'change', if
+        given, is the pending content of 'widget'.
+        """
+        values = {w: w.get() for w in self.observation_entries}
+        if widget in values:
+            values[widget] = change
+        try:
+            float(values[self.obs_value])
+        except ValueError:
+            return False
+        return self.obs_statistic.get() != "completeness" or all(
+            len(values[w]) == 4 for w in [self.obs_first, self.obs_last]
+        )
+
+    def choose_obs_store(self):
+        """Prompts for the observation store (see 'ingest') that observation
+        filters are answered from.
+        """
+        from tkinter import filedialog as tkfile
+        path = tkfile.askopenfilename(
+            parent = self.window,
+            title = "Choose Observation Store",
+            initialfile = os.path.basename(self.obs_store),
+            filetypes = [
+                ("SQLite Databases", "*.db *.sqlite"),
+                ("All Files", "*"),
+            ],
+        )
+        if path:
+            self.obs_store = path
+            self.save_defaults()
+
+    def proximity_ready(self, widget=None, change=None):
+        """Returns a bool indicating if the proximity entries form a query:
+        a coordinate plus a count and/or distance. 'change', if given, is
+        the pending content of 'widget'.
+        """
+        values = {w: w.get() for w in self.proximity_entries}
+        if widget in values:
+            values[widget] = change
+        try:
+            float(values[self.near_lat])
+            float(values[self.near_lon])
+        except ValueError:
+            return False
+        try:
+            if int(values[self.near_count]) > 0:
+                return True
+        except ValueError:
+            pass
+        try:
+            return float(values[self.near_radius]) > 0
+        except ValueError:
+            return False
+
+    def filters_ready(self, widget, change):
+        """Returns a bool indicating if the filters besides proximity form a
+        query, given the pending content ('change') of 'widget'.
+        """
+        return bool(
             widget == self.entry and (
                 len(change) > 0 or \
                 len(self.filter_state.get()) == 2 or \
@@ -259,14 +578,7 @@ class GHCNDailyFinder(_build.Build):
                     ])
                 )
             )
-        ):
-            self.entry_btn["state"] = tk.NORMAL
-            # reset incomplete entries
-
-            return True
-        else:
-            self.entry_btn["state"] = tk.DISABLED
-            return False
+        )
 
     def reset_query_button(self):
         """Restores the 'Submit Entry' button state from a previous disabling.
@@ -290,6 +602,8 @@ class GHCNDailyFinder(_build.Build):
         if config_change is True:
             self.save_defaults()
 
+        self.recorder.begin("resort")
+
         self.results_label["foreground"] = "blue"
         self.results_label["text"] = "{} match{} {} found{}".format(
             len(self.results),
@@ -309,31 +623,108 @@ class GHCNDailyFinder(_build.Build):
         # Clear results
         self.box_results.delete(0, tk.END)
 
-        self.results.sort(
-            key=lambda site: getattr(
-                site,
-                self.sort_method.get()
-            ) if self.sort_method.get() != "state" \
-            else str(getattr(
-                site,
-                self.sort_method.get()
-            )),
-            reverse = True if self.sort_direction.get() == 1 else False
-        )
+        with self.recorder.phase("sort"):
+            self.results.sort(
+                key=_query.sort_key(self.sort_method.get(), self.distances),
+                reverse = True if self.sort_direction.get() == 1 else False
+            )
 
         # populate results
-        for station in self.results:
-            self.box_results.insert(
-                tk.END,
-                "{} - {}{} - {}".format(
-                    station.id,
-                    "{} - ".format(station.state) \
-                        if station.state is not None else "",
-                    station.name,
-                    station.size
+        with self.recorder.phase("format"):
+            if len(self.distances) > 0:
+                labels = [
+                    self.labels[station.id] + _query.distance_label(
+                        self.distances.get(station.id)
+                    )
+                    for station in self.results
+                ]
+            else:
+                labels = [self.labels[station.id] for station in self.results]
+        with self.recorder.phase("listbox"):
+            # a single insert of every label is far quicker than one apiece
+            self.box_results.insert(tk.END, *labels)
+        self.verify_selection()
+
+        self.show_timings(self.recorder.end())
+
+    def show_timings(self, record):
+        """Displays the breakdown of an instrumented action, if any, beneath
+        the results label.
+        """
+        if record is None:
+            return
+        self.timing_label["text"] = self.recorder.summary(record)
+        self.timing_label.pack(fill=tk.X, after=self.results_label)
+
+    def toggle_instrument(self):
+        """Enables or disables instrumentation from the Options menu."""
+        self.recorder.enabled = self.instrument.get()
+        if self.recorder.enabled is False:
+            self.timing_label.pack_forget()
+        self.save_defaults()
+
+    def save_timing_log(self):
+        """Prompts for a file to save the rolling timing log to as JSON."""
+        from tkinter import filedialog as tkfile
+        path = tkfile.asksaveasfilename(
+            parent = self.window,
+            title = "Save Timing Log",
+            defaultextension = ".json",
+            initialfile = "ghcnd-timings.json",
+            filetypes = [("JSON", "*.json")],
+        )
+        if path:
+            self.recorder.dump(path)
+
+    def export_results(self):
+        """Prompts for a file to write the listed results (every field, in
+        their listed order) to as CSV, JSON Lines, or GeoJSON.
+        """
+        if len(self.results) == 0:
+            self.modify_results_label(
+                "* No Results to Export! *",
+                {"foreground": "red"}
+            )
+            return
+        from tkinter import filedialog as tkfile
+        path = tkfile.asksaveasfilename(
+            parent = self.window,
+            title = "Export Results",
+            defaultextension = ".csv",
+            initialfile = "ghcnd-stations.csv",
+            filetypes = [
+                ("CSV", "*.csv"),
+                ("JSON Lines", "*.jsonl"),
+                ("GeoJSON", "*.geojson"),
+            ],
+        )
+        if not path:
+            return
+        self.recorder.begin("export")
+        try:
+            with self.recorder.phase("write"):
+                count = _export.export_stations(
+                    self.results,
+                    path,
+                    distances = self.distances
                 )
+        except OSError as e:
+            self.recorder.end()
+            tkmsg.showerror(
+                title = "Export Failed",
+                message = str(e),
+                parent = self.window
             )
-        self.verify_selection()
+            return
+        self.modify_results_label(
+            "* Exported {} station{} to   '{}' *".format(
+                count,
+                "s" if count != 1 else "",
+                os.path.basename(path)
+            ),
+            {"foreground": "green"}
+        )
+        self.show_timings(self.recorder.end())
 
     def verify_selection(self, event=None):
         """This method is called, when needed, to manage the enabling and
@@ -345,6 +736,67 @@ class GHCNDailyFinder(_build.Build):
         else:
             self.station_info_btn["state"] = tk.DISABLED
             self.download_btn["state"] = tk.DISABLED
+        self.refresh_map()
+
+    def show_map(self):
+        """Opens (or raises) a map of the listed stations (see _mapview)."""
+        if self.map_view is not None and self.map_view.winfo_exists():
+            self.map_view.lift()
+            return
+        import _mapview
+        self.map_view = _mapview.MapView(
+            self.window,
+            on_select = self.select_station,
+            on_open = self.open_station,
+            on_box = self.set_bbox
+        )
+        self.map_view.update_idletasks()
+        self.refresh_map()
+
+    def refresh_map(self):
+        """Keeps an open map in step with the results and their selection."""
+        if self.map_view is None or self.map_view.winfo_exists() == 0:
+            self.map_view = None
+            return
+        self.map_view.set_stations(self.results)
+        selection = self.box_results.curselection()
+        self.map_view.select(
+            self.results[selection[0]].id if len(selection) == 1 else None
+        )
+
+    def select_station(self, station):
+        """Selects a station (picked on the map) in the results list."""
+        try:
+            i = self.results.index(station.id)
+        except ValueError:
+            pass
+        else:
+            self.box_results.selection_clear(0, tk.END)
+            self.box_results.selection_set(i)
+            self.box_results.see(i)
+        self.verify_selection()
+
+    def open_station(self, station):
+        """Shows the information of a station double-clicked on the map."""
+        self.select_station(station)
+        if len(self.box_results.curselection()) == 1:
+            self.display_station_info()
+
+    def set_bbox(self, south, west, north, east):
+        """Fills the bounding-box entries from a box drawn on the map,
+        widened to whole degrees.
+        """
+        if self.coord_boundingbox_toggle.get() == 0:
+            self.coord_boundingbox.invoke()
+        for widget, value in [
+            (self.lat_entry1, min(math.ceil(north), 90)),
+            (self.lon_entry1, max(math.floor(west), -179)),
+            (self.lat_entry2, max(math.floor(south), -90)),
+            (self.lon_entry2, min(math.ceil(east), 179)),
+        ]:
+            widget.delete(0, tk.END)
+            widget.insert(tk.END, str(value))
+        self.query_ready(self.entry, self.entry.get())
 
     def search_ready(self, event=None):
         """Runs a search if the search button is available to be pressed. This
@@ -353,26 +805,10 @@ class GHCNDailyFinder(_build.Build):
         if self.entry_btn["state"] != tk.DISABLED:
             self.search()
 
-    def search(self):
-        """Run a query on the database, based on data in the entry fields above
-        the 'Submit Query' button.
+    def query_criteria(self):
+        """Gathers the contents of the entry fields above the 'Submit Query'
+        button into the keyword arguments expected by '_query.build_query'.
         """
-
-        # Disable submit query button temporarily to avoid flooding tk tasks
-        self.entry_btn["state"] = tk.DISABLED
-        self.entry_btn["command"] = None
-
-        # clear results box
-        self.box_results.delete(0, tk.END)
-        self.results = []
-        self.verify_selection()     # handles deactivating relevant buttons
-
-        # for convenience; updates visuals for the buttons seemingly as query
-        #   is being done.
-        self.window.update_idletasks()
-
-        # *************************************************************
-
         # Desciption entry contents
         desc = r'{}'.format(self.entry.get()) \
             if self.entry.get() != "" else None
@@ -408,131 +844,330 @@ class GHCNDailyFinder(_build.Build):
         lon2 = int(self.lon_entry2.get()) \
             if bbox is True and self.lon_entry2.get() not in ["", "-"] else None
 
-        # Bool checking all coordinate entries for any content within
-        anycoord = any(v is not None for v in [lat1, lat2, lon1, lon2])
-
         # Elevation entry
         elev = int(self.filter_elevation.get()) \
             if self.filter_elevation.get() != "" else None
 
-        # *************************************************************
-
-        def REGEXP(pattern, string):
-            """SQLite3 Regular Expression function. Returns a bool indicating
-            any matches for a Regular Expression.
-            """
-            return bool(
-                re.search(
-                    r'{}'.format(pattern),
-                    r'{}'.format(string),
-                    flags=re.I
+        # Data coverage; incomplete years are ignored
+        first, last = [
+            int(w.get()) if len(w.get()) == 4 else None
+            for w in self.coverage_entries
+        ]
+        coverage = [(self.coverage_element.get(), first, last)] \
+            if (first, last) != (None, None) else None
+
+        # Observations; incomplete years are ignored
+        first, last = [
+            int(w.get()) if len(w.get()) == 4 else None
+            for w in [self.obs_first, self.obs_last]
+        ]
+        observations = [(
+            self.obs_element.get(),
+            self.obs_statistic.get(),
+            self.obs_sign.get(),
+            float(self.obs_value.get()),
+            first,
+            last
+        )] if self.observations_ready() else None
+
+        return {
+            "desc": desc,
+            "country": country_abbr,
+            "lat1": lat1,
+            "lat1_sign": lat1_sign,
+            "lon1": lon1,
+            "lon1_sign": lon1_sign,
+            "lat2": lat2,
+            "lon2": lon2,
+            "bbox": bbox,
+            "elev": elev,
+            "elev_sign": self.elev_logic.get(),
+            "coverage": coverage,
+            "observations": observations,
+            "polygon": self.polygon,
+        }
+
+    def proximity_criteria(self):
+        """Gathers the proximity entries into the keyword arguments expected
+        by '_spatial.SpatialIndex.nearest', or None if they don't form a
+        query.
+        """
+        if self.proximity_ready() is False:
+            return None
+        # (counts and distances that aren't positive are left unlimited)
+        try:
+            count = int(self.near_count.get())
+        except ValueError:
+            count = 0
+        try:
+            radius = float(self.near_radius.get())
+        except ValueError:
+            radius = 0
+        return {
+            "lat": float(self.near_lat.get()),
+            "lon": float(self.near_lon.get()),
+            "count": count if count > 0 else None,
+            "radius": radius if radius > 0 else None,
+        }
+
+    def current_query(self):
+        """Returns the query built in the search frame as a saveable spec
+        (see _saved).
+        """
+        spec = self.query_criteria()
+        spec["polygon"] = self.polygon_path
+        proximity = self.proximity_criteria()
+        if proximity is not None:
+            spec.update({
+                "near": (proximity["lat"], proximity["lon"]),
+                "count": proximity["count"],
+                "radius": proximity["radius"],
+            })
+        return spec
+
+    def apply_query(self, spec):
+        """Fills the search frame from a saved query's spec. (The frame
+        holds one data-coverage and one observation filter; any others are
+        left out.)
+        """
+        self.query_clear()
+        text = lambda value: _saved.number(value) if value is not None else ""
+        self.entry.insert(tk.END, spec.get("desc") or "")
+        self.filter_state.insert(tk.END, spec.get("country") or "")
+        if self.coord_boundingbox_toggle.get() != int(spec.get("bbox", False)):
+            self.coord_boundingbox.invoke()
+        for var, key in [
+            (self.lat_logic, "lat1_sign"),
+            (self.lon_logic, "lon1_sign"),
+            (self.elev_logic, "elev_sign"),
+        ]:
+            if spec.get(key) is not None:
+                var.set(spec[key])
+        for widget, key in [
+            (self.lat_entry1, "lat1"),
+            (self.lon_entry1, "lon1"),
+            (self.lat_entry2, "lat2"),
+            (self.lon_entry2, "lon2"),
+            (self.filter_elevation, "elev"),
+            (self.near_count, "count"),
+            (self.near_radius, "radius"),
+        ]:
+            widget.insert(tk.END, text(spec.get(key)))
+        if spec.get("coverage"):
+            element, first, last = spec["coverage"][0]
+            self.coverage_element.set(element)
+            self.coverage_first.insert(tk.END, text(first))
+            self.coverage_last.insert(tk.END, text(last))
+        if spec.get("observations"):
+            element, statistic, sign, value, first, last = \
+                spec["observations"][0]
+            self.obs_element.set(element)
+            self.obs_statistic.set(statistic)
+            self.obs_sign.set(sign)
+            self.obs_value.insert(tk.END, text(value))
+            self.obs_first.insert(tk.END, text(first))
+            self.obs_last.insert(tk.END, text(last))
+            self.observations_units["text"] = _obsstore.units(
+                element,
+                statistic
+            )
+        if spec.get("near") is not None:
+            self.near_lat.insert(tk.END, text(spec["near"][0]))
+            self.near_lon.insert(tk.END, text(spec["near"][1]))
+        if spec.get("polygon") is not None:
+            self.set_polygon(spec["polygon"])
+        self.query_ready(self.entry, self.entry.get())
+
+    def refresh_saved_menus(self):
+        """Lists the saved queries in the Queries menu."""
+        names = _saved.saved_names(self.config)
+        for menu, command in [
+            (self.saved_open_menu, self.open_saved_query),
+            (self.saved_delete_menu, self.delete_saved_query),
+        ]:
+            menu.delete(0, tk.END)
+            for name in names:
+                menu.add_command(
+                    label = name,
+                    command = functools.partial(command, name)
                 )
+            if len(names) == 0:
+                menu.add_command(label = "(none)", state = tk.DISABLED)
+
+    def save_query_as(self):
+        """Prompts for a name to save the current query under."""
+        name = tksimp.askstring(
+            "Save Query As",
+            "Name for this query:",
+            parent = self.window
+        )
+        if name is None:
+            return
+        name = name.strip()
+        if name in _saved.saved_names(self.config) \
+        and tkmsg.askyesno(
+            title = "Replace Saved Query",
+            message = "Replace the saved query '{}'?".format(name),
+            parent = self.window
+        ) is False:
+            return
+        try:
+            _saved.save_query(self.config, name, self.current_query())
+        except ValueError as e:
+            tkmsg.showerror(
+                title = "Query Not Saved",
+                message = str(e),
+                parent = self.window
             )
+            return
+        self.save_defaults()
+        self.refresh_saved_menus()
+
+    def open_saved_query(self, name):
+        self.apply_query(_saved.load_query(self.config, name))
+
+    def delete_saved_query(self, name):
+        if tkmsg.askyesno(
+            title = "Delete Saved Query",
+            message = "Delete the saved query '{}'?".format(name),
+            parent = self.window
+        ) is True:
+            _saved.delete_query(self.config, name)
+            self.save_defaults()
+            self.refresh_saved_menus()
 
-        def IN_BBOX(test_lat, test_lon, _lat1, _lon1, _lat2, _lon2):
-            """SQLite3 function that tests whether or not a given coordinate is
-            contained within a bounding box formed by two other coordinates.
-            Returns a bool reflecting the answer.
-            """
-            if min([_lat1, _lat2]) <= test_lat <= max([_lat1, _lat2]) \
-            and min([_lon1, _lon2]) <= test_lon <= max([_lon1, _lon2]):
-                return True
-            else:
-                return False
-
-        # open the database
+    def run_saved_queries(self):
+        """Runs every saved query in a single pass over the database,
+        listing the stations matching any of them.
+        """
+        names = _saved.saved_names(self.config)
+        if len(names) == 0 or self.stations_loaded is False:
+            return
+        self.recorder.begin("batch")
         db = sqlite3.connect(self.stations_db.name)
+        try:
+            with self.recorder.phase("sql"):
+                batch = _saved.run_batch(
+                    db,
+                    collections.OrderedDict(
+                        (name, _saved.load_query(self.config, name))
+                        for name in names
+                    ),
+                    self.recorder.wrap,
+                    self.obs_store
+                )
+        except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+            tkmsg.showerror(
+                title = "Saved Queries Not Run",
+                message = str(e),
+                parent = self.window
+            )
+            self.recorder.end()
+            return
+        finally:
+            db.close()
 
-        # register custom functions
-        db.create_function("REGEXP", 2, REGEXP)
-        db.create_function("IN_BBOX", 6, IN_BBOX)
-
-        # formulation of the exec_statement. This is done outside of the actual
-        #   execute command to allow optional investigating of the command text
-        exec_statement = "SELECT * FROM GHCNDaily WHERE " \
-          + ("name REGEXP ? " if desc is not None else "") \
-          + ("AND " \
-                if desc is not None and country_abbr is not None \
-                else "") \
-          + ("(country = ? OR state = ?) " if country_abbr is not None else "") \
-          + ("AND " \
-                if (desc is not None or country_abbr is not None) \
-                and (
-                    (
-                        bbox is False and \
-                        (lat1 is not None or lon1 is not None)
-                    ) or \
-                    (
-                        bbox is True and \
-                        (lat1 is not None and lon1 is not None and \
-                        lat2 is not None and lon2 is not None)
-                    )
-                ) else "") \
-          + (
-                "IN_BBOX(latitude, longitude, ?, ?, ?, ?) " if bbox is True \
-                    and all([
-                        lat1 is not None,
-                        lat2 is not None,
-                        lon1 is not None,
-                        lon2 is not None
-                    ]) else \
-                "{}{}{}{}{}{}{}".format(
-                    "latitude " if lat1 is not None and lat1_sign is not None else "",
-                    "{} ".format(lat1_sign) \
-                        if lat1_sign is not None and lat1 is not None else "",
-                    "? " if lat1_sign is not None and lat1 is not None else "",
-                    "AND " \
-                        if lat1 is not None \
-                        and lon1 is not None \
-                        and lon1_sign is not None else "",
-                    "longitude " if lon1 is not None and lon1_sign is not None else "",
-                    "{} ".format(lon1_sign) \
-                        if lon1_sign is not None and lon1 is not None else "",
-                    "? " if lon1_sign is not None and lon1 is not None else "",
+        stnids, self.distances = _saved.merge_batch(batch)
+        self.results = _query.ResultSet.from_ids(self.station_table, stnids)
+        if len(self.results) > 0:
+            self.resort_results()
+        else:
+            self.box_results.delete(0, tk.END)
+            self.verify_selection()
+            self.modify_results_label(
+                "* No Results Found! *",
+                {"foreground": "red"}
+            )
+        self.show_timings(self.recorder.end())
+
+    def search(self):
+        """Run a query on the database, based on data in the entry fields above
+        the 'Submit Query' button.
+        """
+
+        # Disable submit query button temporarily to avoid flooding tk tasks
+        self.entry_btn["state"] = tk.DISABLED
+        self.entry_btn["command"] = None
+
+        # The station index is built in the background after the stations
+        #   load; a proximity query checks back until it's ready, rather
+        #   than blocking the event loop on it
+        if self.index_ready.is_set() is False \
+        and self.proximity_criteria() is not None:
+            if self.stations_error is not None:
+                self.modify_results_label(
+                    "* The station index could not be built! *",
+                    {"foreground": "red"}
+                )
+                self.entry_btn.after(100, self.reset_query_button)
+            else:
+                self.modify_results_label(
+                    "Indexing stations...",
+                    {"foreground": "blue"}
                 )
-            ) + ("AND " \
-                if elev is not None and (
-                    desc is not None or \
-                    country_abbr is not None or \
-                    anycoord is True
-                ) else "") \
-          + ("{}elevation {} {} {}{}".format(
-                "(" if self.elev_logic.get() == "<=" else "",
-                ">" if self.elev_logic.get() == "<=" else self.elev_logic.get(),
-                -999 if self.elev_logic.get() == "<=" else "?",
-                "AND elevation {} ?".format(self.elev_logic.get()) if self.elev_logic.get() == "<=" else "",
-                ")" if self.elev_logic.get() == "<=" else ""
-          ) if elev is not None else "")
+                self.window.after(100, self.search)
+            return
 
-        # *** DEBUG ***
-        # print("---", exec_statement, "---", sep="\n")
-
-        # Holds the arguments needed to pass to the execute function
-        args = []
-        coord_attrs = [lat1, lon1, lat2, lon2] if bbox is True and all([
-                lat1 is not None,
-                lat2 is not None,
-                lon1 is not None,
-                lon2 is not None
-            ]) else []
-        if bbox is False:
-            if lat1 is not None: coord_attrs.append(lat1)
-            if lon1 is not None: coord_attrs.append(lon1)
-        for attr in [desc, country_abbr, country_abbr] + coord_attrs + [elev]:
-            if attr is not None:
-                args.append(attr)
+        self.recorder.begin("search")
 
-        # *** DEBUG ***
-        # print(args)
+        # clear results box
+        self.box_results.delete(0, tk.END)
+        self.results = _query.ResultSet(self.station_table)
+        self.verify_selection()     # handles deactivating relevant buttons
 
-        # Record the results
-        self.results = [
-            self.stations[row[0]]
-            for row in db.execute(exec_statement, args).fetchall()
-        ]
+        # for convenience; updates visuals for the buttons seemingly as query
+        #   is being done.
+        self.window.update_idletasks()
 
-        # close the database
-        db.close()
+        criteria = self.query_criteria()
+        proximity = self.proximity_criteria()
+        self.distances = {}
+
+        # Record the results; a proximity query alone needs no SQL
+        if proximity is None or _query.has_filters(**criteria):
+            # open the database
+            db = sqlite3.connect(self.stations_db.name)
+            if criteria["observations"] is not None:
+                try:
+                    _obsstore.attach(db, self.obs_store)
+                except (OSError, sqlite3.Error) as e:
+                    db.close()
+                    tkmsg.showerror(
+                        title = "Observation Store Not Found",
+                        message = "{}\n\nChoose one under Options.".format(e),
+                        parent = self.window
+                    )
+                    self.recorder.end()
+                    self.entry_btn.after(100, self.reset_query_button)
+                    return
+
+            # only the ids are selected, and they're kept as positions in the
+            #   station table, read from the cursor a batch at a time
+            with self.recorder.phase("sql"):
+                self.results = _query.ResultSet.from_cursor(
+                    self.station_table,
+                    _query.execute_query(
+                        db,
+                        self.recorder.wrap,
+                        columns = "id",
+                        **criteria
+                    )
+                )
+
+            # close the database
+            db.close()
+            among = set(self.results.ids())
+        else:
+            among = None
+
+        if proximity is not None:
+            with self.recorder.phase("nearest"):
+                nearest = self.station_index.nearest(among=among, **proximity)
+            self.distances = {stnid: km for km, stnid in nearest}
+            self.results = _query.ResultSet.from_ids(
+                self.station_table,
+                (stnid for _, stnid in nearest)
+            )
 
         # Display the results
         if len(self.results) > 0:
@@ -543,6 +1178,8 @@ class GHCNDailyFinder(_build.Build):
                 {"foreground": "red"}
             )
 
+        self.show_timings(self.recorder.end())
+
         # re-enable query search button
         self.entry_btn.after(100, self.reset_query_button)
 
@@ -554,40 +1191,47 @@ class GHCNDailyFinder(_build.Build):
         # Temporarily disable the download button to avoid flooding tk tasks
         self.download_btn["state"] = tk.DISABLED
 
+        self.recorder.begin("download")
+
         # The station of interest to download
         stn = self.results[self.box_results.curselection()[0]]
 
-        # Formulate the download URL
-        url = "".join([
-            "https://www1.ncdc.noaa.gov/pub/data/ghcn/daily/by_station/",
-            stn.id,
-            ".csv.gz"
-        ])
-
-        # Formulate the name of the saved file; based on whether or not
-        #   overwriting is requested
-        if self.overwrite.get() is True:
-            save_name = stn.id + ".csv.gz"
-        else:
-            save_name = "".join([
-                stn.id,
-                "_{:%Y%m%d-%H%M%S}".format(datetime.datetime.now()),
-                ".csv.gz"
-            ])
+        # Formulate the download URL and the name of the saved file; based on
+        #   whether or not overwriting is requested
+        import _download
+        import _verify
+        url = _download.station_url(stn.id)
+        save_name = _download.save_name(stn.id, self.overwrite.get())
 
         # *** DEBUG ***
         # print(url)
         # print(save_name)
 
         # Initiate the download
+        import urllib.error
         try:
-            with urllib.request.urlopen(url, timeout=5) as u:
-                with open(save_name, "wb") as w:
-                    w.write(u.read())
-            self.modify_results_label(
-                "* Download of   '{}'   Successful! *".format(save_name),
-                {"foreground": "green"}
-            )
+            with self.recorder.phase("fetch"):
+                _download.fetch(url, save_name)
+            # an incomplete archive is fetched once more before giving up
+            with self.recorder.phase("verify"):
+                verification = _verify.verify_file(save_name)
+                if verification.ok is False:
+                    _download.fetch(url, save_name)
+                    verification = _verify.verify_file(save_name)
+            if verification.ok is True:
+                self.modify_results_label(
+                    "* Download of   '{}'   Successful! *".format(save_name),
+                    {"foreground": "green"}
+                )
+            else:
+                self.modify_results_label(
+                    "* Download of   '{}'   is CORRUPT! *".format(save_name),
+                    {"foreground": "red"}
+                )
+                print("* Download of '{}' is CORRUPT! ({})".format(
+                    save_name,
+                    verification.error
+                ))
         except urllib.error.URLError:
             self.modify_results_label(
                 "* Download of   '{}'   FAILED! *".format(save_name),
@@ -598,10 +1242,222 @@ class GHCNDailyFinder(_build.Build):
                 url
             ))
 
+        self.show_timings(self.recorder.end())
+
         # re-enable download button
         self.download_btn.after(50, self.verify_selection)
 
-ghcnd = GHCNDailyFinder()
+    def download_all(self):
+        """Downloads every listed station's GHCNDaily gzip file with the
+        asyncio engine (see _asyncdownload), which runs on its own thread;
+        progress is polled from the tk event loop. While downloading, the
+        button cancels those not yet started.
+        """
+        if self.batch is not None and self.batch.done is False:
+            self.batch.cancel()
+            self.download_all_btn["state"] = tk.DISABLED
+            return
+        if len(self.results) == 0:
+            self.modify_results_label(
+                "* No Results to Download! *",
+                {"foreground": "red"}
+            )
+            return
+        if self.downloader is None:
+            import _asyncdownload
+            self.downloader = _asyncdownload.AsyncDownloader()
+        self.downloader.adaptive = self.adaptive.get()
+        self.batch = self.downloader.submit(
+            [stn.id for stn in self.results],
+            self.overwrite.get(),
+            sizes = {stn.id: stn.size for stn in self.results},
+            order = self.download_order.get()
+        )
+        # the names saved, verified once the batch finishes
+        self.saved = []
+        self.download_all_btn["text"] = "Cancel Downloads"
+        self.window.after(100, self.poll_downloads)
+
+    def poll_downloads(self):
+        """Periodically reports the progress and throughput of 'Download All'
+        until every download has finished.
+        """
+        batch = self.batch
+        # (checked first, so that every result is collected below)
+        done = batch.done
+        for stnid, name, error in batch.poll():
+            if error is not None:
+                print("* Download of '{}' FAILED! ({})".format(stnid, error))
+            else:
+                self.saved.append(name)
+        if done is False:
+            import _asyncdownload
+            self.modify_results_label(
+                "* Downloading {} of {} ({} failed) - {:.1f} KB/s{}, "
+                "{} left *".format(
+                    batch.completed,
+                    batch.total,
+                    batch.failed,
+                    (batch.rate or batch.throughput()[1]) / 1024,
+                    "" if batch.concurrency is None \
+                        else " x{}".format(batch.concurrency),
+                    _asyncdownload.format_eta(batch.eta())
+                ),
+                {"foreground": "blue"}
+            )
+            self.window.after(100, self.poll_downloads)
+            return
+        self.download_all_btn["text"] = "Download All"
+        self.download_all_btn["state"] = tk.DISABLED
+        self.modify_results_label(
+            "* Verifying {} download{}... *".format(
+                len(self.saved),
+                "s" if len(self.saved) != 1 else ""
+            ),
+            {"foreground": "blue"}
+        )
+        self.verification = None
+        import _verify
+
+        def verify():
+            corrupt = [
+                v.path for v in _verify.verify_files(self.saved) if not v.ok
+            ]
+            still_corrupt = [
+                v.path for v in _verify.redownload(corrupt) if not v.ok
+            ]
+            self.verification = (len(corrupt), still_corrupt)
+
+        threading.Thread(target=verify, daemon=True).start()
+        self.window.after(100, self.poll_verification)
+
+    def poll_verification(self):
+        """Waits for the archives from 'Download All' to be verified (and any
+        corrupt ones downloaded again), then reports the outcome.
+        """
+        if self.verification is None:
+            self.window.after(100, self.poll_verification)
+            return
+        batch = self.batch
+        redownloaded, still_corrupt = self.verification
+        for name in still_corrupt:
+            print("* Download of '{}' is CORRUPT!".format(name))
+        failed = batch.failed + len(still_corrupt)
+        self.modify_results_label(
+            "* Downloaded {} of {} station{} ({} failed{}) - {:.1f} KB/s *".format(
+                batch.total - failed,
+                batch.total,
+                "s" if batch.total != 1 else "",
+                failed,
+                "; {} corrupt, {} fixed".format(
+                    redownloaded,
+                    redownloaded - len(still_corrupt)
+                ) if redownloaded > 0 else "",
+                batch.throughput()[1] / 1024
+            ),
+            {"foreground": "green" if failed == 0 else "red"}
+        )
+        self.download_all_btn["state"] = tk.NORMAL
+
+    def extract_all(self):
+        """Extracts every listed station's data from a local copy of the
+        bulk archive (see _archive), saved like downloaded files. The
+        archive is read on its own thread; progress is polled from the tk
+        event loop.
+        """
+        if self.extraction is not None and self.extraction["done"] is False:
+            return
+        if len(self.results) == 0:
+            self.modify_results_label(
+                "* No Results to Extract! *",
+                {"foreground": "red"}
+            )
+            return
+        from tkinter import filedialog as tkfile
+        path = tkfile.askopenfilename(
+            parent = self.window,
+            title = "Choose the Bulk Archive",
+            initialfile = "ghcnd_all.tar.gz",
+            filetypes = [
+                ("Archives", "*.tar.gz *.tgz *.tar"),
+                ("All Files", "*"),
+            ],
+        )
+        if not path:
+            return
+        import _archive
+        stnids = [stn.id for stn in self.results]
+        extraction = self.extraction = {
+            "path": path,
+            "total": len(stnids),
+            "fraction": 0.0,
+            "extracted": 0,
+            "failed": 0,
+            "error": None,
+            "done": False,
+        }
+
+        def progress(fraction, extracted):
+            extraction["fraction"] = fraction
+            extraction["extracted"] = extracted
+
+        def extract():
+            try:
+                for _, _, error in _archive.extract_from_archive(
+                    path,
+                    stnids,
+                    as_csv = True,
+                    progress = progress
+                ):
+                    if error is not None:
+                        extraction["failed"] += 1
+            except Exception as e:
+                extraction["error"] = e
+            extraction["done"] = True
+
+        threading.Thread(target=extract, daemon=True).start()
+        self.window.after(100, self.poll_extraction)
+
+    def poll_extraction(self):
+        """Reports the progress of 'Extract Results From Archive' until the
+        archive has been read.
+        """
+        extraction = self.extraction
+        if extraction["done"] is False:
+            self.modify_results_label(
+                "* Extracted {} of {} - {:.0%} of the archive read *".format(
+                    extraction["extracted"],
+                    extraction["total"],
+                    extraction["fraction"]
+                ),
+                {"foreground": "blue"}
+            )
+            self.window.after(100, self.poll_extraction)
+            return
+        if extraction["error"] is not None:
+            tkmsg.showerror(
+                title = "Extraction Failed",
+                message = "'{}' couldn't be read:\n\n{}".format(
+                    os.path.basename(extraction["path"]),
+                    extraction["error"]
+                ),
+                parent = self.window
+            )
+        self.modify_results_label(
+            "* Extracted {} of {} station{} ({} not in the archive) *".format(
+                extraction["extracted"],
+                extraction["total"],
+                "s" if extraction["total"] != 1 else "",
+                extraction["failed"]
+            ),
+            {"foreground": "green" if extraction["failed"] == 0 \
+                and extraction["error"] is None else "red"}
+        )
+
+# (a worker process started by 'spawn', as on Windows, imports this module
+#   as '__mp_main__'; it mustn't open a window)
+if __name__ == "__main__":
+    ghcnd = GHCNDailyFinder()
 
 
 
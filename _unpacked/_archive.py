@@ -0,0 +1,302 @@
+import os
+import sys
+import csv
+import gzip
+import json
+import tarfile
+import argparse
+import collections
+
+# Every station's data in one archive of '.dly' (fixed-width) files, named
+#   'ghcnd_all/XXXXXXXXXXX.dly'. A single transfer, far quicker than a
+#   request per station, but tens of GB once unpacked.
+ALL_URL = "https://www.ncei.noaa.gov/pub/data/ghcn/daily/ghcnd_all.tar.gz"
+
+# A member of an uncompressed tar: where its data starts and its length
+IndexEntry = collections.namedtuple(
+    "IndexEntry",
+    ["station", "name", "offset", "size"]
+)
+
+def member_station(name):
+    """Returns the station id an archive member is named after."""
+    return os.path.basename(name).split(".")[0]
+
+def index_path(archive):
+    """Names the member index of an archive: that of 'ghcnd_all.tar.gz' is
+    for the tar it decompresses to, so both share 'ghcnd_all.tar.idx'.
+    """
+    if archive.endswith(".gz"):
+        archive = archive[:-len(".gz")]
+    return archive + ".idx"
+
+def is_compressed(archive):
+    with open(archive, "rb") as r:
+        return r.read(2) == b"\x1f\x8b"
+
+def read_index(path):
+    """Reads a member index (see write_index) into {station id:
+    IndexEntry}.
+    """
+    with open(path, newline="") as r:
+        return {
+            row["station"]: IndexEntry(
+                row["station"],
+                row["name"],
+                int(row["offset"]),
+                int(row["size"])
+            )
+            for row in csv.DictReader(r)
+        }
+
+def write_index(entries, path):
+    with open(path, "w", newline="") as w:
+        writer = csv.writer(w, lineterminator="\n")
+        writer.writerow(IndexEntry._fields)
+        writer.writerows(entries)
+
+def dly_to_csv(data):
+    """Converts a '.dly' file's content into the layout of a 'by_station/'
+    file (station, date, element, value, flags; the '.dly' files have no
+    observation times), ordered by date. Days without a value are left
+    out, as they are from those files.
+    """
+    rows = []
+    for line in data.decode().splitlines():
+        if len(line) < 269:
+            continue
+        stnid, year, month, element = line[:11], line[11:15], line[15:17], \
+            line[17:21]
+        for day in range(31):
+            field = line[21 + 8 * day:29 + 8 * day]
+            value = field[:5].strip()
+            if value == "-9999":
+                continue
+            rows.append((
+                "{}{}{:02d}".format(year, month, day + 1),
+                ",".join([
+                    stnid,
+                    "{}{}{:02d}".format(year, month, day + 1),
+                    element,
+                    value,
+                    field[5].strip(),
+                    field[6].strip(),
+                    field[7].strip(),
+                    ""
+                ])
+            ))
+    # (stable, so each day's elements stay in the file's order)
+    rows.sort(key=lambda row: row[0])
+    return "".join(row + "\n" for _, row in rows).encode()
+
+def save_member(stnid, data, dest="", as_csv=False):
+    """Saves a member's content as 'XXXXXXXXXXX.dly', or converted to a
+    'by_station/' style 'XXXXXXXXXXX.csv.gz'. Returns the name saved.
+    """
+    if as_csv is True:
+        name = os.path.join(dest, stnid + ".csv.gz")
+        with open(name, "wb") as w:
+            w.write(gzip.compress(dly_to_csv(data), compresslevel=6))
+    else:
+        name = os.path.join(dest, stnid + ".dly")
+        with open(name, "wb") as w:
+            w.write(data)
+    return name
+
+def extract_stations(archive, stnids, dest="", as_csv=False, index=None,
+    entries=None, progress=None):
+    """Extracts the members of stations 'stnids' from a 'ghcnd_all' archive
+    (see save_member), yielding (station id, name saved, error) for each in
+    the order found; stations not in the archive come last, with a
+    LookupError.
+
+    With a member index ({station id: IndexEntry}, see read_index) for an
+    uncompressed tar, each member is read directly from its offset.
+    Otherwise the archive, compressed or not, is streamed through once
+    ('r|*'), stopping as soon as every station has been found. Stations an
+    index doesn't list (one older than the archive) are streamed for too.
+
+    entries: optional list; every member's IndexEntry is appended to it on
+        the way through (reading the whole archive)
+    progress: optional callback, given (fraction of the archive read,
+        stations extracted)
+    """
+    wanted = set(stnids)
+    extracted = 0
+    if index is not None and is_compressed(archive) is False:
+        with open(archive, "rb") as r:
+            for stnid in stnids:
+                entry = index.get(stnid)
+                if entry is None or stnid not in wanted:
+                    continue
+                wanted.discard(stnid)
+                # (the member's header is the block just before its data)
+                r.seek(entry.offset - tarfile.BLOCKSIZE)
+                header = r.read(tarfile.BLOCKSIZE)
+                if header[:100].rstrip(b"\0").decode(errors="replace") \
+                != entry.name:
+                    raise ValueError(
+                        "the index '{}' doesn't match '{}'; build it "
+                        "again".format(index_path(archive), archive)
+                    )
+                yield stnid, save_member(
+                    stnid,
+                    r.read(entry.size),
+                    dest,
+                    as_csv
+                ), None
+                extracted += 1
+                if progress is not None:
+                    progress(extracted / len(stnids), extracted)
+    if len(wanted) > 0 or entries is not None:
+        size = os.path.getsize(archive)
+        with open(archive, "rb") as fp, \
+            tarfile.open(fileobj=fp, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile() is False:
+                    continue
+                stnid = member_station(member.name)
+                if entries is not None:
+                    entries.append(IndexEntry(
+                        stnid,
+                        member.name,
+                        member.offset_data,
+                        member.size
+                    ))
+                if stnid in wanted:
+                    wanted.discard(stnid)
+                    yield stnid, save_member(
+                        stnid,
+                        tar.extractfile(member).read(),
+                        dest,
+                        as_csv
+                    ), None
+                    extracted += 1
+                if progress is not None:
+                    progress(fp.tell() / size, extracted)
+                if len(wanted) == 0 and entries is None:
+                    break
+    for stnid in stnids:
+        if stnid in wanted:
+            wanted.discard(stnid)
+            yield stnid, None, LookupError("not in the archive")
+
+def extract_from_archive(archive, stnids, dest="", as_csv=False,
+    entries=None, progress=None):
+    """Runs extract_stations with the archive's member index, if it has
+    one (see index_path). Given a list as 'entries', the index is built
+    into it instead, and written.
+    """
+    path = index_path(archive)
+    index = read_index(path) if entries is None \
+        and os.path.exists(path) else None
+    for result in extract_stations(
+        archive, stnids, dest, as_csv, index, entries, progress
+    ):
+        yield result
+    if entries is not None:
+        write_index(entries, path)
+
+def read_station_ids(path):
+    """Reads station ids, one per line, from a file ('-' for stdin); such
+    as the output of 'query' (CSV, whose header is skipped, or JSON lines).
+    """
+    fp = sys.stdin if path == "-" else open(path)
+    try:
+        stnids = []
+        for line in fp:
+            line = line.strip()
+            if line.startswith("{"):
+                stnids.append(json.loads(line)["id"])
+            elif line and line.split(",")[0] != "id":
+                stnids.append(line.split(",")[0])
+        return stnids
+    finally:
+        if fp is not sys.stdin:
+            fp.close()
+
+def extract_main(archive, stnids, dest="", as_csv=False, build_index=False):
+    """Extracts stations, reporting each on stderr. Returns the exit
+    status.
+    """
+    failed = 0
+    entries = [] if build_index is True else None
+    try:
+        for stnid, name, error in extract_from_archive(
+            archive, stnids, dest, as_csv, entries
+        ):
+            if error is None:
+                print("* Extracted '{}'".format(name), file=sys.stderr)
+            else:
+                failed += 1
+                print("* Extraction of '{}' FAILED! ({})".format(stnid, error),
+                    file=sys.stderr)
+    except (OSError, ValueError, tarfile.TarError) as e:
+        print("* '{}' couldn't be read! ({})".format(archive, e),
+            file=sys.stderr)
+        return 1
+    if build_index is True:
+        print("* Indexed {} members in '{}'".format(
+            len(entries),
+            index_path(archive)
+        ), file=sys.stderr)
+    print("* {} of {} stations extracted".format(
+        len(stnids) - failed,
+        len(stnids)
+    ), file=sys.stderr)
+    return 1 if failed > 0 else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="extract",
+        description="Extract the files of chosen stations from a local copy "
+            "of the bulk archive ({}), reading it once and stopping once "
+            "they're found.".format(ALL_URL)
+    )
+    parser.add_argument(
+        "archive",
+        metavar="ARCHIVE",
+        help="'ghcnd_all.tar.gz', or the tar it decompresses to"
+    )
+    parser.add_argument(
+        "stnids",
+        nargs="*",
+        metavar="STNID",
+        help="stations to extract"
+    )
+    parser.add_argument(
+        "--stations",
+        metavar="FILE",
+        help="also extract the stations listed in FILE ('-' for stdin), one "
+            "per line; 'query' output works"
+    )
+    parser.add_argument(
+        "--dest",
+        default="",
+        help="directory to extract to (default: current directory)"
+    )
+    parser.add_argument(
+        "--as-csv",
+        action="store_true",
+        help="save each station as a 'by_station/' style '.csv.gz' (for "
+            "'ingest') rather than the archive's '.dly'"
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="read the whole archive, writing a member index beside it so "
+            "later extractions from the uncompressed tar seek directly"
+    )
+    args = parser.parse_args(argv)
+
+    stnids = list(args.stnids)
+    if args.stations is not None:
+        stnids.extend(read_station_ids(args.stations))
+    if len(stnids) == 0 and args.index is False:
+        parser.error("no stations to extract")
+    return extract_main(
+        args.archive, stnids, args.dest, args.as_csv, args.index
+    )
+
+if __name__ == "__main__":
+    main()
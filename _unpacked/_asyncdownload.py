@@ -0,0 +1,557 @@
+import os
+import ssl
+import time
+import queue
+import asyncio
+import threading
+import collections
+import urllib.parse
+from _download import BASE_URL, station_url, save_name, schedule
+
+# responses followed to their 'Location', as urllib does, up to MAX_REDIRECTS
+#   in a row
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+class DownloadError(Exception):
+    """A response other than '200 OK' (whose code is 'status'), or one that
+    couldn't be understood. For a redirect, 'location' is where to.
+    """
+    def __init__(self, message, status=None, location=None):
+        super().__init__(message)
+        self.status = status
+        self.location = location
+
+def throttled(error):
+    """Returns a bool indicating if a failure suggests the server is
+    overloaded: '429 Too Many Requests', '503 Service Unavailable', or the
+    connection being reset (including mid-response). Other failures, such
+    as a missing file or one that can't be saved locally, don't.
+    """
+    if isinstance(error, DownloadError):
+        return error.status in (429, 503)
+    return isinstance(
+        error,
+        (ConnectionResetError, asyncio.IncompleteReadError)
+    )
+
+class _Connection:
+    """A persistent HTTP/1.1 connection, over which requests are made one
+    after another.
+    """
+    def __init__(self, reader, writer, host):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+        self.reusable = True
+        # seconds from sending the last request to its response starting
+        self.latency = None
+
+    @classmethod
+    async def open(cls, scheme, host, port, timeout, context=None):
+        """Connects to 'host', over TLS (with the ssl.SSLContext 'context',
+        shared by the connections of a batch) for "https".
+        """
+        context = context if scheme == "https" else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host,
+                port,
+                ssl=context,
+                server_hostname=host if context is not None else None
+            ),
+            timeout
+        )
+        return cls(reader, writer, host)
+
+    def close(self):
+        self.writer.close()
+
+    async def download(self, path, name, chunksize=65536):
+        """Requests 'path', streaming the body to the file 'name'. Returns
+        the quantity of bytes saved. Raises DownloadError for responses
+        other than '200 OK' (nothing is saved); for a redirect, its
+        'location' is set.
+        """
+        self.writer.write(
+            "GET {} HTTP/1.1\r\n"
+            "Host: {}\r\n"
+            "User-Agent: ghcn-daily-downloader-tk\r\n"
+            "Accept-Encoding: identity\r\n"
+            "Connection: keep-alive\r\n"
+            "\r\n".format(path, self.host).encode("latin-1")
+        )
+        await self.writer.drain()
+        sent = time.perf_counter()
+
+        status_line = await self.reader.readline()
+        self.latency = time.perf_counter() - sent
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or parts[0].startswith("HTTP/") is False:
+            self.reusable = False
+            raise DownloadError("malformed response {!r}".format(status_line))
+        version, status = parts[0], int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if version == "HTTP/1.0" \
+        or headers.get("connection", "").lower() == "close":
+            self.reusable = False
+
+        # the body is always read, to keep the connection usable (unless
+        #   saving it fails, which leaves it unread)
+        w = None
+        size = 0
+        try:
+            if status == 200:
+                w = open(name, "wb")
+            if "chunked" in headers.get("transfer-encoding", "").lower():
+                while True:
+                    length = int(
+                        (await self.reader.readline()).split(b";")[0],
+                        16
+                    )
+                    if length == 0:
+                        # trailers
+                        while (await self.reader.readline()) not in (
+                            b"\r\n", b"\n", b""
+                        ):
+                            pass
+                        break
+                    data = await self.reader.readexactly(length)
+                    await self.reader.readexactly(2)
+                    size += len(data)
+                    if w is not None:
+                        w.write(data)
+            elif "content-length" in headers:
+                remaining = int(headers["content-length"])
+                while remaining > 0:
+                    data = await self.reader.read(min(chunksize, remaining))
+                    if data == b"":
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    remaining -= len(data)
+                    size += len(data)
+                    if w is not None:
+                        w.write(data)
+            else:
+                self.reusable = False
+                while True:
+                    data = await self.reader.read(chunksize)
+                    if data == b"":
+                        break
+                    size += len(data)
+                    if w is not None:
+                        w.write(data)
+        except BaseException:
+            self.reusable = False
+            if w is not None:
+                w.close()
+                os.remove(name)
+            raise
+        if w is None:
+            raise DownloadError(
+                "HTTP {}".format(status),
+                status,
+                headers.get("location") if status in REDIRECTS else None
+            )
+        w.close()
+        return size
+
+class AIMD:
+    """An additive-increase/multiplicative-decrease limit on concurrent
+    transfers, as TCP uses for its congestion window. Until the first
+    slowdown the limit grows by one per transfer (doubling every round);
+    after, by one per 'limit' transfers. It's cut by 'decrease' when the
+    smoothed rate of failures suggesting throttling (see 'throttled')
+    exceeds 'tolerance', or when the smoothed time-to-first-byte exceeds
+    'slow' times the best seen; at most once per smoothed latency, so a
+    burst from one round counts once.
+    """
+    def __init__(self, maximum, initial=4, minimum=1, decrease=0.5, slow=3.0,
+        tolerance=0.2):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.slow = slow
+        self.tolerance = tolerance
+        self.limit = float(max(min(initial, maximum), minimum))
+        self.latency = None
+        self.baseline = None
+        self.errors = 0.0
+        self.decreased = 0.0
+        self.decreases = 0
+
+    def update(self, latency=None, error=None):
+        """Adjusts the limit after a transfer completes (or fails)."""
+        now = time.perf_counter()
+        if latency is not None:
+            self.latency = latency if self.latency is None \
+                else 0.8 * self.latency + 0.2 * latency
+            self.baseline = self.latency if self.baseline is None \
+                else min(self.baseline, self.latency)
+        failed = error is not None and throttled(error)
+        self.errors += 0.1 * ((1.0 if failed else 0.0) - self.errors)
+        congested = (failed and self.errors > self.tolerance) or (
+            self.latency is not None
+            and self.latency > self.slow * max(self.baseline, 0.001)
+        )
+        if congested:
+            if now - self.decreased >= (self.latency or 0):
+                self.limit = max(self.limit * self.decrease, self.minimum)
+                self.decreased = now
+                self.decreases += 1
+        elif error is None:
+            self.limit = min(
+                self.limit + (1 if self.decreases == 0 else 1 / self.limit),
+                self.maximum
+            )
+
+    @property
+    def allowed(self):
+        return int(self.limit)
+
+class Batch:
+    """The progress of a set of downloads made by an AsyncDownloader. Its
+    attributes and methods may be read from any thread.
+
+    total: quantity of stations requested
+    completed, failed: quantities finished so far
+    bytes: quantity of bytes saved so far
+    sizes: optional dictionary of station id to expected size (KB), which
+        'eta' weighs the remaining stations by
+    controller: the AIMD limiting its concurrency (None if fixed)
+    """
+    # weight of each new throughput sample, and seconds between samples
+    SMOOTHING = 0.3
+    INTERVAL = 0.5
+
+    def __init__(self, total, sizes=None, controller=None):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.sizes = sizes
+        self.controller = controller
+        self.started = time.perf_counter()
+        self.finished = None
+        self.future = None
+        self.cancelled = False
+        self._results = queue.Queue()
+        # smoothed rates of bytes, and of station weight, per second
+        self.rate = None
+        self.pace = None
+        self.remaining = None
+        self._sampled = (self.started, 0, 0.0)
+        self._done = 0.0
+
+    def weight(self, stnid):
+        """The share of the work a station is expected to be."""
+        if self.sizes is None:
+            return 1.0
+        return float(self.sizes.get(stnid) or 1)
+
+    def report(self, stnid, name, error, size=0):
+        self.completed += 1
+        if error is not None:
+            self.failed += 1
+        self.bytes += size
+        self._done += self.weight(stnid)
+        now = time.perf_counter()
+        then, then_bytes, then_done = self._sampled
+        if now - then >= self.INTERVAL:
+            rate = (self.bytes - then_bytes) / (now - then)
+            pace = (self._done - then_done) / (now - then)
+            if self.rate is None:
+                self.rate, self.pace = rate, pace
+            else:
+                self.rate += self.SMOOTHING * (rate - self.rate)
+                self.pace += self.SMOOTHING * (pace - self.pace)
+            self._sampled = (now, self.bytes, self._done)
+        self._results.put((stnid, name, error))
+
+    def poll(self):
+        """Returns every (station id, saved name or None, error or None)
+        reported since the last poll, without waiting.
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def results(self):
+        """Yields each (station id, saved name or None, error or None) as
+        it's reported, until the batch finishes.
+        """
+        for _ in range(self.total):
+            yield self._results.get()
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def throughput(self):
+        """Returns the average rate so far as (files/s, bytes/s)."""
+        elapsed = max(self.elapsed(), 1e-9)
+        return self.completed / elapsed, self.bytes / elapsed
+
+    def eta(self):
+        """Returns the predicted seconds remaining, from the smoothed rate
+        of completion; None until it's been measured.
+        """
+        if self.done:
+            return 0.0
+        if not self.pace or self.remaining is None:
+            return None
+        return max(self.remaining - self._done, 0) / self.pace
+
+    @property
+    def concurrency(self):
+        return None if self.controller is None else self.controller.allowed
+
+    def cancel(self):
+        """Stops starting new downloads; those in progress finish."""
+        self.cancelled = True
+
+def format_eta(seconds):
+    """Formats seconds as 'H:MM:SS' (or 'M:SS'); '?' if unknown."""
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+    return "{}:{:02d}".format(minutes, seconds)
+
+def throughput_summary(batch):
+    """Describes a Batch's results and throughput in a line."""
+    files, rate = batch.throughput()
+    return "{} of {} files ({} failed), {:.1f} KB in {:.2f}s: {:.1f} " \
+        "files/s, {:.1f} KB/s{}".format(
+            batch.completed - batch.failed,
+            batch.total,
+            batch.failed,
+            batch.bytes / 1024,
+            batch.elapsed(),
+            files,
+            rate / 1024,
+            "" if batch.controller is None else
+                ", {} concurrent at the end ({} slowdowns)".format(
+                    batch.controller.allowed,
+                    batch.controller.decreases
+                )
+        )
+
+class AsyncDownloader:
+    """Downloads station files with asyncio, multiplexing up to
+    'concurrency' transfers (each over its own persistent HTTP/1.1
+    connection) on a single background thread running the event loop. Tk
+    (or anything else) submits batches and polls them for progress; the
+    thread is started on the first submission.
+
+    With 'adaptive', each batch starts with a few transfers and an AIMD
+    controller finds how many the server sustains (up to 'concurrency'),
+    backing off when responses slow down or it starts refusing requests.
+    """
+    def __init__(self, concurrency=64, timeout=30, adaptive=True):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.adaptive = adaptive
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(
+                target=self.loop.run_forever,
+                daemon=True
+            )
+            self.thread.start()
+
+    def close(self):
+        """Stops the event loop's thread (abandoning any transfers)."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+            if self.thread.is_alive() is False:
+                self.loop.close()
+            self.loop = None
+
+    def submit(self, stnids, overwrite=True, dest="", base_url=BASE_URL,
+        sizes=None, order="listed"):
+        """Starts downloading stations' files, returning their Batch.
+
+        sizes: optional dictionary of station id to file size (KB), used to
+            order the downloads (see _download.schedule) and predict the
+            time remaining
+        """
+        self.start()
+        stnids = schedule(stnids, sizes, order)
+        batch = Batch(
+            len(stnids),
+            sizes,
+            AIMD(self.concurrency) if self.adaptive else None
+        )
+        batch.remaining = sum(batch.weight(stnid) for stnid in stnids)
+        batch.future = asyncio.run_coroutine_threadsafe(
+            self._run(batch, stnids, overwrite, dest, base_url),
+            self.loop
+        )
+        return batch
+
+    async def _run(self, batch, stnids, overwrite, dest, base_url):
+        pending = collections.deque(stnids)
+        try:
+            # workers beyond the controller's limit wait their turn
+            slots = _Slots(batch.controller)
+            # (loading the CA certificates is slow; once per batch will do)
+            context = ssl.create_default_context()
+            workers = [
+                self._worker(
+                    batch, pending, slots, overwrite, dest, base_url, context
+                )
+                for _ in range(min(self.concurrency, len(stnids)))
+            ]
+            if len(workers) > 0:
+                await asyncio.gather(*workers)
+        finally:
+            # anything left (after a cancellation) is reported as such
+            while len(pending) > 0:
+                batch.report(pending.popleft(), None, DownloadError("cancelled"))
+            batch.finished = time.perf_counter()
+
+    async def _fetch(self, connections, url, name, context):
+        """Downloads 'url' to the file 'name', following redirects, over the
+        worker's persistent connections ({(scheme, host, port):
+        _Connection}). Returns (bytes saved, latency of the last response).
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            origin = (
+                parts.scheme,
+                parts.hostname,
+                parts.port or (443 if parts.scheme == "https" else 80)
+            )
+            connection = connections.get(origin)
+            if connection is None:
+                connection = connections[origin] = await _Connection.open(
+                    *origin,
+                    timeout=self.timeout,
+                    context=context
+                )
+            try:
+                size = await asyncio.wait_for(
+                    connection.download(
+                        parts.path + ("?" + parts.query if parts.query else ""),
+                        name
+                    ),
+                    self.timeout
+                )
+            except DownloadError as e:
+                if connection.reusable is False:
+                    connections.pop(origin).close()
+                if e.location is None:
+                    raise
+                url = urllib.parse.urljoin(url, e.location)
+                continue
+            except BaseException:
+                connections.pop(origin).close()
+                raise
+            latency = connection.latency
+            if connection.reusable is False:
+                connections.pop(origin).close()
+            return size, latency
+        raise DownloadError("too many redirects (more than {})".format(
+            MAX_REDIRECTS
+        ))
+
+    async def _worker(self, batch, pending, slots, overwrite, dest, base_url,
+        context):
+        connections = {}
+        try:
+            while True:
+                await slots.acquire(lambda: len(pending) == 0 or batch.cancelled)
+                if len(pending) == 0 or batch.cancelled is True:
+                    await slots.release()
+                    break
+                stnid = pending.popleft()
+                name = save_name(stnid, overwrite, dest)
+                try:
+                    size, latency = await self._fetch(
+                        connections,
+                        station_url(stnid, base_url),
+                        name,
+                        context
+                    )
+                except (OSError, ValueError, DownloadError,
+                    asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    await slots.release(error=e)
+                    batch.report(stnid, None, e)
+                    continue
+                await slots.release(latency=latency)
+                batch.report(stnid, name, None, size)
+        finally:
+            for connection in connections.values():
+                connection.close()
+
+class _Slots:
+    """Admits workers to transfer while fewer than the controller's limit
+    are in flight (any number, without a controller).
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.active = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, finished):
+        async with self.condition:
+            if self.controller is not None:
+                await self.condition.wait_for(
+                    lambda: finished()
+                    or self.active < self.controller.allowed
+                )
+            self.active += 1
+
+    async def release(self, latency=None, error=None):
+        async with self.condition:
+            self.active -= 1
+            if self.controller is not None:
+                if latency is not None or error is not None:
+                    self.controller.update(latency, error)
+                self.condition.notify_all()
+
+def download_stations(stnids, overwrite=True, dest="", base_url=BASE_URL,
+    timeout=30, concurrency=64, sizes=None, order="listed", adaptive=True,
+    started=None):
+    """The asyncio counterpart of _download.download_stations: yields (station
+    id, saved name or None, error or None) as each completes.
+
+    started: optional callback, given the Batch once the downloads begin
+        (for its progress and throughput)
+    """
+    downloader = AsyncDownloader(concurrency, timeout, adaptive)
+    try:
+        batch = downloader.submit(
+            stnids,
+            overwrite,
+            dest,
+            base_url,
+            sizes,
+            order
+        )
+        if started is not None:
+            started(batch)
+        for result in batch.results():
+            yield result
+        batch.future.result()
+    finally:
+        downloader.close()
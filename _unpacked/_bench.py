@@ -0,0 +1,453 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import _database
+import _download
+import _asyncdownload
+import _query
+import _standin
+import _synth
+import _polygon
+import _spatial
+import _verify
+
+# name : _query.build_query criteria. A fixed catalog so results can be
+#   compared across commits.
+QUERIES = [
+    ("name regex", {"desc": "airport|\\bAP\\b|\\bINTL\\b"}),
+    ("name literal", {"desc": "ASHEVILLE"}),
+    ("country", {"country": "CA"}),
+    ("state", {"country": "NC"}),
+    ("lat half-plane", {"lat1": 60, "lat1_sign": ">="}),
+    ("lon half-plane", {"lon1": -100, "lon1_sign": "<="}),
+    ("lat+lon half-planes", {
+        "lat1": 30, "lat1_sign": ">=", "lon1": -80, "lon1_sign": "<="
+    }),
+    ("bbox", {"bbox": True, "lat1": 30, "lon1": -85, "lat2": 40, "lon2": -75}),
+    ("elevation <=", {"elev": 100, "elev_sign": "<="}),
+    ("elevation >=", {"elev": 2000, "elev_sign": ">="}),
+    ("state+name", {"country": "NC", "desc": "\\bAP\\b"}),
+    ("coverage span", {"coverage": [("TMAX", 1950, 2020)]}),
+    ("coverage since", {"coverage": [("PRCP", None, 2020)]}),
+    ("polygon", {"polygon": _polygon.Polygon([[
+        (36.6, -84.3), (36.6, -75.5), (35.2, -75.5), (33.8, -78.5),
+        (34.9, -80.8), (35.0, -84.3),
+    ]])}),
+    ("state+bbox+elevation", {
+        "country": "NC", "bbox": True,
+        "lat1": 34, "lon1": -84, "lat2": 36, "lon2": -76,
+        "elev": 300, "elev_sign": ">=",
+    }),
+]
+
+SORT_KEYS = [
+    "id", "name", "state", "latitude", "longitude", "elevation", "size",
+    "distance"
+]
+
+# where "distance" sorts are measured from, as a proximity query would be
+SORT_ORIGIN = (35.6, -82.5)
+
+def sql_engine(dbpath, stations, table, criteria):
+    """'_query.execute_query' with every row fetched at once and mapped back
+    to the loaded Station records, as the app once did.
+    """
+    db = sqlite3.connect(dbpath)
+    try:
+        return [
+            stations[row[0]]
+            for row in _query.execute_query(db, **criteria).fetchall()
+        ]
+    finally:
+        db.close()
+
+def ids_engine(dbpath, stations, table, criteria):
+    """The engine used by the app: only the ids selected, streamed from the
+    cursor into a '_query.ResultSet' of 'table' (the '_query.StationTable'
+    built once from the loaded stations, as the app does).
+    """
+    db = sqlite3.connect(dbpath)
+    try:
+        return _query.ResultSet.from_cursor(
+            table,
+            _query.execute_query(db, columns="id", **criteria)
+        )
+    finally:
+        db.close()
+
+# engine name : callable(dbpath, stations, table, criteria) returning the
+#   matching stations
+ENGINES = {
+    "sql": sql_engine,
+    "ids": ids_engine,
+}
+
+def measure(func, repeat=5):
+    """Calls 'func' 'repeat' times, returning (timings, last result)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def record(results, group, name, timings, **extra):
+    timings = sorted(timings)
+    entry = {
+        "group": group,
+        "name": name,
+        "repeat": len(timings),
+        "best": timings[0],
+        "median": timings[len(timings) // 2],
+    }
+    entry.update(extra)
+    results.append(entry)
+    print("{:<10} {:<32} best {:>10.6f}s  median {:>10.6f}s{}".format(
+        group,
+        name,
+        entry["best"],
+        entry["median"],
+        "".join("  {}={}".format(k, v) for k, v in sorted(extra.items()))
+    ), file=sys.stderr)
+    return entry
+
+def bench_queries(results, dbpath, stations, repeat, engines=None):
+    table = _query.StationTable(stations)
+    for engine in (engines or sorted(ENGINES)):
+        for name, criteria in QUERIES:
+            timings, found = measure(
+                lambda: ENGINES[engine](dbpath, stations, table, criteria),
+                repeat
+            )
+            # (a separate run, as tracing slows the timed ones)
+            tracemalloc.start()
+            ENGINES[engine](dbpath, stations, table, criteria)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            record(
+                results, "query", name, timings,
+                engine=engine, matches=len(found), peak_kb=peak // 1024
+            )
+
+def bench_sorts(results, stations, repeat):
+    # every station as the app's results, sorted as resort_results does
+    table = _query.StationTable(stations)
+    everything = _query.ResultSet(table, range(len(table)))
+    distances = {
+        station.id: _spatial.great_circle(
+            SORT_ORIGIN[0], SORT_ORIGIN[1], station.latitude, station.longitude
+        )
+        for station in table.stations
+    }
+    for key in SORT_KEYS:
+        for reverse in [False, True]:
+            def resort():
+                # (a copy apiece, so no run starts from a sorted order)
+                found = everything.copy()
+                found.sort(
+                    key=_query.sort_key(key, distances),
+                    reverse=reverse
+                )
+                return found
+            timings, _ = measure(resort, repeat)
+            record(
+                results, "sort", "{}{}".format(key, " desc" if reverse else ""),
+                timings, count=len(everything)
+            )
+
+def bench_render(results, stations, repeat):
+    everything = list(stations.values())
+    timings, _ = measure(
+        lambda: [_query.station_label(s) for s in everything],
+        repeat
+    )
+    record(results, "render", "format labels", timings, count=len(everything))
+
+    # the app formats each station's label once, then looks it up
+    labels = _query.StationText(stations)
+    timings, _ = measure(
+        lambda: [labels[s.id] for s in everything],
+        repeat
+    )
+    record(
+        results, "render", "memoized labels", timings, count=len(everything)
+    )
+    infos = _query.StationText(stations, _query.station_info)
+    timings, _ = measure(
+        lambda: [infos[s.id] for s in everything],
+        repeat
+    )
+    record(results, "render", "memoized info", timings, count=len(everything))
+
+    # the map's clustering: a world view, then a regional one
+    import _mapview
+    def cluster():
+        index = _mapview.ClusterIndex(
+            (s.latitude, s.longitude) for s in everything
+        )
+        index.clusters(-90, -180, 90, 180, 2)
+        return index.clusters(30, -90, 40, -75, 40)
+    timings, _ = measure(cluster, repeat)
+    record(results, "render", "map clusters", timings, count=len(everything))
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print("* Skipping listbox timing ({})".format(e), file=sys.stderr)
+        return
+    try:
+        box = tk.Listbox(root)
+        # as resort_results does: memoized labels, inserted all at once
+        def populate():
+            box.delete(0, tk.END)
+            box.insert(tk.END, *[labels[s.id] for s in everything])
+            root.update_idletasks()
+        timings, _ = measure(populate, repeat)
+        record(
+            results, "render", "listbox populate", timings,
+            count=len(everything)
+        )
+    finally:
+        root.destroy()
+
+def bench_downloads(results, stations, repeat, count, workers, concurrency):
+    stnids = sorted(stations)[:count]
+    sizes = {stnid: stations[stnid].size or 4 for stnid in stnids}
+    dest = tempfile.mkdtemp()
+    try:
+        with _standin.StandInServer(sizes) as server:
+            server.prepare(stnids)
+            timings, outcome = measure(
+                lambda: list(_download.download_stations(
+                    stnids,
+                    dest=dest,
+                    base_url=server.base_url,
+                    workers=workers
+                )),
+                repeat
+            )
+            record(
+                results, "download", "threaded x{}".format(workers), timings,
+                files=len(stnids),
+                failed=sum(1 for _, _, error in outcome if error is not None)
+            )
+            for name, adaptive, order in [
+                ("async x{}".format(concurrency), False, "listed"),
+                ("async adaptive, largest first", True, "largest"),
+            ]:
+                timings, outcome = measure(
+                    lambda: list(_asyncdownload.download_stations(
+                        stnids,
+                        dest=dest,
+                        base_url=server.base_url,
+                        concurrency=concurrency,
+                        sizes=sizes,
+                        order=order,
+                        adaptive=adaptive
+                    )),
+                    repeat
+                )
+                record(
+                    results, "download", name, timings,
+                    files=len(stnids),
+                    failed=sum(
+                        1 for _, _, error in outcome if error is not None
+                    )
+                )
+    finally:
+        shutil.rmtree(dest, ignore_errors=True)
+
+def bench_verify(results, stations, repeat, count, workers):
+    stnids = sorted(stations)[:count]
+    dest = tempfile.mkdtemp()
+    try:
+        paths = []
+        for stnid in stnids:
+            paths.append(os.path.join(dest, stnid + ".csv.gz"))
+            with open(paths[-1], "wb") as w:
+                w.write(_standin.station_payload(
+                    stnid,
+                    min(stations[stnid].size or 4, 256)
+                ))
+        timings, _ = measure(
+            lambda: [_verify.verify_file(path) for path in paths],
+            repeat
+        )
+        record(results, "verify", "serial", timings, files=len(paths))
+        timings, _ = measure(
+            lambda: list(_verify.verify_files(paths, workers)),
+            repeat
+        )
+        record(
+            results, "verify", "threaded x{}".format(workers), timings,
+            files=len(paths)
+        )
+    finally:
+        shutil.rmtree(dest, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)) or None,
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, previous_path):
+    """Prints the ratio of each median to that of a previous run."""
+    with open(previous_path) as r:
+        previous = {
+            (e["group"], e["name"], e.get("engine")): e
+            for e in json.load(r)["results"]
+        }
+    print("\nCompared with '{}' (median, new/old):".format(previous_path),
+        file=sys.stderr)
+    for entry in results:
+        old = previous.get((entry["group"], entry["name"], entry.get("engine")))
+        if old is not None and old["median"] > 0:
+            print("{:<10} {:<32} {:>6.2f}x".format(
+                entry["group"],
+                entry["name"],
+                entry["median"] / old["median"]
+            ), file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="bench",
+        description="Time the query, sort, render, download and verify paths, "
+            "writing the results as JSON for comparison across commits."
+    )
+    parser.add_argument(
+        "--database",
+        default="GHCNDaily.db.gz",
+        help="station database (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        metavar="N",
+        help="benchmark a generated database of N stations instead"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="with --synthetic, the generator's seed (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=["query", "sort", "render", "download", "verify"],
+        help="run only these groups"
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=sorted(ENGINES),
+        help="query engines to time (default: all)"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="runs per measurement (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--downloads",
+        type=int,
+        default=200,
+        help="files fetched from the local stand-in server, and verified "
+            "(default: %(default)s)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="threads used for threaded downloads (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=64,
+        help="most transfers multiplexed by async downloads (default: "
+            "%(default)s)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="write JSON results here (default: stdout)"
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="PREVIOUS",
+        help="JSON results of a previous run to compare against"
+    )
+    args = parser.parse_args(argv)
+    groups = args.only or ["query", "sort", "render", "download", "verify"]
+
+    if args.synthetic is not None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        tmp.close()
+        _database.write_database(
+            _synth.synthetic_rows(args.synthetic, args.seed),
+            tmp.name
+        )
+        source = "synthetic:{}:{}".format(args.synthetic, args.seed)
+    else:
+        tmp = _database.extract_database(args.database)
+        source = args.database
+    try:
+        stations = _database.load_stations(tmp.name)
+        results = []
+        if "query" in groups:
+            bench_queries(results, tmp.name, stations, args.repeat, args.engines)
+        if "sort" in groups:
+            bench_sorts(results, stations, args.repeat)
+        if "render" in groups:
+            bench_render(results, stations, args.repeat)
+        if "download" in groups:
+            bench_downloads(
+                results, stations, args.repeat, args.downloads, args.workers,
+                args.concurrency
+            )
+        if "verify" in groups:
+            bench_verify(
+                results, stations, args.repeat, args.downloads, args.workers
+            )
+    finally:
+        os.remove(tmp.name)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": source,
+            "stations": len(stations),
+        },
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as w:
+            json.dump(report, w, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -2,43 +2,20 @@ import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import simpledialog as tksimp
 import re
-import os
-import gzip
-import json
 import functools
-import collections
-import sqlite3
-import tempfile
-import webbrowser
-import _countries
+import _database
+import _query
+import _obsstore
 
 class Build:
 
-    def build_stations(self):
-        """Formulate the stations dictionary from the GHCNDaily database."""
-        Station = collections.namedtuple(
-            "Station",
-            [
-                "id", "latitude", "longitude", "elevation", "state", "name",
-                "gsn", "hcn_crn", "wmo_id", "country", "size",
-                "prcp_start", "prcp_end",
-                "snow_start", "snow_end",
-                "snwd_start", "snwd_end",
-                "tmax_start", "tmax_end",
-                "tmin_start", "tmin_end",
-                "is_available"
-            ]
-        )
-
+    def build_stations(self, progress=None):
+        """Formulate the stations dictionary from the GHCNDaily database.
+        'progress', if given, is called with the fraction of stations loaded
+        so far (ending with 1).
+        """
         try:
-            with gzip.open("GHCNDaily.db.gz") as r:
-                self.stations_db = tempfile.NamedTemporaryFile(delete=False)
-                self.stations_db.write(gzip.decompress(r.read()))
-                _stndb = sqlite3.connect(self.stations_db.name)
-                self.stations = {
-                    row[0] : Station(*row) for row in _stndb.execute("SELECT * FROM GHCNDaily")
-                }
-                _stndb.close()
+            self.stations_db = _database.extract_database("GHCNDaily.db.gz")
         except FileNotFoundError:
             print(
                 "* The file 'GHCNDaily.db.gz' was not found. This file "
@@ -50,6 +27,12 @@ class Build:
             )
             raise
 
+        self.stations = _database.load_stations(
+            self.stations_db.name,
+            progress
+        )
+        self.station_table = _query.StationTable(self.stations)
+
     def build_menu(self):
         """Compile menu commands for convience."""
         self.toolbar = tk.Menu(self.window)
@@ -58,6 +41,23 @@ class Build:
         # File
         file = tk.Menu(self.toolbar, tearoff=0)
         self.toolbar.add_cascade(label="File", menu=file)
+        file.add_command(
+            label="Export Results...",
+            command=self.export_results
+        )
+        file.add_command(
+            label="Download All Results",
+            command=self.download_all
+        )
+        file.add_command(
+            label="Extract Results From Archive...",
+            command=self.extract_all
+        )
+        file.add_command(
+            label="Map of Results",
+            command=self.show_map
+        )
+        file.add_separator()
         file.add_command(
             label="Close",
             command=self.window.destroy
@@ -133,6 +133,15 @@ class Build:
                 True
             )
         )
+        sort_method_menu.add_radiobutton(
+            label = "Distance (Proximity Queries)",
+            variable = self.sort_method,
+            value = "distance",
+            command = functools.partial(
+                self.resort_results,
+                True
+            )
+        )
 
         # Results sorting direction
         optmenu.add_separator()
@@ -165,6 +174,83 @@ class Build:
             command = self.save_defaults
         )
 
+        # Download All
+        download_order_menu = tk.Menu(optmenu, tearoff=0)
+        optmenu.add_cascade(
+            label="Download All Order",
+            menu=download_order_menu
+        )
+        download_order_menu.add_radiobutton(
+            label = "As Listed",
+            variable = self.download_order,
+            value = "listed",
+            command = self.save_defaults
+        )
+        download_order_menu.add_radiobutton(
+            label = "Smallest Files First (Quickest Feedback)",
+            variable = self.download_order,
+            value = "smallest",
+            command = self.save_defaults
+        )
+        download_order_menu.add_radiobutton(
+            label = "Largest Files First (Finishes Soonest)",
+            variable = self.download_order,
+            value = "largest",
+            command = self.save_defaults
+        )
+        optmenu.add_checkbutton(
+            label = "Adapt Download Concurrency to Server",
+            offvalue = False,
+            onvalue = True,
+            variable = self.adaptive,
+            command = self.save_defaults
+        )
+
+        # Observation store
+        optmenu.add_separator()
+        optmenu.add_command(
+            label = "Observation Store...",
+            command = self.choose_obs_store
+        )
+
+        # Instrumentation
+        optmenu.add_separator()
+        optmenu.add_checkbutton(
+            label = "Record Timings",
+            offvalue = False,
+            onvalue = True,
+            variable = self.instrument,
+            command = self.toggle_instrument
+        )
+        optmenu.add_command(
+            label = "Save Timing Log...",
+            command = self.save_timing_log
+        )
+
+        # Saved queries
+        querymenu = tk.Menu(self.toolbar, tearoff=0)
+        self.toolbar.add_cascade(label="Queries", menu=querymenu)
+        querymenu.add_command(
+            label = "Save Query As...",
+            command = self.save_query_as
+        )
+        self.saved_open_menu = tk.Menu(querymenu, tearoff=0)
+        querymenu.add_cascade(
+            label = "Open Saved Query",
+            menu = self.saved_open_menu
+        )
+        self.saved_delete_menu = tk.Menu(querymenu, tearoff=0)
+        querymenu.add_cascade(
+            label = "Delete Saved Query",
+            menu = self.saved_delete_menu
+        )
+        querymenu.add_separator()
+        querymenu.add_command(
+            label = "Run All Saved Queries",
+            command = self.run_saved_queries
+        )
+        self.refresh_saved_menus()
+
         # Help
         helpmenu = tk.Menu(self.toolbar, tearoff=0)
         helpmenu.add_command(
@@ -500,6 +586,229 @@ class Build:
         )
         self.filter_elevation.pack(side=tk.LEFT)
 
+        # DATA COVERAGE; an element's period-of-record spanning given years
+        self.coverage_frame = tk.Frame(
+            self.search_frame
+        )
+        self.coverage_frame.pack(fill=tk.X)
+        lbl = tk.Label(
+            self.coverage_frame,
+            text = "Data: ",
+        )
+        lbl.pack(side=tk.LEFT)
+
+        self.coverage_element = tk.StringVar(value = _database.ELEMENTS[0])
+        self.coverage_element_select = tk.OptionMenu(
+            self.coverage_frame,
+            self.coverage_element,
+            *_database.ELEMENTS
+        )
+        self.coverage_element_select.pack(side=tk.LEFT)
+
+        def year_validation(year, _widget):
+            """Returns a bool indicating if an entered year is valid."""
+            if re.search(r"^\d{0,4}$", year) is None:
+                return False
+            self.query_ready(self.window.nametowidget(_widget), year)
+            return True
+
+        year_ok = self.window.register(year_validation)
+        for text, attr in [
+            ("from ", "coverage_first"),
+            ("through ", "coverage_last"),
+        ]:
+            lbl = tk.Label(self.coverage_frame, text = text)
+            lbl.pack(side=tk.LEFT)
+            setattr(self, attr, tk.Entry(
+                self.coverage_frame,
+                font = (None, 12, "bold"),
+                justify = tk.CENTER,
+                validate = "key",
+                validatecommand = (year_ok, "%P", "%W"),
+                width = 5,
+            ))
+            getattr(self, attr).pack(side=tk.LEFT)
+        self.coverage_entries = [self.coverage_first, self.coverage_last]
+
+        # OBSERVATIONS; a statistic of an element's values over some years,
+        #   answered from the observation store
+        self.observations_frame = tk.LabelFrame(
+            self.search_frame,
+            text = "Observations",
+        )
+        self.observations_frame.pack(fill=tk.X, padx=5)
+
+        def observations_changed(_value=None):
+            self.observations_units["text"] = _obsstore.units(
+                self.obs_element.get(),
+                self.obs_statistic.get()
+            )
+            self.query_ready(self.entry, self.entry.get())
+
+        obs_frame = tk.Frame(self.observations_frame)
+        obs_frame.pack()
+        self.obs_element = tk.StringVar(value = "TMAX")
+        self.obs_statistic = tk.StringVar(value = "max")
+        self.obs_sign = tk.StringVar(value = ">=")
+        for var, values in [
+            (self.obs_element, _database.ELEMENTS),
+            (self.obs_statistic, _obsstore.STATISTICS),
+            (self.obs_sign, [">=", "<="]),
+        ]:
+            select = tk.OptionMenu(
+                obs_frame,
+                var,
+                *values,
+                command = observations_changed
+            )
+            select.pack(side=tk.LEFT)
+
+        def value_validation(value, _widget):
+            """Returns a bool indicating if an entered value is a (partial)
+            number.
+            """
+            if re.search(r"^-?\d*\.?\d*$", value) is None:
+                return False
+            self.query_ready(self.window.nametowidget(_widget), value)
+            return True
+
+        value_ok = self.window.register(value_validation)
+        self.obs_value = tk.Entry(
+            obs_frame,
+            font = (None, 12, "bold"),
+            justify = tk.CENTER,
+            validate = "key",
+            validatecommand = (value_ok, "%P", "%W"),
+            width = 6,
+        )
+        self.obs_value.pack(side=tk.LEFT)
+        self.observations_units = tk.Label(obs_frame, text = "")
+        self.observations_units.pack(side=tk.LEFT)
+
+        obs_years_frame = tk.Frame(self.observations_frame)
+        obs_years_frame.pack()
+        for text, attr in [
+            ("from ", "obs_first"),
+            ("through ", "obs_last"),
+        ]:
+            lbl = tk.Label(obs_years_frame, text = text)
+            lbl.pack(side=tk.LEFT)
+            setattr(self, attr, tk.Entry(
+                obs_years_frame,
+                font = (None, 12, "bold"),
+                justify = tk.CENTER,
+                validate = "key",
+                validatecommand = (year_ok, "%P", "%W"),
+                width = 5,
+            ))
+            getattr(self, attr).pack(side=tk.LEFT)
+        self.observation_entries = [
+            self.obs_value,
+            self.obs_first,
+            self.obs_last,
+        ]
+        self.observations_units["text"] = _obsstore.units(
+            self.obs_element.get(),
+            self.obs_statistic.get()
+        )
+
+        # REGION; a polygon read from a GeoJSON, WKT, or vertex-list file
+        self.region_frame = tk.Frame(
+            self.search_frame
+        )
+        self.region_frame.pack(fill=tk.X)
+        lbl = tk.Label(
+            self.region_frame,
+            text = "Region: ",
+        )
+        lbl.pack(side=tk.LEFT)
+        region_btn = tk.Button(
+            self.region_frame,
+            text = "Polygon...",
+            command = self.choose_polygon
+        )
+        region_btn.pack(side=tk.LEFT)
+        self.region_label = tk.Label(
+            self.region_frame,
+            text = "(none)",
+            foreground = "gray",
+            anchor = tk.W,
+        )
+        self.region_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        region_clr_btn = tk.Button(
+            self.region_frame,
+            text = "X",
+            command = self.clear_polygon
+        )
+        region_clr_btn.pack(side=tk.RIGHT)
+
+        # PROXIMITY; stations nearest to / within a distance of a coordinate
+        self.proximity_frame = tk.LabelFrame(
+            self.search_frame,
+            text = "Proximity",
+        )
+        self.proximity_frame.pack(fill=tk.X, padx=5)
+
+        def proximity_validation(value, _widget, limit):
+            """Ensures an entered proximity value is a (partial) number
+            within its limit; coordinates may be fractional and negative,
+            counts and distances only positive.
+            """
+            widget = self.window.nametowidget(_widget)
+            pattern = r"^-?\d*\.?\d*$" if widget in [
+                self.near_lat, self.near_lon
+            ] else r"^\d*$" if widget == self.near_count else r"^\d*\.?\d*$"
+            if re.search(pattern, value) is None:
+                return False
+            try:
+                if abs(float(value)) > float(limit):
+                    return False
+            except ValueError:
+                pass
+            self.query_ready(widget, value)
+            return True
+
+        proximity_ok = self.window.register(proximity_validation)
+
+        near_frame = tk.Frame(self.proximity_frame)
+        near_frame.pack()
+        for text, attr, limit in [
+            ("Lat: ", "near_lat", 90),
+            ("Lon: ", "near_lon", 180),
+        ]:
+            lbl = tk.Label(near_frame, text = text)
+            lbl.pack(side=tk.LEFT)
+            setattr(self, attr, tk.Entry(
+                near_frame,
+                validate = "key",
+                font = (None, 12, "bold"),
+                justify = tk.CENTER,
+                validatecommand = (proximity_ok, "%P", "%W", limit),
+                width = 8,
+            ))
+            getattr(self, attr).pack(side=tk.LEFT)
+
+        limit_frame = tk.Frame(self.proximity_frame)
+        limit_frame.pack()
+        for text, attr, limit in [
+            ("Nearest: ", "near_count", 100000),
+            ("Within (km): ", "near_radius", 20038),
+        ]:
+            lbl = tk.Label(limit_frame, text = text)
+            lbl.pack(side=tk.LEFT)
+            setattr(self, attr, tk.Entry(
+                limit_frame,
+                validate = "key",
+                font = (None, 12, "bold"),
+                justify = tk.CENTER,
+                validatecommand = (proximity_ok, "%P", "%W", limit),
+                width = 6,
+            ))
+            getattr(self, attr).pack(side=tk.LEFT)
+        self.proximity_entries = [
+            self.near_lat, self.near_lon, self.near_count, self.near_radius
+        ]
+
         btnfrm = tk.Frame(
             self.search_frame,
         )
@@ -533,6 +842,24 @@ class Build:
         )
         self.results_label.pack(fill=tk.X)
 
+        # breakdown of the latest action; shown while recording timings
+        self.timing_label = tk.Label(
+            self.search_frame,
+            font = (None, 8, "normal"),
+            foreground = "gray",
+            anchor = tk.W,
+            justify = tk.LEFT,
+            wraplength = 360,
+        )
+
+        # shown while the station database loads
+        self.loading_bar = ttk.Progressbar(
+            self.search_frame,
+            orient = tk.HORIZONTAL,
+            mode = "determinate",
+            maximum = 100,
+        )
+
         #Results
         self.box_results = tk.Listbox(
             self.window,
@@ -574,6 +901,20 @@ class Build:
         )
         self.download_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        self.download_all_btn = tk.Button(
+            self.download_frame,
+            text = "Download All",
+            command = self.download_all
+        )
+        self.download_all_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.map_btn = tk.Button(
+            self.download_frame,
+            text = "Map",
+            command = self.show_map
+        )
+        self.map_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
     def display_station_info(self):
         stn = self.results[
             self.box_results.curselection()[0]
@@ -581,7 +922,8 @@ class Build:
         StationInfo(
             self.window,
             "{} - {}".format(stn.id, stn.name),
-            stn
+            stn,
+            self.infos[stn.id]
         )
 
 class CountryCodes(tksimp.Dialog):
@@ -604,6 +946,7 @@ class CountryCodes(tksimp.Dialog):
         self.bind("<Escape>", self.cancel)
 
     def body(self, master):
+        import _countries
         self.winfo_toplevel().resizable(False, False)
         # master.pack_propagate(0)
         # master["width"] = 350
@@ -675,9 +1018,11 @@ class CountryCodes(tksimp.Dialog):
         info["yscrollcommand"] = info_scroll.set
 
 class StationInfo(tksimp.Dialog):
-    def __init__(self, parent, title=None, stnobj=None):
+    def __init__(self, parent, title=None, stnobj=None, text=None):
         self.station_id = stnobj.id
         self.station_obj = stnobj
+        # (formatted on demand when not given)
+        self.text = text if text is not None else _query.station_info(stnobj)
         super().__init__(parent, title)
 
     def buttonbox(self):
@@ -701,68 +1046,7 @@ class StationInfo(tksimp.Dialog):
             width = 40,
             background = "SystemButtonFace",
         )
-        for line in [
-            "ID: {}".format(self.station_obj.id),
-            "Name: {}".format(self.station_obj.name),
-            "Country: {} ({})".format(
-                self.station_obj.country,
-                _countries.dictionary[
-                    self.station_obj.country
-                ]
-            ),
-            "{}{}".format(
-                "State: {} ({})\n".format(
-                    self.station_obj.state,
-                    _countries.states[self.station_obj.state]
-                ),
-                "Latitude: {}".format(self.station_obj.latitude)
-            ),
-            "Longitude: {}".format(self.station_obj.longitude),
-            "Elevation: {}".format(
-                "{}m ({}ft)".format(
-                    self.station_obj.elevation,
-                    round(self.station_obj.elevation * 3.28, 1)
-                ) if self.station_obj.elevation > -999 else "N/A"
-            ),
-            # ["ACW00011604", 17.1167, -61.7833, 10.1, null, "ST JOHNS COOLIDGE FLD", false, false, null, "AC", 3.9, 1949, 1949, 1949, 1949, 1949, 1949, 1949, 1949, 1949, 1949, true]
-            # "gsn", "hcn_crn", "wmo_id"
-            "\n".join([
-                "",
-                "GCOS Surface Network?: {}".format(
-                    "Y" if self.station_obj.gsn is True else "N"
-                ),
-                "HCN/CRN Network?: {}".format(
-                    "Y" if self.station_obj.hcn_crn is True else "N"
-                ),
-                "WMO Id: {}".format(self.station_obj.wmo_id),
-                ""
-            ]),
-            "Size (in KB): {}".format(self.station_obj.size),
-            "",
-            "Data-Ranges",
-            "-----------",
-            "PRCP: {}-{}".format(
-                self.station_obj.prcp_start,
-                self.station_obj.prcp_end,
-            ),
-            "SNOW: {}-{}".format(
-                self.station_obj.snow_start,
-                self.station_obj.snow_end,
-            ),
-            "SNWD: {}-{}".format(
-                self.station_obj.snwd_start,
-                self.station_obj.snwd_end,
-            ),
-            "TMAX: {}-{}".format(
-                self.station_obj.tmax_start,
-                self.station_obj.tmax_end,
-            ),
-            "TMIN: {}-{}".format(
-                self.station_obj.tmin_start,
-                self.station_obj.tmin_end,
-            ),
-        ]:
-            info.insert(tk.END, line + "\n")
+        info.insert(tk.END, self.text)
         info["state"] = tk.DISABLED
         info.pack()
 
@@ -811,6 +1095,7 @@ class About(tksimp.Dialog):
         super().__init__(parent, title)
 
     def open_addr(self, address, event=None):
+        import webbrowser
         webbrowser.open_new_tab(address)
 
     def buttonbox(self):
@@ -0,0 +1,696 @@
+import os
+import sys
+import sqlite3
+import collections
+import argparse
+import importlib
+import configparser
+import _database
+import _query
+import _download
+import _spatial
+import _polygon
+import _saved
+import _export
+import _obsstore
+
+def positive(kind):
+    """Returns an argparse type converting to 'kind' and rejecting values
+    that aren't above 0.
+    """
+    def convert(value):
+        try:
+            number = kind(value)
+        except ValueError:
+            number = None
+        if number is None or number <= 0:
+            raise argparse.ArgumentTypeError(
+                "'{}' isn't a positive {}".format(
+                    value,
+                    "integer" if kind is int else "number"
+                )
+            )
+        return number
+    return convert
+
+def query_parser():
+    parser = argparse.ArgumentParser(
+        prog="query",
+        description="Run a query on the GHCNDaily database without the GUI, "
+            "streaming matching stations to stdout (or a file). Every filter "
+            "is optional and may be combined."
+    )
+    parser.add_argument(
+        "--database",
+        default="GHCNDaily.db.gz",
+        help="station database (default: %(default)s)"
+    )
+
+    filters = parser.add_argument_group("filters")
+    filters.add_argument(
+        "--name",
+        help="regular expression matched against the station name/description"
+    )
+    filters.add_argument(
+        "--state",
+        type=str.upper,
+        help="country or state abbreviation"
+    )
+    filters.add_argument("--lat", type=float, help="latitude half-plane")
+    filters.add_argument(
+        "--lat-logic",
+        choices=[">=", "<="],
+        default=">=",
+        help="comparison applied with --lat (default: %(default)s)"
+    )
+    filters.add_argument("--lon", type=float, help="longitude half-plane")
+    filters.add_argument(
+        "--lon-logic",
+        choices=[">=", "<="],
+        default="<=",
+        help="comparison applied with --lon (default: %(default)s)"
+    )
+    filters.add_argument(
+        "--bbox",
+        nargs=4,
+        type=float,
+        metavar=("LAT1", "LON1", "LAT2", "LON2"),
+        help="bounding box formed by two coordinates; overrides --lat/--lon"
+    )
+    filters.add_argument("--elev", type=float, help="elevation (m)")
+    filters.add_argument(
+        "--elev-logic",
+        choices=[">=", "<="],
+        default="<=",
+        help="comparison applied with --elev (default: %(default)s)"
+    )
+    filters.add_argument(
+        "--coverage",
+        nargs=3,
+        action="append",
+        metavar=("ELEMENT", "FIRST", "LAST"),
+        help="stations whose ELEMENT ({}) data spans the years FIRST through "
+            "LAST; use '-' for either year to leave it open. May be repeated."
+            .format(", ".join(_database.ELEMENTS))
+    )
+    filters.add_argument(
+        "--obs",
+        nargs=6,
+        action="append",
+        metavar=("ELEMENT", "STATISTIC", "SIGN", "VALUE", "FIRST", "LAST"),
+        help="stations whose ELEMENT observations from the years FIRST "
+            "through LAST ('-' leaves either open) have a STATISTIC ({}) "
+            "of SIGN (>= or <=) VALUE; temperatures in degrees C, "
+            "precipitation in mm, completeness as a percentage of days. "
+            "Answered from the observation store (see 'ingest'). May be "
+            "repeated.".format(", ".join(_obsstore.STATISTICS))
+    )
+    filters.add_argument(
+        "--store",
+        default="ghcnd-obs.db",
+        help="observation store used by --obs (default: %(default)s)"
+    )
+    region = filters.add_mutually_exclusive_group()
+    region.add_argument(
+        "--polygon",
+        metavar="FILE",
+        help="region file (GeoJSON, WKT, or 'lat, lon' vertices) that "
+            "stations must be within"
+    )
+    region.add_argument(
+        "--vertices",
+        nargs="+",
+        metavar="LAT,LON",
+        help="vertices of a polygon that stations must be within"
+    )
+
+    proximity = parser.add_argument_group(
+        "proximity",
+        "stations nearest to (or within a distance of) a coordinate, by "
+            "great-circle distance; combines with the filters above"
+    )
+    proximity.add_argument(
+        "--near",
+        nargs=2,
+        type=float,
+        metavar=("LAT", "LON"),
+        help="coordinate to measure distances from"
+    )
+    proximity.add_argument(
+        "--count",
+        type=positive(int),
+        help="with --near, the quantity of nearest stations"
+    )
+    proximity.add_argument(
+        "--radius",
+        type=positive(float),
+        metavar="KM",
+        help="with --near, the greatest distance (km)"
+    )
+
+    output = parser.add_argument_group("output")
+    output.add_argument(
+        "--format",
+        choices=sorted(_export.FORMATS),
+        default="csv",
+        help="output format (default: %(default)s)"
+    )
+    output.add_argument(
+        "-o", "--output",
+        help="write results to this file rather than stdout"
+    )
+    output.add_argument(
+        "--sort",
+        choices=[
+            "id", "name", "state", "latitude", "longitude", "elevation",
+            "size", "distance"
+        ],
+        help="sort results (otherwise they're streamed in database order, "
+            "or nearest-first with --near)"
+    )
+    output.add_argument(
+        "--descending",
+        action="store_true",
+        help="with --sort, sort high-to-low"
+    )
+
+    saving = parser.add_argument_group("saved queries")
+    saving.add_argument(
+        "--save",
+        metavar="NAME",
+        help="also save this query's filters under NAME (see 'batch')"
+    )
+    saving.add_argument(
+        "--config",
+        default="ghcnd.ini",
+        help="settings file queries are saved to (default: %(default)s)"
+    )
+
+    download = parser.add_argument_group("downloading")
+    download.add_argument(
+        "--download",
+        action="store_true",
+        help="download each matching station's data"
+    )
+    download.add_argument(
+        "--dest",
+        default="",
+        help="directory to save downloads to (default: current directory)"
+    )
+    download.add_argument(
+        "--no-overwrite",
+        action="store_true",
+        help="append the download time to saved files"
+    )
+    download.add_argument(
+        "--base-url",
+        default=_download.BASE_URL,
+        help="location of the 'by_station/' files (default: %(default)s)"
+    )
+    download.add_argument(
+        "--engine",
+        choices=["threaded", "async"],
+        default="threaded",
+        help="download on a pool of threads, or multiplexed with asyncio on "
+            "one thread (better for very large batches) (default: "
+            "%(default)s)"
+    )
+    download.add_argument(
+        "--workers",
+        type=int,
+        help="concurrent downloads; the most, for async (default: 4 "
+            "threaded, 64 async)"
+    )
+    download.add_argument(
+        "--order",
+        choices=sorted(_download.ORDERS),
+        default="listed",
+        help="order to download in, by file size: smallest first for quick "
+            "feedback, largest first to finish soonest (default: "
+            "%(default)s)"
+    )
+    download.add_argument(
+        "--verify",
+        action="store_true",
+        help="check each download's gzip CRC and length afterwards, "
+            "downloading corrupt ones again"
+    )
+    download.add_argument(
+        "--fixed",
+        action="store_true",
+        help="with --engine async, keep --workers transfers going rather "
+            "than adapting to the server's latency and errors"
+    )
+    download.add_argument(
+        "--extract",
+        metavar="ARCHIVE",
+        help="rather than downloading, extract each matching station from a "
+            "local copy of the bulk archive ('ghcnd_all.tar.gz', or the tar "
+            "it decompresses to) into --dest"
+    )
+    download.add_argument(
+        "--as-csv",
+        action="store_true",
+        help="with --extract, save 'by_station/' style '.csv.gz' files "
+            "rather than the archive's '.dly'"
+    )
+    return parser
+
+def coverage_from_args(coverage):
+    """Translates --coverage arguments into (element, first, last) tuples."""
+    if coverage is None:
+        return None
+    try:
+        return [
+            (element.upper(), None if first == "-" else int(first),
+                None if last == "-" else int(last))
+            for element, first, last in coverage
+        ]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "--coverage years must be integers or '-'"
+        )
+
+def observations_from_args(observations):
+    """Translates --obs arguments into (element, statistic, sign, value,
+    first, last) tuples.
+    """
+    if observations is None:
+        return None
+    parsed = []
+    for element, statistic, sign, value, first, last in observations:
+        if statistic.lower() not in _obsstore.STATISTICS:
+            raise argparse.ArgumentTypeError(
+                "--obs STATISTIC must be one of {}".format(
+                    ", ".join(_obsstore.STATISTICS)
+                )
+            )
+        if sign not in [">=", "<="]:
+            raise argparse.ArgumentTypeError("--obs SIGN must be >= or <=")
+        try:
+            parsed.append((
+                element.upper(),
+                statistic.lower(),
+                sign,
+                float(value),
+                None if first == "-" else int(first),
+                None if last == "-" else int(last)
+            ))
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                "--obs VALUE must be a number, and its years integers or '-'"
+            )
+        if statistic.lower() == "completeness" and None in parsed[-1][4:]:
+            raise argparse.ArgumentTypeError(
+                "--obs completeness needs both a FIRST and LAST year"
+            )
+    return parsed
+
+def criteria_from_args(args):
+    """Translates parsed 'query' arguments into '_query.build_query'
+    keyword arguments.
+    """
+    bbox = args.bbox is not None
+    lat1, lon1, lat2, lon2 = args.bbox if bbox is True \
+        else (args.lat, args.lon, None, None)
+    return {
+        "desc": args.name,
+        "country": args.state,
+        "lat1": lat1,
+        "lat1_sign": args.lat_logic,
+        "lon1": lon1,
+        "lon1_sign": args.lon_logic,
+        "lat2": lat2,
+        "lon2": lon2,
+        "bbox": bbox,
+        "elev": args.elev,
+        "elev_sign": args.elev_logic,
+        "coverage": args.coverage,
+        "polygon": args.region,
+        "observations": args.obs,
+    }
+
+def query_main(argv=None):
+    parser = query_parser()
+    args = parser.parse_args(argv)
+    if args.near is None and (args.count, args.radius) != (None, None):
+        parser.error("--count and --radius require --near")
+    if args.near is not None and (args.count, args.radius) == (None, None):
+        parser.error("--near requires --count and/or --radius")
+    if args.download is True and args.extract is not None:
+        parser.error("--download and --extract can't be used together")
+    try:
+        args.coverage = coverage_from_args(args.coverage)
+        args.obs = observations_from_args(args.obs)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    try:
+        args.region = _polygon.load_polygon(args.polygon) \
+            if args.polygon is not None \
+            else _polygon.parse_vertices(" ".join(args.vertices)) \
+            if args.vertices is not None else None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        parser.error("the region couldn't be read: {}".format(e))
+    for element, _, _ in (args.coverage or []):
+        if element not in _database.ELEMENTS:
+            parser.error("--coverage ELEMENT must be one of {}".format(
+                ", ".join(_database.ELEMENTS)
+            ))
+    if args.save is not None:
+        if args.vertices is not None:
+            parser.error("--save needs the region as a --polygon file")
+        spec = criteria_from_args(args)
+        spec.update({
+            "polygon": os.path.abspath(args.polygon) \
+                if args.polygon is not None else None,
+            "near": args.near,
+            "count": args.count,
+            "radius": args.radius,
+        })
+        config = read_config(args.config)
+        try:
+            _saved.save_query(config, args.save, spec)
+        except ValueError as e:
+            parser.error(str(e))
+        with open(args.config, "w") as w:
+            config.write(w)
+        print("* Saved query '{}' to '{}'".format(args.save, args.config),
+            file=sys.stderr)
+
+    tmp = _database.extract_database(args.database)
+    try:
+        db = sqlite3.connect(tmp.name)
+        if args.obs is not None:
+            try:
+                _obsstore.attach(db, args.store)
+            except (OSError, sqlite3.Error) as e:
+                parser.error(str(e))
+        stations = (
+            _database.Station(*row)
+            for row in _query.execute_query(db, **criteria_from_args(args))
+        )
+        distances = None
+        if args.near is not None:
+            # only the filtered stations are indexed
+            stations = {station.id: station for station in stations}
+            nearest = _spatial.SpatialIndex.from_stations(
+                stations.values()
+            ).nearest(*args.near, count=args.count, radius=args.radius)
+            distances = {stnid: km for km, stnid in nearest}
+            stations = [stations[stnid] for _, stnid in nearest]
+        if args.sort is not None:
+            stations = sorted(
+                stations,
+                key=_query.sort_key(args.sort, distances),
+                reverse=args.descending
+            )
+
+        fp = open(args.output, "w", newline="") if args.output is not None \
+            else sys.stdout
+        try:
+            # station id : file size (KB), for scheduling downloads
+            sizes = collections.OrderedDict(
+                (station.id, station.size)
+                for station in _export.write_stations(
+                    stations, fp, args.format, distances
+                )
+            )
+            stnids = list(sizes)
+        finally:
+            if fp is not sys.stdout:
+                fp.close()
+        db.close()
+    finally:
+        os.remove(tmp.name)
+
+    print("* {} match{}".format(
+        len(stnids),
+        "es" if len(stnids) != 1 else ""
+    ), file=sys.stderr)
+
+    if args.extract is not None:
+        import _archive
+        return _archive.extract_main(
+            args.extract,
+            stnids,
+            args.dest,
+            args.as_csv
+        )
+
+    if args.download is True:
+        import _asyncdownload
+        failed = 0
+        # the asyncio engine's Batch, for its throughput
+        batches = []
+        if args.engine == "async":
+            results = _asyncdownload.download_stations(
+                stnids,
+                overwrite=not args.no_overwrite,
+                dest=args.dest,
+                base_url=args.base_url,
+                concurrency=args.workers or 64,
+                sizes=sizes,
+                order=args.order,
+                adaptive=not args.fixed,
+                started=batches.append
+            )
+        else:
+            results = _download.download_stations(
+                _download.schedule(stnids, sizes, args.order),
+                overwrite=not args.no_overwrite,
+                dest=args.dest,
+                base_url=args.base_url,
+                workers=args.workers or 4
+            )
+        saved = []
+        for stnid, name, error in results:
+            if error is None:
+                saved.append(name)
+                print("* Download of '{}' Successful!".format(name),
+                    file=sys.stderr)
+            else:
+                failed += 1
+                print("* Download of '{}' FAILED! ({})".format(stnid, error),
+                    file=sys.stderr)
+        for batch in batches if len(stnids) > 0 else []:
+            print("* {}".format(
+                _asyncdownload.throughput_summary(batch)
+            ), file=sys.stderr)
+        if args.verify is True:
+            failed += verify_downloads(saved, args.base_url)
+        return 1 if failed > 0 else 0
+    return 0
+
+def verify_downloads(names, base_url):
+    """Verifies saved archives, downloading any corrupt ones once more.
+    Returns the quantity still corrupt.
+    """
+    import _verify
+    corrupt = []
+    for v in _verify.verify_files(names):
+        if v.ok is False:
+            corrupt.append(v.path)
+            print("* '{}' is corrupt! ({})".format(v.path, v.error),
+                file=sys.stderr)
+    failed = 0
+    for v in _verify.redownload(corrupt, base_url):
+        if v.ok is False:
+            failed += 1
+        print("* Redownload of '{}' {}".format(
+            v.path,
+            "Successful!" if v.ok else "FAILED! ({})".format(v.error)
+        ), file=sys.stderr)
+    print("* {} of {} downloads verified".format(
+        len(names) - failed,
+        len(names)
+    ), file=sys.stderr)
+    return failed
+
+def read_config(path):
+    """Reads the app's settings file (if it exists) into a ConfigParser."""
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+def batch_parser():
+    parser = argparse.ArgumentParser(
+        prog="batch",
+        description="Run saved queries (see 'query --save', or the app's "
+            "Queries menu) together, in a single pass over the database. "
+            "Each match is written once per query it matches, tagged with "
+            "that query's name (or once in all, with --union)."
+    )
+    parser.add_argument(
+        "names",
+        nargs="*",
+        help="saved queries to run (default: all of them)"
+    )
+    parser.add_argument(
+        "--config",
+        default="ghcnd.ini",
+        help="settings file the queries are saved in (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--database",
+        default="GHCNDaily.db.gz",
+        help="station database (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--store",
+        default="ghcnd-obs.db",
+        help="observation store, for queries filtering on observations "
+            "(default: %(default)s)"
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="list the saved queries and exit"
+    )
+    parser.add_argument(
+        "--union",
+        action="store_true",
+        help="write each station once, with the names of every query it "
+            "matches"
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(_export.FORMATS),
+        default="csv",
+        help="output format (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="write results to this file rather than stdout"
+    )
+    return parser
+
+def batch_main(argv=None):
+    parser = batch_parser()
+    args = parser.parse_args(argv)
+    config = read_config(args.config)
+    saved = _saved.saved_names(config)
+
+    if args.list is True:
+        for name in saved:
+            print("{}: {}".format(
+                name,
+                ", ".join(
+                    "{}={}".format(key, value)
+                    for key, value in _saved.to_section(
+                        _saved.load_query(config, name)
+                    ).items()
+                )
+            ))
+        return 0
+
+    names = args.names or saved
+    missing = [name for name in names if name not in saved]
+    if len(missing) > 0:
+        parser.error("no saved quer{} named {}".format(
+            "ies" if len(missing) > 1 else "y",
+            ", ".join("'{}'".format(name) for name in missing)
+        ))
+    if len(names) == 0:
+        parser.error("there are no saved queries in '{}'".format(args.config))
+
+    tmp = _database.extract_database(args.database)
+    try:
+        db = sqlite3.connect(tmp.name)
+        try:
+            results = _saved.run_batch(
+                db,
+                collections.OrderedDict(
+                    (name, _saved.load_query(config, name)) for name in names
+                ),
+                store=args.store
+            )
+        except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+            parser.error("the saved queries couldn't be run: {}".format(e))
+        finally:
+            db.close()
+    finally:
+        os.remove(tmp.name)
+
+    # (station, (tag, distance)) records
+    if args.union is True:
+        tags = collections.OrderedDict()
+        stations = {}
+        for name, (matches, distances) in results.items():
+            for station in matches:
+                stations[station.id] = station
+                tags.setdefault(station.id, []).append(name)
+        records = (
+            (stations[stnid], (";".join(tags[stnid]), None)) for stnid in tags
+        )
+        tag_field = "queries"
+    else:
+        records = (
+            (station, (name,
+                round(distances[station.id], 3) if distances else None))
+            for name, (matches, distances) in results.items()
+            for station in matches
+        )
+        tag_field = "query"
+
+    fp = open(args.output, "w", newline="") if args.output is not None \
+        else sys.stdout
+    try:
+        for _ in _export.write_records(
+            records, fp, args.format, (tag_field, "distance")
+        ):
+            pass
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+
+    for name, (matches, _) in results.items():
+        print("* {}: {} match{}".format(
+            name,
+            len(matches),
+            "es" if len(matches) != 1 else ""
+        ), file=sys.stderr)
+    return 0
+
+def module_main(name):
+    """Returns an entry point running module 'name''s main, importing the
+    module only when the sub-command is run.
+    """
+    def run(argv):
+        return importlib.import_module(name).main(argv)
+    return run
+
+# sub-command name : entry point taking the remaining arguments
+COMMANDS = {
+    "query": query_main,
+    "batch": batch_main,
+    "build-db": module_main("_database"),
+    "sizes": module_main("_listing"),
+    "bench": module_main("_bench"),
+    "synth": module_main("_synth"),
+    "verify": module_main("_verify"),
+    "ingest": module_main("_obsstore"),
+    "apply-diff": module_main("_diff"),
+    "extract": module_main("_archive"),
+    "transpose": module_main("_transpose"),
+}
+
+def main(argv=None):
+    """Dispatches a command-line invocation of the app to a sub-command."""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 0 or argv[0] not in COMMANDS:
+        print(
+            "usage: ghcn-daily-downloader-tk.pyz [{}] ...\n"
+            "Run without arguments to start the app.".format(
+                " | ".join(COMMANDS)
+            ),
+            file=sys.stderr
+        )
+        return 2
+    try:
+        return COMMANDS[argv[0]](argv[1:])
+    except BrokenPipeError:
+        # The reader of the output (like 'head') stopped early. Further
+        #   writes (including the interpreter's final flush) go nowhere.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
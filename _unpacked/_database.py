@@ -0,0 +1,442 @@
+import os
+import gzip
+import shutil
+import sqlite3
+import operator
+import argparse
+import tempfile
+import collections
+
+# Columns of the GHCNDaily table, in order. The 'Station' namedtuple used by
+#   the app is built from this same sequence.
+FIELDS = (
+    "id", "latitude", "longitude", "elevation", "state", "name",
+    "gsn", "hcn_crn", "wmo_id", "country", "size",
+    "prcp_start", "prcp_end",
+    "snow_start", "snow_end",
+    "snwd_start", "snwd_end",
+    "tmax_start", "tmax_end",
+    "tmin_start", "tmin_end",
+    "is_available"
+)
+
+Station = collections.namedtuple("Station", FIELDS)
+
+# The 5 core GHCN-Daily elements that data-ranges are kept for
+ELEMENTS = ("PRCP", "SNOW", "SNWD", "TMAX", "TMIN")
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS GHCNDaily (
+    id TEXT PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    elevation REAL,
+    state TEXT,
+    name TEXT,
+    gsn INTEGER,
+    hcn_crn INTEGER,
+    wmo_id TEXT,
+    country TEXT,
+    size REAL,
+    prcp_start INTEGER,
+    prcp_end INTEGER,
+    snow_start INTEGER,
+    snow_end INTEGER,
+    snwd_start INTEGER,
+    snwd_end INTEGER,
+    tmax_start INTEGER,
+    tmax_end INTEGER,
+    tmin_start INTEGER,
+    tmin_end INTEGER,
+    is_available INTEGER
+)"""
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_country ON GHCNDaily (country)",
+    "CREATE INDEX IF NOT EXISTS idx_state ON GHCNDaily (state)",
+    "CREATE INDEX IF NOT EXISTS idx_latitude ON GHCNDaily (latitude)",
+    "CREATE INDEX IF NOT EXISTS idx_longitude ON GHCNDaily (longitude)",
+    "CREATE INDEX IF NOT EXISTS idx_elevation ON GHCNDaily (elevation)",
+    "CREATE INDEX IF NOT EXISTS idx_size ON GHCNDaily (size)",
+] + [
+    # period-of-record (coverage) filters; see _query.build_query. The
+    #   (start, end) index answers spans and open-ended starts, the end index
+    #   open-ended ends.
+    statement.format(element.lower())
+    for element in ELEMENTS
+    for statement in [
+        "CREATE INDEX IF NOT EXISTS idx_{0}_coverage ON GHCNDaily "
+            "({0}_start, {0}_end)",
+        "CREATE INDEX IF NOT EXISTS idx_{0}_end ON GHCNDaily ({0}_end)",
+    ]
+]
+
+# Fixed-width column layouts (0-based slices) as documented in NOAA's
+#   'readme.txt' for the GHCN-Daily metadata files
+_stations_cols = operator.itemgetter(
+    slice(0, 11),       # ID
+    slice(12, 20),      # LATITUDE
+    slice(21, 30),      # LONGITUDE
+    slice(31, 37),      # ELEVATION
+    slice(38, 40),      # STATE
+    slice(41, 71),      # NAME
+    slice(72, 75),      # GSN FLAG
+    slice(76, 79),      # HCN/CRN FLAG
+    slice(80, 85),      # WMO ID
+)
+_inventory_cols = operator.itemgetter(
+    slice(0, 11),       # ID
+    slice(31, 35),      # ELEMENT
+    slice(36, 40),      # FIRSTYEAR
+    slice(41, 45),      # LASTYEAR
+)
+_codes_cols = operator.itemgetter(
+    slice(0, 2),        # CODE
+    slice(3, None),     # NAME
+)
+
+def read_fixed_width(path, columns):
+    """Read a fixed-width text file column-wise. Every line is sliced in a
+    single pass via 'columns' (an operator.itemgetter of slices) and the
+    result is transposed, returning one tuple of stripped strings per column.
+    """
+    with open(path, encoding="utf-8", errors="replace") as r:
+        rows = map(columns, r.read().splitlines())
+        return [
+            tuple(map(str.strip, col))
+            for col in zip(*rows)
+        ]
+
+def read_stations(path):
+    """Parse 'ghcnd-stations.txt', returning an ordered dictionary of
+    station id to a tuple of the station-specific GHCNDaily columns:
+    (latitude, longitude, elevation, state, name, gsn, hcn_crn, wmo_id,
+    country).
+    """
+    ids, lats, lons, elevs, states, names, gsns, hcns, wmos = \
+        read_fixed_width(path, _stations_cols)
+    return collections.OrderedDict(
+        zip(
+            ids,
+            zip(
+                map(float, lats),
+                map(float, lons),
+                map(float, elevs),
+                (s if s != "" else None for s in states),
+                names,
+                (int(g == "GSN") for g in gsns),
+                (int(h in ("HCN", "CRN")) for h in hcns),
+                (w if w != "" else None for w in wmos),
+                (i[:2] for i in ids),
+            )
+        )
+    )
+
+def read_inventory(path):
+    """Parse 'ghcnd-inventory.txt', returning a dictionary of station id to
+    a dictionary of element to (first-year, last-year). Only the 5 core
+    elements are kept.
+    """
+    inventory = collections.defaultdict(dict)
+    for stnid, element, first, last in zip(
+        *read_fixed_width(path, _inventory_cols)
+    ):
+        if element in ELEMENTS:
+            inventory[stnid][element] = (int(first), int(last))
+    return inventory
+
+def read_codes(path):
+    """Parse 'ghcnd-countries.txt' or 'ghcnd-states.txt', returning an
+    ordered dictionary of abbreviation to name.
+    """
+    return collections.OrderedDict(
+        zip(*read_fixed_width(path, _codes_cols))
+    )
+
+def station_rows(stations, inventory, sizes=None):
+    """Yields GHCNDaily table rows (ordered as FIELDS) formed by joining the
+    parsed stations and inventory. 'sizes' is an optional dictionary of
+    station id to file-size (in KB); unknown sizes are recorded as 0.
+    """
+    sizes = sizes if sizes is not None else {}
+    for stnid, (lat, lon, elev, state, name, gsn, hcn_crn, wmo_id, country) \
+    in stations.items():
+        ranges = inventory.get(stnid, {})
+        years = []
+        for element in ELEMENTS:
+            years.extend(ranges.get(element, (None, None)))
+        yield (
+            stnid, lat, lon, elev, state, name,
+            gsn, hcn_crn, wmo_id, country, sizes.get(stnid, 0.0),
+        ) + tuple(years) + (int(len(ranges) > 0),)
+
+def create_schema(db):
+    """Creates the GHCNDaily table and its indexes if they don't exist."""
+    db.execute(SCHEMA)
+    for statement in INDEXES:
+        db.execute(statement)
+
+def create_indexes(dbpath):
+    """Creates any of INDEXES missing from a database, such as one written
+    before they were added.
+    """
+    db = sqlite3.connect(dbpath)
+    with db:
+        for statement in INDEXES:
+            db.execute(statement)
+    db.close()
+
+def extract_database(path="GHCNDaily.db.gz"):
+    """Decompresses the distributed database into a temporary file, returning
+    the (closed) tempfile object. The caller is responsible for removing it.
+    Any missing indexes are created in the copy.
+
+    Note: the distributed file is doubly gzipped; this mirrors that. Paths
+    not ending with '.gz' are taken as plain sqlite3 files and copied.
+    """
+    if path.endswith(".gz") is False:
+        with open(path, "rb") as r:
+            tmp = tempfile.NamedTemporaryFile(delete=False)
+            shutil.copyfileobj(r, tmp)
+            tmp.close()
+    else:
+        with gzip.open(path) as r:
+            tmp = tempfile.NamedTemporaryFile(delete=False)
+            tmp.write(gzip.decompress(r.read()))
+            tmp.close()
+    create_indexes(tmp.name)
+    return tmp
+
+def load_stations(dbpath, progress=None):
+    """Reads every GHCNDaily row into a dictionary of station id to Station.
+    'progress', if given, is called with the fraction loaded so far (ending
+    with 1).
+    """
+    db = sqlite3.connect(dbpath)
+    total = db.execute("SELECT COUNT(*) FROM GHCNDaily").fetchone()[0]
+    stations = {}
+    for i, row in enumerate(db.execute("SELECT * FROM GHCNDaily")):
+        stations[row[0]] = Station(*row)
+        if progress is not None and i % 5000 == 0:
+            progress(i / max(total, 1))
+    db.close()
+    if progress is not None:
+        progress(1)
+    return stations
+
+def compress_database(dbpath, path="GHCNDaily.db.gz", compresslevel=6):
+    """Compresses a sqlite3 database file into the distributed (doubly
+    gzipped) format read by 'extract_database'.
+    """
+    with open(dbpath, "rb") as r:
+        data = gzip.compress(r.read(), compresslevel)
+    with gzip.open(path, "wb") as w:
+        w.write(data)
+
+def store_database(dbpath, path="GHCNDaily.db.gz"):
+    """Moves a sqlite3 database file to 'path', compressing it into the
+    distributed format if 'path' ends with '.gz'; otherwise it's kept as a
+    plain sqlite3 file.
+    """
+    if path.endswith(".gz"):
+        compress_database(dbpath, path)
+        os.remove(dbpath)
+    else:
+        os.replace(dbpath, path)
+
+def write_database(rows, path="GHCNDaily.db.gz"):
+    """Writes GHCNDaily rows (ordered as FIELDS) to a new database at 'path'.
+    The table and all indexes are written in a single transaction. Paths
+    ending with '.gz' are written in the distributed format; otherwise a
+    plain sqlite3 file is written.
+    """
+    tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    tmp.close()
+    try:
+        db = sqlite3.connect(tmp.name)
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        with db:
+            db.execute("BEGIN")
+            db.execute(SCHEMA)
+            db.executemany(
+                "INSERT INTO GHCNDaily VALUES ({})".format(
+                    ", ".join("?" * len(FIELDS))
+                ),
+                rows
+            )
+            # indexes are quicker to build once the table is populated
+            for statement in INDEXES:
+                db.execute(statement)
+        db.close()
+        store_database(tmp.name, path)
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+
+def build_database(stations_path, inventory_path, path="GHCNDaily.db.gz",
+    sizes=None):
+    """Builds the GHCNDaily database from local copies of
+    'ghcnd-stations.txt' and 'ghcnd-inventory.txt', writing it to 'path'.
+    Returns the quantity of stations written.
+    """
+    stations = read_stations(stations_path)
+    inventory = read_inventory(inventory_path)
+    write_database(station_rows(stations, inventory, sizes), path)
+    return len(stations)
+
+RefreshSummary = collections.namedtuple(
+    "RefreshSummary",
+    ["inserted", "changed", "removed"]
+)
+
+def diff_rows(db, rows):
+    """Compares freshly parsed GHCNDaily rows against those in 'db',
+    returning a RefreshSummary of rows to insert, update and delete. The
+    'size' recorded in the database is kept, as the metadata files don't
+    carry it.
+    """
+    size = FIELDS.index("size")
+    current = {
+        row[0] : row for row in db.execute(
+            "SELECT {} FROM GHCNDaily".format(", ".join(FIELDS))
+        )
+    }
+    inserted, changed = [], []
+    for row in rows:
+        old = current.pop(row[0], None)
+        if old is None:
+            inserted.append(row)
+            continue
+        row = row[:size] + old[size:size + 1] + row[size + 1:]
+        if row != old:
+            changed.append(row)
+    return RefreshSummary(inserted, changed, sorted(current))
+
+def apply_refresh(db, summary):
+    """Applies a RefreshSummary to 'db' in a single transaction."""
+    with db:
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT INTO GHCNDaily VALUES ({})".format(
+                ", ".join("?" * len(FIELDS))
+            ),
+            summary.inserted
+        )
+        db.executemany(
+            "UPDATE GHCNDaily SET {} WHERE id = ?".format(
+                ", ".join("{} = ?".format(f) for f in FIELDS[1:])
+            ),
+            (row[1:] + row[:1] for row in summary.changed)
+        )
+        db.executemany(
+            "DELETE FROM GHCNDaily WHERE id = ?",
+            ((stnid,) for stnid in summary.removed)
+        )
+
+def refresh_database(stations_path, inventory_path, path="GHCNDaily.db.gz",
+    dry_run=False):
+    """Incrementally updates an existing GHCNDaily database from newer copies
+    of 'ghcnd-stations.txt' and 'ghcnd-inventory.txt'. Only inserted, changed
+    or removed stations are written. Returns the RefreshSummary.
+    """
+    rows = station_rows(
+        read_stations(stations_path),
+        read_inventory(inventory_path)
+    )
+    tmp = extract_database(path)
+    try:
+        db = sqlite3.connect(tmp.name)
+        summary = diff_rows(db, rows)
+        if dry_run is False and any(summary):
+            apply_refresh(db, summary)
+            db.close()
+            store_database(tmp.name, path)
+        else:
+            db.close()
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+
+    return summary
+
+def write_codes_module(countries_path, states_path, path="_countries.py"):
+    """Regenerates the '_countries' module from 'ghcnd-countries.txt' and
+    'ghcnd-states.txt'.
+    """
+    with open(path, "w") as w:
+        w.write("import collections\n")
+        for name, codes in [
+            ("dictionary", read_codes(countries_path)),
+            ("states", read_codes(states_path)),
+        ]:
+            w.write("\n{} = {{\n".format(name))
+            for abbr, desc in codes.items():
+                w.write('    "{}" : "{}",\n'.format(abbr, desc))
+            w.write("}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="build-db",
+        description="Build 'GHCNDaily.db.gz' from local copies of the "
+            "GHCN-Daily metadata files, or refresh an existing one."
+    )
+    parser.add_argument("stations", help="path to 'ghcnd-stations.txt'")
+    parser.add_argument("inventory", help="path to 'ghcnd-inventory.txt'")
+    parser.add_argument(
+        "-o", "--output",
+        default="GHCNDaily.db.gz",
+        help="database to write (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="only apply changes to the existing database"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="with --refresh, report changes without writing them"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="with --refresh, list the id of each changed station"
+    )
+    parser.add_argument("--countries", help="path to 'ghcnd-countries.txt'")
+    parser.add_argument("--states", help="path to 'ghcnd-states.txt'")
+    parser.add_argument(
+        "--codes-output",
+        default="_countries.py",
+        help="module to write the country/state codes to, if given "
+            "(default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.refresh is True:
+        summary = refresh_database(
+            args.stations,
+            args.inventory,
+            args.output,
+            args.dry_run
+        )
+        for label, stnids in [
+            ("Inserted", [row[0] for row in summary.inserted]),
+            ("Changed", [row[0] for row in summary.changed]),
+            ("Removed", summary.removed),
+        ]:
+            print("* {}: {}".format(label, len(stnids)))
+            if args.verbose is True:
+                for stnid in stnids:
+                    print("    {}".format(stnid))
+        if args.dry_run is False and any(summary):
+            print("* Updated '{}'".format(args.output))
+    else:
+        count = build_database(args.stations, args.inventory, args.output)
+        print("* Wrote {} stations to '{}'".format(count, args.output))
+
+    if args.countries is not None and args.states is not None:
+        write_codes_module(args.countries, args.states, args.codes_output)
+        print("* Wrote country/state codes to '{}'".format(args.codes_output))
+
+if __name__ == "__main__":
+    main()
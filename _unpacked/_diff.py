@@ -0,0 +1,341 @@
+import os
+import sys
+import csv
+import gzip
+import time
+import tarfile
+import argparse
+import collections
+import _obsstore
+import _verify
+
+# NOAA's daily changes to GHCN-Daily, published under 'superghcnd/' as
+#   'superghcnd_diff_YYYYMMDD_to_YYYYMMDD.tar.gz': an archive of insert,
+#   update and delete CSVs whose rows are laid out like the 'by_station/'
+#   files (station, date, element, value, flags, observation time).
+DIFF_URL = "https://www.ncei.noaa.gov/pub/data/ghcn/daily/superghcnd/"
+
+KINDS = ("insert", "update", "delete")
+
+DiffSummary = collections.namedtuple(
+    "DiffSummary",
+    ["name", "applied", "inserted", "updated", "deleted", "files", "seconds"]
+)
+
+def diff_name(path):
+    """Names a diff archive after its file, less the extensions; names sort
+    in the order the diffs should be applied.
+    """
+    return os.path.basename(path).split(".")[0]
+
+def member_kind(name):
+    """Returns which of KINDS a diff archive member holds, or None."""
+    base = os.path.basename(name).lower()
+    for kind in KINDS:
+        if base.startswith(kind):
+            return kind
+    return None
+
+def parse_row(record):
+    """Converts a diff CSV record into an Observations row (ordered as
+    _obsstore.OBS_FIELDS), or None for a header or blank line.
+    """
+    if len(record) < 4 or not record[1].isdigit():
+        return None
+    record += [""] * (8 - len(record))
+    return (
+        record[0],
+        int(record[1]),
+        record[2],
+        int(record[3]) if record[3] else None,
+        record[4] or None,
+        record[5] or None,
+        record[6] or None,
+        record[7] or None
+    )
+
+def read_diff(path, stations=None):
+    """Streams a diff archive, yielding (kind, Observations row) for each
+    change, member by member. The archive is read as a stream ('r|gz'), so
+    it's never extracted or held in memory.
+
+    stations: optional set of station ids; changes to others are skipped
+        (cheaply, before parsing their values)
+    """
+    with tarfile.open(path, "r|gz") as tar:
+        for member in tar:
+            kind = member_kind(member.name)
+            if kind is None or member.isfile() is False:
+                continue
+            # (a streamed member can't be seeked, as TextIOWrapper would)
+            lines = (line.decode() for line in tar.extractfile(member))
+            for record in csv.reader(lines):
+                if stations is not None and (
+                    len(record) == 0 or record[0] not in stations
+                ):
+                    continue
+                row = parse_row(record)
+                if row is not None:
+                    yield kind, row
+
+def apply_to_store(db, changes, batch=50000):
+    """Applies (kind, row) changes to an observation store inside the
+    caller's transaction, then recomputes the YearSummary rows of every
+    station, element and year touched. Returns {kind: rows}.
+
+    Inserts and updates both replace any observation with the same station,
+    date and element, so a diff applied twice leaves the same store.
+    """
+    counts = dict.fromkeys(KINDS, 0)
+    touched = set()
+    # (station, element, date) : (kind, row) of its latest change, so a key
+    #   changed more than once in a batch ends as the last change left it
+    pending = {}
+
+    def flush():
+        # (replacing what's there, by the station index)
+        db.executemany(
+            "DELETE FROM Observations "
+            "WHERE station = ? AND element = ? AND date = ?",
+            list(pending)
+        )
+        db.executemany(
+            "INSERT INTO Observations VALUES ({})".format(
+                ", ".join("?" * len(_obsstore.OBS_FIELDS))
+            ),
+            [row for kind, row in pending.values() if kind != "delete"]
+        )
+        pending.clear()
+
+    for kind, row in changes:
+        pending[(row[0], row[2], row[1])] = (kind, row)
+        counts[kind] += 1
+        touched.add((row[0], row[2], row[1] // 10000))
+        if len(pending) >= batch:
+            flush()
+    flush()
+
+    touched = sorted(touched)
+    db.executemany(
+        "DELETE FROM YearSummary "
+        "WHERE station = ? AND element = ? AND year = ?",
+        touched
+    )
+    db.executemany(
+        """INSERT INTO YearSummary
+        SELECT element, date / 10000, station, COUNT(*), MAX(value),
+            MIN(value), SUM(value)
+        FROM Observations
+        WHERE station = ?1 AND element = ?2
+            AND date BETWEEN ?3 * 10000 AND ?3 * 10000 + 9999
+            AND value IS NOT NULL AND value != -9999 AND qflag IS NULL
+        GROUP BY station, element, date / 10000""",
+        touched
+    )
+    db.executemany(
+        """UPDATE Files SET observations = (
+            SELECT COUNT(*) FROM Observations WHERE station = ?1
+        )
+        WHERE station = ?1""",
+        sorted({(stnid,) for stnid, _, _ in touched})
+    )
+    return counts
+
+def patch_file(path, changes):
+    """Rewrites a downloaded 'by_station/' file with a station's changes
+    ({(date, element): (kind, row)}): deleted rows are left out, updated
+    ones replaced, and inserted ones placed among the others by date. The
+    new file replaces the old only once it's completely written.
+    """
+    # (date, element) of the rows to write, latest first
+    inserts = sorted(
+        (key for key, (kind, _) in changes.items() if kind != "delete"),
+        reverse=True
+    )
+    written = set()
+    text = lambda value: "" if value is None else str(value)
+
+    def write(writer, key):
+        if key not in written:
+            written.add(key)
+            writer.writerow([text(v) for v in changes[key][1]])
+
+    tmp = path + ".part"
+    # (gzip's usual level; the default 9 is several times slower)
+    with gzip.open(path, "rt", newline="") as r, \
+        gzip.open(tmp, "wt", compresslevel=6, newline="") as w:
+        writer = csv.writer(w, lineterminator="\n")
+        for record in csv.reader(r):
+            if len(record) < 4 or not record[1].isdigit():
+                writer.writerow(record)
+                continue
+            date = int(record[1])
+            while inserts and inserts[-1][0] < date:
+                write(writer, inserts.pop())
+            key = (date, record[2])
+            if key not in changes:
+                writer.writerow(record)
+            elif changes[key][0] != "delete":
+                # (in its place, rather than with the inserts)
+                write(writer, key)
+        while inserts:
+            write(writer, inserts.pop())
+    os.replace(tmp, path)
+
+def apply_diff(path, db=None, files=None, batch=50000):
+    """Applies a diff archive to an observation store (see
+    _obsstore.connect) and/or to downloaded station files ({station id:
+    path}), touching only the stations they hold. Returns a DiffSummary.
+
+    The store is changed in a single transaction, and the diff recorded in
+    its Diffs table; a diff recorded already is skipped (applied=False).
+    Each file is rewritten once the store has committed (see patch_file),
+    and a file the store was loaded from has its hash updated, so ingesting
+    it again is skipped.
+    """
+    started = time.perf_counter()
+    name = diff_name(path)
+    if db is not None and db.execute(
+        "SELECT 1 FROM Diffs WHERE name = ?",
+        (name,)
+    ).fetchone() is not None:
+        return DiffSummary(name, False, 0, 0, 0, 0, 0.0)
+
+    files = files or {}
+    stations = set(files)
+    if db is not None:
+        stations.update(stnid for stnid, in db.execute(
+            "SELECT station FROM Files"
+        ))
+    # station id : {(date, element): (kind, row)}, for files to rewrite
+    by_station = collections.defaultdict(dict)
+
+    def changes():
+        for kind, row in read_diff(path, stations):
+            if row[0] in files:
+                by_station[row[0]][(row[1], row[2])] = (kind, row)
+            yield kind, row
+
+    if db is not None:
+        db.execute("BEGIN")
+        try:
+            counts = apply_to_store(db, changes(), batch)
+            db.execute(
+                "INSERT INTO Diffs VALUES (?, ?, ?, ?, ?)",
+                (
+                    name,
+                    counts["insert"],
+                    counts["update"],
+                    counts["delete"],
+                    time.strftime("%Y-%m-%dT%H:%M:%S")
+                )
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+    else:
+        counts = collections.Counter(kind for kind, _ in changes())
+
+    for stnid, station_changes in sorted(by_station.items()):
+        patch_file(files[stnid], station_changes)
+        if db is not None:
+            db.execute(
+                "UPDATE Files SET sha256 = ? WHERE station = ? AND path = ?",
+                (
+                    _verify.verify_file(files[stnid]).sha256,
+                    stnid,
+                    os.path.abspath(files[stnid])
+                )
+            )
+
+    return DiffSummary(
+        name,
+        True,
+        counts["insert"],
+        counts["update"],
+        counts["delete"],
+        len(by_station),
+        time.perf_counter() - started
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="apply-diff",
+        description="Apply NOAA's daily GHCN-Daily diff archives "
+            "('superghcnd_diff_*.tar.gz', from {}) to the local observation "
+            "store and/or downloaded station files, in name order.".format(
+                DIFF_URL
+            )
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="DIFF",
+        help="diff archives to apply"
+    )
+    parser.add_argument(
+        "--store",
+        default="ghcnd-obs.db",
+        help="observation database to update (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--no-store",
+        dest="store",
+        action="store_const",
+        const=None,
+        help="leave the observation database alone"
+    )
+    parser.add_argument(
+        "--files",
+        metavar="DIR",
+        help="also rewrite the downloaded '.csv.gz' files here that the "
+            "diffs change"
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=50000,
+        help="changes written to the store at once (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+    if args.store is None and args.files is None:
+        parser.error("nothing to apply the diffs to; give --files or --store")
+
+    files = {
+        _verify.station_id(path): path
+        for path in _verify.archive_paths([args.files])
+    } if args.files is not None else None
+    if args.store is not None and os.path.exists(args.store) is False:
+        parser.error(
+            "no observation store at '{}'; see 'ingest', or give "
+            "--no-store".format(args.store)
+        )
+    db = _obsstore.connect(args.store) if args.store is not None else None
+    try:
+        for path in sorted(args.paths, key=diff_name):
+            summary = apply_diff(path, db, files, args.batch)
+            if summary.applied is False:
+                print("* '{}' was applied already; skipped".format(
+                    summary.name
+                ), file=sys.stderr)
+                continue
+            print("* Applied '{}' in {:.2f}s: {} inserted, {} updated, {} "
+                "deleted{}".format(
+                    summary.name,
+                    summary.seconds,
+                    summary.inserted,
+                    summary.updated,
+                    summary.deleted,
+                    ", {} file{} rewritten".format(
+                        summary.files,
+                        "s" if summary.files != 1 else ""
+                    ) if files is not None else ""
+                ), file=sys.stderr)
+    finally:
+        if db is not None:
+            db.close()
+    return 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import datetime
+
+BASE_URL = "https://www1.ncdc.noaa.gov/pub/data/ghcn/daily/by_station/"
+
+# batch download orders : description
+ORDERS = {
+    "listed": "as given",
+    "smallest": "smallest files first, for the quickest feedback",
+    "largest": "largest files first, so the batch finishes soonest",
+}
+
+def schedule(stnids, sizes=None, order="listed"):
+    """Orders station ids for a batch download by their files' sizes (a
+    dictionary of station id to KB, as in the database; unknown sizes count
+    as 0). Starting the largest first keeps a big file from being left to
+    run alone at the end.
+    """
+    if order not in ORDERS:
+        raise ValueError("unknown download order '{}'".format(order))
+    stnids = list(stnids)
+    if order == "listed" or sizes is None:
+        return stnids
+    return sorted(
+        stnids,
+        key=lambda stnid: sizes.get(stnid) or 0,
+        reverse=order == "largest"
+    )
+
+def station_url(stnid, base_url=BASE_URL):
+    """Formulate the download URL of a station's GHCN-Daily gzip file."""
+    return "".join([base_url, stnid, ".csv.gz"])
+
+def save_name(stnid, overwrite=True, dest=""):
+    """Formulate the name of the saved file; based on whether or not
+    overwriting is requested.
+    """
+    if overwrite is True:
+        name = stnid + ".csv.gz"
+    else:
+        name = "".join([
+            stnid,
+            "_{:%Y%m%d-%H%M%S}".format(datetime.datetime.now()),
+            ".csv.gz"
+        ])
+    return os.path.join(dest, name)
+
+def fetch(url, name, timeout=5):
+    """Save the file at 'url' as 'name'. Raises urllib.error.URLError on
+    failure.
+    """
+    # imported on first use to keep app startup light
+    import urllib.request
+    with urllib.request.urlopen(url, timeout=timeout) as u:
+        with open(name, "wb") as w:
+            w.write(u.read())
+
+def download_station(stnid, overwrite=True, dest="", base_url=BASE_URL,
+    timeout=5):
+    """Download a station's GHCN-Daily gzip file, returning the name it was
+    saved as. Raises urllib.error.URLError on failure.
+    """
+    name = save_name(stnid, overwrite, dest)
+    fetch(station_url(stnid, base_url), name, timeout)
+    return name
+
+def download_stations(stnids, overwrite=True, dest="", base_url=BASE_URL,
+    timeout=5, workers=4):
+    """Download many stations' files on a pool of threads. Yields
+    (station id, saved name or None, error or None) as each completes.
+    """
+    import urllib.error
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = {
+            pool.submit(
+                download_station,
+                stnid,
+                overwrite,
+                dest,
+                base_url,
+                timeout
+            ) : stnid
+            for stnid in stnids
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except (urllib.error.URLError, OSError) as e:
+                yield futures[future], None, e
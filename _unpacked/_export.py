@@ -0,0 +1,93 @@
+import os
+import csv
+import json
+import _database
+
+# format : file extensions (the first is the default)
+FORMATS = {
+    "csv": [".csv"],
+    "jsonl": [".jsonl", ".ndjson"],
+    "geojson": [".geojson", ".json"],
+}
+
+def format_for(path, default="csv"):
+    """Returns the export format implied by a file's extension."""
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, extensions in FORMATS.items():
+        if extension in extensions:
+            return fmt
+    return default
+
+def write_records(records, fp, fmt="csv", extra_fields=()):
+    """Writes (Station, extra values) records to an open text file one at a
+    time, yielding each Station back once written; nothing is accumulated,
+    so any quantity of stations can be written.
+
+    fmt: "csv" (a header, then a row per station), "jsonl" (an object per
+        line), or "geojson" (a FeatureCollection of Point features with the
+        fields as properties)
+    extra_fields: names of the extra values, written after the Station
+        fields
+    """
+    fields = _database.FIELDS + tuple(extra_fields)
+    if fmt == "csv":
+        writer = csv.writer(fp, lineterminator="\n")
+        writer.writerow(fields)
+        for station, extra in records:
+            writer.writerow(station + tuple(extra))
+            yield station
+    elif fmt == "jsonl":
+        for station, extra in records:
+            fp.write(json.dumps(dict(zip(fields, station + tuple(extra)))))
+            fp.write("\n")
+            yield station
+    elif fmt == "geojson":
+        fp.write('{"type": "FeatureCollection", "features": [')
+        separator = "\n"
+        for station, extra in records:
+            fp.write(separator)
+            fp.write(json.dumps({
+                "type": "Feature",
+                "id": station.id,
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [station.longitude, station.latitude],
+                },
+                "properties": dict(zip(fields, station + tuple(extra))),
+            }))
+            separator = ",\n"
+            yield station
+        fp.write("\n]}\n")
+    else:
+        raise ValueError("unknown export format '{}'".format(fmt))
+
+def distance_field(distance):
+    return round(distance, 3) if distance is not None else None
+
+def write_stations(stations, fp, fmt="csv", distances=None):
+    """Writes Station records to an open text file (see write_records),
+    yielding them back for further use. 'distances', if given, is a
+    dictionary of station id to distance (km), written as an extra field
+    (empty, or null, for stations without one).
+    """
+    if distances:
+        records = (
+            (station, (distance_field(distances.get(station.id)),))
+            for station in stations
+        )
+        return write_records(records, fp, fmt, ("distance",))
+    return write_records(((station, ()) for station in stations), fp, fmt)
+
+def export_stations(stations, path, fmt=None, distances=None):
+    """Writes Station records to a file, in the format implied by its
+    extension unless 'fmt' is given. Returns the quantity written.
+    """
+    with open(path, "w", newline="") as w:
+        return sum(
+            1 for _ in write_stations(
+                stations,
+                w,
+                fmt or format_for(path),
+                distances
+            )
+        )
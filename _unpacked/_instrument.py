@@ -0,0 +1,103 @@
+import json
+import time
+import collections
+import contextlib
+
+class Recorder:
+    """Optional instrumentation of the app's hot paths. Each top-level action
+    (like a search) is recorded as its per-phase timings plus the call counts
+    and time spent in any wrapped SQLite functions. Actions started while
+    another is being recorded (a search re-sorting its results, for instance)
+    are folded into the outer record. The latest 'maxlen' records are kept.
+    While disabled, every method is a cheap no-op.
+    """
+    def __init__(self, enabled=False, maxlen=500):
+        self.enabled = enabled
+        self.log = collections.deque(maxlen=maxlen)
+        self.current = None
+        self._depth = 0
+        self._started = 0
+
+    def begin(self, action):
+        """Starts recording an action (or nests within the current one)."""
+        if self.enabled is False:
+            return
+        self._depth += 1
+        if self._depth == 1:
+            self._started = time.perf_counter()
+            self.current = {
+                "action": action,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "total": 0,
+                "phases": collections.OrderedDict(),
+                "calls": {},
+            }
+
+    def end(self):
+        """Finishes the current action, returning its record once the
+        outermost action ends (otherwise None).
+        """
+        if self.enabled is False or self._depth == 0:
+            return None
+        self._depth -= 1
+        if self._depth > 0:
+            return None
+        record = self.current
+        record["total"] = time.perf_counter() - self._started
+        self.log.append(record)
+        self.current = None
+        return record
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager adding the enclosed block's duration to phase
+        'name' of the current action.
+        """
+        if self.current is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self.current["phases"]
+            phases[name] = phases.get(name, 0) + time.perf_counter() - start
+
+    def wrap(self, name, func):
+        """Returns 'func' wrapped to count its calls and time spent in it
+        (for SQLite user-defined functions). Returns 'func' as-is while
+        nothing is being recorded.
+        """
+        if self.current is None:
+            return func
+        calls = self.current["calls"].setdefault(name, [0, 0])
+
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                calls[0] += 1
+                calls[1] += time.perf_counter() - start
+        return wrapper
+
+    @staticmethod
+    def summary(record):
+        """A one-line description of a record, in milliseconds."""
+        return "{} {:.1f}ms: {}{}".format(
+            record["action"],
+            record["total"] * 1000,
+            " | ".join(
+                "{} {:.1f}".format(name, seconds * 1000)
+                for name, seconds in record["phases"].items()
+            ),
+            "".join(
+                " | {} x{} ({:.1f})".format(name, count, seconds * 1000)
+                for name, (count, seconds) in record["calls"].items()
+            )
+        )
+
+    def dump(self, path):
+        """Writes the rolling log to 'path' as JSON (times in seconds)."""
+        with open(path, "w") as w:
+            json.dump(list(self.log), w, indent=2)
@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import sqlite3
+import argparse
+import html.parser
+import _database
+
+# Side-table for by_station listing details that the GHCNDaily table doesn't
+#   have a column for
+SCHEMA = """CREATE TABLE IF NOT EXISTS ByStation (
+    id TEXT PRIMARY KEY,
+    size REAL,
+    modified TEXT
+)"""
+
+_size_units = {"": 1 / 1024, "K": 1, "M": 1024, "G": 1024 ** 2}
+_details = re.compile(
+    r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2})(?::\d{2})?\s+([\d.]+)([KMG]?)"
+)
+
+class ListingParser(html.parser.HTMLParser):
+    """Incremental parser for the 'by_station/' HTML directory index. Text
+    following each '<a href="XXXXXXXXXXX.csv.gz">' link is collected until
+    the next link, from which the last-modified time and size are read. This
+    handles both the table and pre-formatted styles of Apache listings.
+    """
+    def __init__(self):
+        super().__init__()
+        self.stations = {}
+        self._stnid = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._flush()
+            href = dict(attrs).get("href") or ""
+            if href.endswith(".csv.gz"):
+                self._stnid = href[:-len(".csv.gz")].rsplit("/", 1)[-1]
+        elif tag == "tr":
+            self._flush()
+
+    def handle_data(self, data):
+        if self._stnid is not None:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        if self._stnid is not None:
+            found = _details.search("".join(self._text))
+            if found is not None:
+                modified, size, unit = found.groups()
+                self.stations[self._stnid] = (
+                    round(float(size) * _size_units[unit], 1),
+                    modified
+                )
+        self._stnid = None
+        self._text = []
+
+def parse_listing(path, chunksize=65536):
+    """Stream-parses a saved copy of the 'by_station/' index, returning a
+    dictionary of station id to (size in KB, last-modified).
+    """
+    parser = ListingParser()
+    with open(path, encoding="utf-8", errors="replace") as r:
+        for chunk in iter(lambda: r.read(chunksize), ""):
+            parser.feed(chunk)
+    parser.close()
+    return parser.stations
+
+def load_listing(path, cache=None):
+    """Returns the parsed 'by_station/' index, reusing a JSON cache of a
+    previous parse if the listing's modification time hasn't changed.
+    """
+    cache = cache if cache is not None else path + ".json"
+    mtime = os.stat(path).st_mtime
+    try:
+        with open(cache) as r:
+            cached = json.load(r)
+        if cached["mtime"] == mtime:
+            return {
+                stnid : tuple(details)
+                for stnid, details in cached["stations"].items()
+            }
+    except (OSError, ValueError, KeyError):
+        pass
+
+    stations = parse_listing(path)
+    with open(cache, "w") as w:
+        json.dump({"mtime": mtime, "stations": stations}, w)
+    return stations
+
+def apply_listing(db, stations):
+    """Records listing details in 'db' within a single transaction, updating
+    GHCNDaily.size. Returns the quantity of GHCNDaily rows updated.
+    """
+    with db:
+        db.execute("BEGIN")
+        db.execute(SCHEMA)
+        db.executemany(
+            "INSERT OR REPLACE INTO ByStation VALUES (?, ?, ?)",
+            (
+                (stnid, size, modified)
+                for stnid, (size, modified) in stations.items()
+            )
+        )
+        before = db.total_changes
+        db.executemany(
+            "UPDATE GHCNDaily SET size = ? WHERE id = ? AND size IS NOT ?",
+            (
+                (size, stnid, size)
+                for stnid, (size, modified) in stations.items()
+            )
+        )
+        return db.total_changes - before
+
+def update_sizes(listing_path, path="GHCNDaily.db.gz", cache=None):
+    """Updates station file-sizes and last-modified times in the GHCNDaily
+    database from a saved copy of the 'by_station/' index. Returns the
+    quantities of listed stations and of stations whose size changed.
+    """
+    stations = load_listing(listing_path, cache)
+    tmp = _database.extract_database(path)
+    try:
+        db = sqlite3.connect(tmp.name)
+        changed = apply_listing(db, stations)
+        db.close()
+        _database.store_database(tmp.name, path)
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+    return len(stations), changed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sizes",
+        description="Update station file-sizes in 'GHCNDaily.db.gz' from a "
+            "saved copy of the GHCN-Daily 'by_station/' directory listing."
+    )
+    parser.add_argument("listing", help="path to the saved HTML listing")
+    parser.add_argument(
+        "-o", "--output",
+        default="GHCNDaily.db.gz",
+        help="database to update (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--cache",
+        help="parsed-listing cache (default: LISTING.json)"
+    )
+    args = parser.parse_args(argv)
+
+    listed, changed = update_sizes(args.listing, args.output, args.cache)
+    print("* {} stations listed; {} size{} updated in '{}'".format(
+        listed,
+        changed,
+        "s" if changed != 1 else "",
+        args.output
+    ))
+
+if __name__ == "__main__":
+    main()
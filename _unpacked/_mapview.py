@@ -0,0 +1,479 @@
+import math
+import tkinter as tk
+
+# Cell sizes (degrees) of the clustering grids, coarsest first
+LEVELS = (16, 8, 4, 2, 1, 0.5, 0.25)
+
+# Smallest on-screen size (pixels) of a clustering cell; the grid drawn is
+#   the finest whose cells are at least this wide.
+CELL_PX = 24
+
+class ClusterIndex:
+    """Counts of points (and the sums of their coordinates) in the cells of
+    each of the LEVELS grids, so a view is drawn as one marker per occupied
+    cell at a level of detail suiting its scale. Drawing then costs the
+    quantity of cells in view rather than of points. Zoomed in past the
+    finest grid, its cells' points are drawn individually.
+
+    Each grid is built the first time a view needs it (one pass over the
+    points), so a new set of points is quick to show.
+
+    points: sequence of (latitude, longitude)
+    """
+    def __init__(self, points):
+        self.points = list(points)
+        # cell size : {(row, column) : [count, latitude sum, longitude sum,
+        #   first point]}
+        self.levels = {}
+        # (row, column) : [point, ...], of the finest grid
+        self.members = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell(self, lat, lon, level):
+        """Returns the (row, column) of a level's cell holding a point."""
+        return int((lat + 90) / level), int((lon + 180) / level)
+
+    def grid(self, level):
+        cells = self.levels.get(level)
+        if cells is not None:
+            return cells
+        cells = self.levels[level] = {}
+        get = cells.get
+        per = 1 / level
+        for i, (lat, lon) in enumerate(self.points):
+            key = (int((lat + 90) * per), int((lon + 180) * per))
+            cell = get(key)
+            if cell is None:
+                cells[key] = [1, lat, lon, i]
+            else:
+                cell[0] += 1
+                cell[1] += lat
+                cell[2] += lon
+        return cells
+
+    def level(self, scale, cell_px=CELL_PX):
+        """Returns the cell size (degrees) to cluster by at 'scale' pixels
+        per degree.
+        """
+        for level in reversed(LEVELS):
+            if level * scale >= cell_px:
+                return level
+        return LEVELS[0]
+
+    def clusters(self, south, west, north, east, scale, cell_px=CELL_PX):
+        """Returns (latitude, longitude, count, first point) for each
+        occupied cell overlapping a view, placed at the mean of its points;
+        a cell of one point is that point, exactly. Once the finest cells
+        are twice 'cell_px' wide, each point is returned alone.
+        """
+        level = self.level(scale, cell_px)
+        cells = self.grid(level)
+        (row0, col0), (row1, col1) = \
+            self.cell(south, west, level), self.cell(north, east, level)
+        rows = range(max(row0, 0), row1 + 1)
+        cols = range(max(col0, 0), col1 + 1)
+        if len(rows) * len(cols) < len(cells):
+            found = [
+                key for key in (
+                    (row, col) for row in rows for col in cols
+                )
+                if key in cells
+            ]
+        else:
+            found = [
+                key for key in cells
+                if key[0] in rows and key[1] in cols
+            ]
+        if level == LEVELS[-1] and level * scale >= 2 * cell_px:
+            if self.members is None:
+                self.members = {}
+                for i, (lat, lon) in enumerate(self.points):
+                    self.members.setdefault(
+                        self.cell(lat, lon, level),
+                        []
+                    ).append(i)
+            return [
+                self.points[i] + (1, i)
+                for key in found
+                for i in self.members[key]
+            ]
+        return [
+            (lats / count, lons / count, count, first)
+            for count, lats, lons, first in (cells[key] for key in found)
+        ]
+
+class MapView(tk.Toplevel):
+    """A window plotting stations by latitude and longitude (a plate carree
+    projection), clustered by grid cell (see ClusterIndex).
+
+    Drag to pan and scroll to zoom; the drawing is moved or scaled at once,
+    and reclustered once the view settles. Clicking a station selects it,
+    double-clicking opens it, and clicking a cluster zooms into it.
+    Shift-dragging draws a box.
+
+    on_select, on_open: called with a selected or opened Station
+    on_box: called with a drawn box as (south, west, north, east)
+    """
+    def __init__(self, parent, on_select=None, on_open=None, on_box=None):
+        super().__init__(parent)
+        self.title("Map of Results")
+        self.on_select = on_select
+        self.on_open = on_open
+        self.on_box = on_box
+
+        self.stations = []
+        self.source = None
+        self.positions = {}
+        self.index = ClusterIndex([])
+        self.selected = None
+        # the view: its centre (latitude, longitude) and pixels per degree
+        self.center = (0.0, 0.0)
+        self.scale = 2.0
+        # canvas item : (latitude, longitude, count, first station)
+        self.markers = {}
+        self.pending = None
+        self.drag = None
+        self.box = None
+
+        self.canvas = tk.Canvas(
+            self,
+            width = 720,
+            height = 400,
+            background = "white",
+            highlightthickness = 0,
+            cursor = "crosshair",
+        )
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.status = tk.Label(
+            self,
+            font = (None, 8, "normal"),
+            foreground = "gray",
+            anchor = tk.W,
+        )
+        self.status.pack(fill=tk.X)
+
+        self.canvas.bind("<Configure>", lambda event: self.schedule(0))
+        self.canvas.bind("<ButtonPress-1>", self.press)
+        self.canvas.bind("<B1-Motion>", self.motion)
+        self.canvas.bind("<ButtonRelease-1>", self.release)
+        self.canvas.bind("<Shift-ButtonPress-1>", self.box_press)
+        self.canvas.bind("<Shift-B1-Motion>", self.box_motion)
+        self.canvas.bind("<Shift-ButtonRelease-1>", self.box_release)
+        self.canvas.bind("<Double-Button-1>", self.double_click)
+        self.canvas.bind("<MouseWheel>", self.wheel)
+        self.canvas.bind("<Button-4>", self.wheel)
+        self.canvas.bind("<Button-5>", self.wheel)
+        self.canvas.bind("<Motion>", self.hover)
+
+    def destroy(self):
+        # (a redraw still pending would find the canvas gone)
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+            self.pending = None
+        super().destroy()
+
+    # Projection
+
+    def size(self):
+        return max(self.canvas.winfo_width(), 1), \
+            max(self.canvas.winfo_height(), 1)
+
+    def to_screen(self, lat, lon):
+        width, height = self.size()
+        return (
+            width / 2 + (lon - self.center[1]) * self.scale,
+            height / 2 - (lat - self.center[0]) * self.scale
+        )
+
+    def to_coords(self, x, y):
+        width, height = self.size()
+        return (
+            self.center[0] - (y - height / 2) / self.scale,
+            self.center[1] + (x - width / 2) / self.scale
+        )
+
+    def extent(self):
+        """Returns the (south, west, north, east) in view."""
+        width, height = self.size()
+        north, west = self.to_coords(0, 0)
+        south, east = self.to_coords(width, height)
+        return south, west, north, east
+
+    # Content
+
+    def set_stations(self, stations):
+        """Plots a list (or _query.ResultSet) of Station records, fitting the
+        view to them. The list given last is remembered, so passing it again
+        (say, resorted) only redraws.
+        """
+        if stations is self.source and len(stations) == len(self.stations):
+            self.schedule(0)
+            return
+        self.source = stations
+        # (a copy of a ResultSet stays an array of positions)
+        self.stations = stations.copy()
+        self.positions = {
+            station.id: i for i, station in enumerate(self.stations)
+        }
+        self.index = ClusterIndex(
+            (station.latitude, station.longitude)
+            for station in self.stations
+        )
+        self.selected = None
+        self.fit()
+
+    def fit(self):
+        """Centres the view on the stations, zoomed to show them all."""
+        if len(self.stations) == 0:
+            self.center = (0.0, 0.0)
+            self.scale = 2.0
+        else:
+            lats = [station.latitude for station in self.stations]
+            lons = [station.longitude for station in self.stations]
+            width, height = self.size()
+            self.center = (
+                (min(lats) + max(lats)) / 2,
+                (min(lons) + max(lons)) / 2
+            )
+            self.scale = min(
+                0.9 * width / max(max(lons) - min(lons), 0.1),
+                0.9 * height / max(max(lats) - min(lats), 0.1),
+                4096.0
+            )
+        self.schedule(0)
+
+    def select(self, stnid):
+        """Marks a station as selected (such as from the results list),
+        bringing it into view; None clears the selection.
+        """
+        position = self.positions.get(stnid)
+        if position == self.selected:
+            return
+        self.selected = position
+        if position is not None:
+            station = self.stations[position]
+            south, west, north, east = self.extent()
+            if not (south <= station.latitude <= north \
+            and west <= station.longitude <= east):
+                self.center = (station.latitude, station.longitude)
+        self.schedule(0)
+
+    # Drawing
+
+    def schedule(self, delay=150):
+        """Redraws after 'delay' ms, replacing any redraw already pending,
+        so a burst of pans or zooms is reclustered only once.
+        """
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+        self.pending = self.after(delay, self.redraw)
+
+    def redraw(self):
+        self.pending = None
+        canvas = self.canvas
+        canvas.delete("all")
+        self.markers = {}
+        south, west, north, east = self.extent()
+        self.draw_graticule(south, west, north, east)
+
+        clusters = self.index.clusters(south, west, north, east, self.scale)
+        for lat, lon, count, first in clusters:
+            x, y = self.to_screen(lat, lon)
+            if count == 1:
+                r = 3
+                item = canvas.create_oval(
+                    x - r, y - r, x + r, y + r,
+                    fill = "blue",
+                    outline = "",
+                    tags = ("marker",)
+                )
+            else:
+                r = min(6 + 3 * math.log10(count), 20)
+                item = canvas.create_oval(
+                    x - r, y - r, x + r, y + r,
+                    fill = "lightblue",
+                    outline = "blue",
+                    tags = ("marker",)
+                )
+                canvas.create_text(
+                    x, y,
+                    text = str(count) if count < 10000 \
+                        else "{}k".format(count // 1000),
+                    font = (None, 7, "normal"),
+                    state = tk.DISABLED,
+                )
+            self.markers[item] = (lat, lon, count, first)
+
+        if self.selected is not None:
+            station = self.stations[self.selected]
+            x, y = self.to_screen(station.latitude, station.longitude)
+            canvas.create_oval(
+                x - 7, y - 7, x + 7, y + 7,
+                outline = "red",
+                width = 2,
+                state = tk.DISABLED,
+            )
+        shown = sum(count for _, _, count, _ in clusters)
+        self.status["text"] = "{} station{} in {} marker{}".format(
+            shown,
+            "s" if shown != 1 else "",
+            len(clusters),
+            "s" if len(clusters) != 1 else ""
+        )
+
+    def draw_graticule(self, south, west, north, east):
+        """Draws parallels and meridians at a spacing suiting the scale,
+        with the equator and prime meridian darker.
+        """
+        step = next(
+            (s for s in [1, 2, 5, 10, 15, 30] if s * self.scale >= 60),
+            30
+        )
+        width, height = self.size()
+        for lat in range(
+            max(int(south // step) * step, -90),
+            min(int(north), 90) + 1,
+            step
+        ):
+            _, y = self.to_screen(lat, 0)
+            self.canvas.create_line(
+                0, y, width, y,
+                fill = "gray" if lat == 0 else "#e0e0e0",
+            )
+        for lon in range(
+            max(int(west // step) * step, -180),
+            min(int(east), 180) + 1,
+            step
+        ):
+            x, _ = self.to_screen(0, lon)
+            self.canvas.create_line(
+                x, 0, x, height,
+                fill = "gray" if lon == 0 else "#e0e0e0",
+            )
+
+    # Interaction
+
+    def marker_at(self, x, y):
+        """Returns the marker (see 'markers') under a point, or None."""
+        for item in reversed(self.canvas.find_overlapping(
+            x - 2, y - 2, x + 2, y + 2
+        )):
+            if item in self.markers:
+                return self.markers[item]
+        return None
+
+    def press(self, event):
+        self.drag = (event.x, event.y, event.x, event.y)
+
+    def motion(self, event):
+        if self.drag is None:
+            return
+        x0, y0, x, y = self.drag
+        # (moved at once; reclustered once the drag ends)
+        self.canvas.move("all", event.x - x, event.y - y)
+        self.drag = (x0, y0, event.x, event.y)
+
+    def release(self, event):
+        if self.drag is None:
+            return
+        x0, y0, _, _ = self.drag
+        self.drag = None
+        if abs(event.x - x0) + abs(event.y - y0) > 3:
+            lat, lon = self.to_coords(
+                self.size()[0] / 2 - (event.x - x0),
+                self.size()[1] / 2 - (event.y - y0)
+            )
+            self.center = (lat, lon)
+            self.schedule(0)
+            return
+        self.click(event)
+
+    def click(self, event):
+        marker = self.marker_at(event.x, event.y)
+        if marker is None:
+            return
+        lat, lon, count, first = marker
+        if count > 1:
+            # zoom into the cluster, about where it was clicked
+            self.zoom(event.x, event.y, 4)
+            return
+        self.selected = first
+        self.schedule(0)
+        if self.on_select is not None:
+            self.on_select(self.stations[first])
+
+    def double_click(self, event):
+        marker = self.marker_at(event.x, event.y)
+        if marker is not None and marker[2] == 1 \
+        and self.on_open is not None:
+            self.on_open(self.stations[marker[3]])
+
+    def wheel(self, event):
+        zoom_in = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.zoom(event.x, event.y, 1.5 if zoom_in else 1 / 1.5)
+
+    def zoom(self, x, y, factor):
+        """Zooms by 'factor' about a point of the canvas, keeping it under
+        the cursor.
+        """
+        factor = min(max(self.scale * factor, 0.5), 4096.0) / self.scale
+        lat, lon = self.to_coords(x, y)
+        self.scale *= factor
+        self.center = (
+            lat + (self.center[0] - lat) / factor,
+            lon + (self.center[1] - lon) / factor
+        )
+        # (scaled at once; reclustered once the zooming settles)
+        self.canvas.scale("all", x, y, factor, factor)
+        self.schedule()
+
+    def hover(self, event):
+        lat, lon = self.to_coords(event.x, event.y)
+        marker = self.marker_at(event.x, event.y)
+        self.status["text"] = "{:.3f}, {:.3f}{}".format(
+            lat,
+            lon,
+            "" if marker is None else "  {}".format(
+                "{} stations".format(marker[2]) if marker[2] > 1 \
+                    else "{} - {}".format(
+                        self.stations[marker[3]].id,
+                        self.stations[marker[3]].name
+                    )
+            )
+        )
+
+    def box_press(self, event):
+        self.drag = None
+        self.canvas.delete("box")
+        self.box = (event.x, event.y)
+        self.canvas.create_rectangle(
+            event.x, event.y, event.x, event.y,
+            outline = "red",
+            dash = (4, 2),
+            tags = ("box",)
+        )
+
+    def box_motion(self, event):
+        if self.box is None:
+            return
+        self.canvas.coords("box", self.box[0], self.box[1], event.x, event.y)
+
+    def box_release(self, event):
+        if self.box is None:
+            return
+        x0, y0 = self.box
+        self.box = None
+        if abs(event.x - x0) < 3 or abs(event.y - y0) < 3:
+            self.canvas.delete("box")
+            return
+        lat0, lon0 = self.to_coords(x0, y0)
+        lat1, lon1 = self.to_coords(event.x, event.y)
+        if self.on_box is not None:
+            self.on_box(
+                min(lat0, lat1),
+                min(lon0, lon1),
+                max(lat0, lat1),
+                max(lon0, lon1)
+            )
@@ -0,0 +1,447 @@
+import os
+import sys
+import csv
+import gzip
+import time
+import sqlite3
+import argparse
+import collections
+
+# The local observation store: every downloaded station's daily values in a
+#   single database, so questions across stations don't reparse files.
+#   Values are as NOAA gives them (tenths of degrees C and of mm for
+#   temperatures and precipitation); dates are YYYYMMDD integers.
+OBS_FIELDS = (
+    "station", "date", "element", "value",
+    "mflag", "qflag", "sflag", "obstime"
+)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS Observations (
+    station TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    element TEXT NOT NULL,
+    value INTEGER,
+    mflag TEXT,
+    qflag TEXT,
+    sflag TEXT,
+    obstime TEXT
+)""",
+    # Per station, element and year: the quantity of valid values (neither
+    #   missing (-9999) nor failing a quality check), and their extremes and
+    #   total. Kept in step with Observations by ingest, so value-based
+    #   searches read a few rows per station rather than every observation.
+    #   Clustered by element and year, as searches are.
+    """CREATE TABLE IF NOT EXISTS YearSummary (
+    element TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    station TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    max INTEGER,
+    min INTEGER,
+    total INTEGER,
+    PRIMARY KEY (element, year, station)
+) WITHOUT ROWID""",
+    """CREATE INDEX IF NOT EXISTS idx_summary_station
+    ON YearSummary (station)""",
+    # The file each station was last loaded from; a file whose hash matches
+    #   is skipped when ingested again
+    """CREATE TABLE IF NOT EXISTS Files (
+    station TEXT PRIMARY KEY,
+    path TEXT,
+    sha256 TEXT,
+    observations INTEGER,
+    ingested TEXT
+)""",
+    # The daily diff archives applied since (see _diff), by name
+    """CREATE TABLE IF NOT EXISTS Diffs (
+    name TEXT PRIMARY KEY,
+    inserted INTEGER,
+    updated INTEGER,
+    deleted INTEGER,
+    applied TEXT
+)""",
+]
+
+INDEXES = {
+    "idx_obs_station":
+        "CREATE INDEX IF NOT EXISTS idx_obs_station "
+        "ON Observations (station, element, date)",
+    "idx_obs_element":
+        "CREATE INDEX IF NOT EXISTS idx_obs_element "
+        "ON Observations (element, date)",
+}
+
+# Searchable statistics of an element's values over a range of years:
+#   their highest, lowest, or mean, or the percentage of days with one
+STATISTICS = ("max", "min", "mean", "completeness")
+
+# element : divisor from stored values to the units searched in. Stored
+#   values are tenths of a degree C (temperatures) or of a mm (PRCP, EVAP);
+#   elements not listed are searched as stored.
+SCALES = {
+    "PRCP": 10,
+    "TMAX": 10,
+    "TMIN": 10,
+    "TAVG": 10,
+    "TOBS": 10,
+    "MDPR": 10,
+    "EVAP": 10,
+    "AWND": 10,
+}
+
+def units(element, statistic):
+    """Names the units a statistic of an element is searched in."""
+    if statistic == "completeness":
+        return "% of days"
+    if element.upper() in ["TMAX", "TMIN", "TAVG", "TOBS"]:
+        return "deg C"
+    return "mm"
+
+IngestSummary = collections.namedtuple(
+    "IngestSummary",
+    ["loaded", "skipped", "corrupt", "observations", "seconds"]
+)
+
+def connect(path="ghcnd-obs.db"):
+    """Opens (creating, if needed) an observation store. Transactions are
+    managed explicitly (isolation_level=None).
+    """
+    db = sqlite3.connect(path, isolation_level=None)
+    # WAL lets the app read while an ingest writes
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute("PRAGMA cache_size = -65536")
+    db.execute("PRAGMA temp_store = MEMORY")
+    for statement in SCHEMA:
+        db.execute(statement)
+    for statement in INDEXES.values():
+        db.execute(statement)
+    # (a store loaded before the summaries existed)
+    if db.execute("SELECT 1 FROM YearSummary LIMIT 1").fetchone() is None \
+    and db.execute("SELECT 1 FROM Observations LIMIT 1").fetchone():
+        summarize(db)
+    return db
+
+def summarize(db):
+    """Recomputes YearSummary from Observations, as ingest would have."""
+    db.execute("BEGIN")
+    try:
+        db.execute("DELETE FROM YearSummary")
+        db.execute(
+            """INSERT INTO YearSummary
+            SELECT element, date / 10000, station, COUNT(*), MAX(value),
+                MIN(value), SUM(value)
+            FROM Observations
+            WHERE value IS NOT NULL AND value != -9999 AND qflag IS NULL
+            GROUP BY station, element, date / 10000"""
+        )
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+def attach(db, path="ghcnd-obs.db", schema="obs"):
+    """Attaches an observation store to a connection (such as one to the
+    station database) as 'schema', for summary_clause's subqueries. Raises
+    FileNotFoundError rather than creating an empty one.
+    """
+    if os.path.exists(path) is False:
+        raise FileNotFoundError(
+            "no observation store at '{}'; see 'ingest'".format(path)
+        )
+    db.execute("ATTACH DATABASE ? AS {}".format(schema), (path,))
+
+def days_in_years(first, last):
+    return sum(
+        366 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 365
+        for year in range(first, last + 1)
+    )
+
+def summary_clause(element, statistic, sign, value, first=None, last=None,
+    schema="obs"):
+    """Formulates a GHCNDaily condition (and its arguments) on a station's
+    observations, answered from the YearSummary table of an attached store
+    (see attach). Returns (clause, [arg, ...]).
+
+    element: such as TMAX or PRCP
+    statistic: one of STATISTICS, over the years from 'first' through
+        'last' (either may be None to leave that end open, except for
+        completeness)
+    sign, value: the comparison (">=" or "<=") the statistic must satisfy;
+        temperatures in degrees C, precipitation in mm (see SCALES), and
+        completeness as a percentage of days
+    Stations not in the store never match.
+    """
+    element = element.upper()
+    if statistic not in STATISTICS:
+        raise ValueError("'{}' is not one of {}".format(
+            statistic,
+            ", ".join(STATISTICS)
+        ))
+    if sign not in [">=", "<="]:
+        raise ValueError("'{}' is not one of >=, <=".format(sign))
+    where = ["element = ?"]
+    args = [element]
+    if first is not None:
+        where.append("year >= ?")
+        args.append(first)
+    if last is not None:
+        where.append("year <= ?")
+        args.append(last)
+
+    scale = SCALES.get(element, 1)
+    if statistic == "completeness":
+        if first is None or last is None:
+            raise ValueError("completeness needs both a first and last year")
+        having = "SUM(count) {} ?".format(sign)
+        args.append(value / 100 * days_in_years(first, last))
+    elif statistic == "mean":
+        having = "SUM(total) {} ? * SUM(count)".format(sign)
+        args.append(value * scale)
+    else:
+        having = "{0}({0}) {1} ?".format(statistic, sign)
+        args.append(value * scale)
+    return (
+        "id IN (SELECT station FROM {}.YearSummary WHERE {} GROUP BY station "
+        "HAVING {})".format(schema, " AND ".join(where), having),
+        args
+    )
+
+def parse_file(path):
+    """Parses a 'by_station/' '.csv.gz' into Observations rows (ordered as
+    OBS_FIELDS) and their YearSummary rows. Runs in a worker process;
+    returns (path, rows, summary rows).
+    """
+    rows = []
+    append = rows.append
+    with gzip.open(path, "rt", newline="") as r:
+        for record in csv.reader(r):
+            if len(record) < 4 or not record[1].isdigit():
+                # (a header, or a blank line)
+                continue
+            record += [""] * (8 - len(record))
+            append((
+                record[0],
+                int(record[1]),
+                record[2],
+                int(record[3]) if record[3] else None,
+                record[4] or None,
+                record[5] or None,
+                record[6] or None,
+                record[7] or None
+            ))
+    return path, rows, summary_rows(rows)
+
+def summary_rows(rows):
+    """Summarizes Observations rows into YearSummary rows (see SCHEMA)."""
+    # (element, year, station) : [count, max, min, total]
+    summaries = {}
+    for station, date, element, value, _, qflag, _, _ in rows:
+        if value is None or value == -9999 or qflag is not None:
+            continue
+        key = (element, date // 10000, station)
+        summary = summaries.get(key)
+        if summary is None:
+            summaries[key] = [1, value, value, value]
+        else:
+            summary[0] += 1
+            if value > summary[1]:
+                summary[1] = value
+            if value < summary[2]:
+                summary[2] = value
+            summary[3] += value
+    return [key + tuple(summary) for key, summary in summaries.items()]
+
+def parse_files(paths, workers=None):
+    """Parses files on a pool of processes, yielding (path, rows, summary
+    rows) in order.
+    Only a few files per worker are parsed ahead of the consumer, so memory
+    stays bounded however many files there are.
+    """
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        ahead = 2 * (workers or os.cpu_count() or 1)
+        futures = collections.deque()
+        for path in paths:
+            futures.append(pool.submit(parse_file, path))
+            if len(futures) >= ahead:
+                yield futures.popleft().result()
+        while len(futures) > 0:
+            yield futures.popleft().result()
+
+def ingest(db, paths, workers=None, batch=200000, bulk=None, progress=None):
+    """Loads downloaded station files into an observation store (see
+    connect), replacing the observations of any station loaded before from
+    a different file. Where several files of a station are given (such as
+    those saved without overwriting), the most recently modified is loaded.
+    Returns an IngestSummary.
+
+    Each file is first hashed and checked (see _verify); unchanged files
+    are skipped and corrupt ones reported. The rest are parsed (and their
+    YearSummary rows computed) on a pool of 'workers' processes, then
+    inserted from this one with executemany, in transactions of about
+    'batch' observations (ending with a file, so a station's rows and its
+    Files entry commit together).
+
+    bulk: drop the indexes while loading and build them after, which is
+        much quicker for large loads (default: when loading at least a
+        tenth as many stations as are stored)
+    progress: optional callback, given (files done, files to load)
+    """
+    import _verify
+    started = time.perf_counter()
+    known = dict(db.execute("SELECT station, sha256 FROM Files"))
+
+    # station id : Verification (of the newest file, if several are given)
+    pending = {}
+    # station id : (modification time, path) of its pending file; ties go
+    #   to the later name
+    newest = {}
+    corrupt = []
+    skipped = 0
+    for v in _verify.verify_files(paths):
+        stnid = _verify.station_id(v.path)
+        if v.ok is False:
+            corrupt.append(v)
+        elif known.get(stnid) == v.sha256:
+            skipped += 1
+        else:
+            modified = (os.path.getmtime(v.path), v.path)
+            if stnid not in newest or modified > newest[stnid]:
+                newest[stnid] = modified
+                pending[stnid] = v
+    if bulk is None:
+        bulk = len(pending) * 10 >= len(known)
+
+    db.execute("BEGIN")
+    try:
+        # (while the station index can still find them)
+        changed = [(stnid,) for stnid in pending if stnid in known]
+        db.executemany("DELETE FROM Observations WHERE station = ?", changed)
+        db.executemany("DELETE FROM YearSummary WHERE station = ?", changed)
+        db.executemany("DELETE FROM Files WHERE station = ?", changed)
+        if bulk is True and len(pending) > 0:
+            for name in INDEXES:
+                db.execute("DROP INDEX IF EXISTS {}".format(name))
+
+        by_path = {v.path: v for v in pending.values()}
+        loaded = observations = uncommitted = 0
+        for path, rows, summaries in parse_files(sorted(by_path), workers):
+            db.executemany(
+                "INSERT INTO Observations VALUES ({})".format(
+                    ", ".join("?" * len(OBS_FIELDS))
+                ),
+                rows
+            )
+            db.executemany(
+                "INSERT INTO YearSummary VALUES (?, ?, ?, ?, ?, ?, ?)",
+                summaries
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO Files VALUES (?, ?, ?, ?, ?)",
+                (
+                    _verify.station_id(path),
+                    os.path.abspath(path),
+                    by_path[path].sha256,
+                    len(rows),
+                    time.strftime("%Y-%m-%dT%H:%M:%S")
+                )
+            )
+            loaded += 1
+            observations += len(rows)
+            uncommitted += len(rows)
+            if uncommitted >= batch:
+                db.execute("COMMIT")
+                db.execute("BEGIN")
+                uncommitted = 0
+            if progress is not None:
+                progress(loaded, len(by_path))
+
+        # indexes are quicker to build once the table is populated
+        for statement in INDEXES.values():
+            db.execute(statement)
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+    return IngestSummary(
+        loaded,
+        skipped,
+        corrupt,
+        observations,
+        time.perf_counter() - started
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ingest",
+        description="Load downloaded station files into a local observation "
+            "database (SQLite), skipping files unchanged since they were "
+            "last loaded."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="'.csv.gz' files, or directories holding them"
+    )
+    parser.add_argument(
+        "--store",
+        default="ghcnd-obs.db",
+        help="observation database to load into (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes parsing files (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=200000,
+        help="observations per transaction (default: %(default)s)"
+    )
+    bulk = parser.add_mutually_exclusive_group()
+    bulk.add_argument(
+        "--bulk",
+        action="store_true",
+        default=None,
+        help="drop the indexes while loading, then rebuild them (default: "
+            "for loads of at least a tenth of the stored stations)"
+    )
+    bulk.add_argument(
+        "--no-bulk",
+        dest="bulk",
+        action="store_false",
+        help="keep the indexes while loading"
+    )
+    args = parser.parse_args(argv)
+
+    import _verify
+    paths = _verify.archive_paths(args.paths)
+    db = connect(args.store)
+    try:
+        summary = ingest(db, paths, args.workers, args.batch, args.bulk)
+    finally:
+        db.close()
+    for v in summary.corrupt:
+        print("* '{}' is corrupt, so wasn't loaded! ({})".format(
+            v.path,
+            v.error
+        ), file=sys.stderr)
+    print("* Loaded {} observations from {} file{} into '{}' in {:.2f}s "
+        "({} unchanged, {} corrupt)".format(
+            summary.observations,
+            summary.loaded,
+            "s" if summary.loaded != 1 else "",
+            args.store,
+            summary.seconds,
+            summary.skipped,
+            len(summary.corrupt)
+        ), file=sys.stderr)
+    return 1 if summary.corrupt else 0
+
+if __name__ == "__main__":
+    main()
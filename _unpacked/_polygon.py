@@ -0,0 +1,133 @@
+import re
+import json
+
+class Polygon:
+    """A region formed by one or more rings of (latitude, longitude)
+    vertices, tested with the even-odd rule; rings within another act as
+    holes, and separate rings as separate parts (as in a MultiPolygon).
+    Longitudes are taken as they are, so a region shouldn't cross the
+    antimeridian.
+
+    Point tests are pruned by the bounding box, then ray-cast against only
+    the edges spanning the point's latitude band; the edges are bucketed
+    into 'bands' bands of equal height, so complex boundaries with
+    thousands of vertices stay quick to test.
+    """
+    def __init__(self, rings, bands=None):
+        self.rings = []
+        for ring in rings:
+            ring = [(float(lat), float(lon)) for lat, lon in ring]
+            if len(ring) > 1 and ring[0] == ring[-1]:
+                ring.pop()
+            if len(ring) < 3:
+                raise ValueError("a ring needs at least 3 vertices")
+            self.rings.append(ring)
+        if len(self.rings) == 0:
+            raise ValueError("a polygon needs at least 1 ring")
+
+        lats = [lat for ring in self.rings for lat, _ in ring]
+        lons = [lon for ring in self.rings for _, lon in ring]
+        # (south, west, north, east)
+        self.bbox = (min(lats), min(lons), max(lats), max(lons))
+
+        # edges as (low lat, high lat, lon at the first, lon change per
+        #   degree lat); horizontal edges never cross a ray so are dropped
+        edges = []
+        for ring in self.rings:
+            for (lat1, lon1), (lat2, lon2) in zip(ring, ring[1:] + ring[:1]):
+                if lat1 != lat2:
+                    edges.append((
+                        min(lat1, lat2),
+                        max(lat1, lat2),
+                        lat1,
+                        lon1,
+                        (lon2 - lon1) / (lat2 - lat1)
+                    ))
+        self.edges = len(edges)
+
+        south, _, north, _ = self.bbox
+        count = bands or max(int(len(edges) ** 0.5), 1)
+        self.height = max((north - south) / count, 1e-9)
+        self.bands = [[] for _ in range(count)]
+        for edge in edges:
+            for band in range(
+                self.band(edge[0]),
+                self.band(edge[1]) + 1
+            ):
+                self.bands[band].append(edge)
+
+    def band(self, lat):
+        return min(
+            max(int((lat - self.bbox[0]) / self.height), 0),
+            len(self.bands) - 1
+        )
+
+    def contains(self, lat, lon):
+        """Returns a bool indicating if a coordinate is within the region."""
+        south, west, north, east = self.bbox
+        if not (south <= lat <= north and west <= lon <= east):
+            return False
+        inside = False
+        # cast a ray eastward, counting the edges it crosses
+        for low, high, lat1, lon1, slope in self.bands[self.band(lat)]:
+            if low <= lat < high and lon < lon1 + (lat - lat1) * slope:
+                inside = not inside
+        return inside
+
+def geojson_rings(geometry):
+    """Yields the rings, as (lat, lon) vertices, of a parsed GeoJSON object
+    (a FeatureCollection, Feature, GeometryCollection, Polygon, or
+    MultiPolygon).
+    """
+    kind = geometry.get("type")
+    if kind == "FeatureCollection":
+        for feature in geometry["features"]:
+            yield from geojson_rings(feature)
+    elif kind == "Feature":
+        if geometry.get("geometry") is not None:
+            yield from geojson_rings(geometry["geometry"])
+    elif kind == "GeometryCollection":
+        for part in geometry["geometries"]:
+            yield from geojson_rings(part)
+    elif kind == "Polygon":
+        for ring in geometry["coordinates"]:
+            yield [(lat, lon) for lon, lat in (c[:2] for c in ring)]
+    elif kind == "MultiPolygon":
+        for polygon in geometry["coordinates"]:
+            for ring in polygon:
+                yield [(lat, lon) for lon, lat in (c[:2] for c in ring)]
+
+def wkt_rings(text):
+    """Yields the rings, as (lat, lon) vertices, of a WKT POLYGON or
+    MULTIPOLYGON (whose coordinates are 'lon lat').
+    """
+    for ring in re.findall(r"\(([^()]+)\)", text):
+        yield [
+            (float(lat), float(lon))
+            for lon, lat in (
+                vertex.split()[:2] for vertex in ring.split(",")
+            )
+        ]
+
+def parse_vertices(text):
+    """Parses a single ring from text listing 'lat, lon' (or 'lat lon')
+    vertices, one or more per line.
+    """
+    numbers = [float(n) for n in re.findall(r"-?\d+(?:\.\d*)?|-?\.\d+", text)]
+    if len(numbers) % 2 != 0:
+        raise ValueError("vertices need both a latitude and a longitude")
+    return Polygon([list(zip(numbers[0::2], numbers[1::2]))])
+
+def parse_polygon(text):
+    """Parses a region given as GeoJSON, WKT, or a list of vertices."""
+    stripped = text.lstrip()
+    if stripped.startswith("{"):
+        return Polygon(list(geojson_rings(json.loads(stripped))))
+    if re.match(r"(MULTI)?POLYGON\b", stripped, flags=re.I):
+        return Polygon(list(wkt_rings(stripped)))
+    return parse_vertices(stripped)
+
+def load_polygon(path):
+    """Reads a region file of GeoJSON, WKT, or vertices (see parse_polygon)."""
+    with open(path) as r:
+        return parse_polygon(r.read())
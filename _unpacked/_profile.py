@@ -0,0 +1,100 @@
+import io
+import pstats
+import cProfile
+import functools
+
+class SessionProfiler:
+    """Profiles selected callbacks over a whole session of the app with
+    cProfile (and, optionally, tracemalloc), writing reports when 'write' is
+    called:
+
+    PREFIX.pstats: the raw profile, for pstats/snakeviz and the like
+    PREFIX.txt: the profile's top functions by cumulative time
+    PREFIX-memory.txt: the top allocation sites, and growth since the first
+        profiled callback (only with 'memory')
+    """
+    def __init__(self, prefix="ghcnd-profile", memory=False, top=40):
+        self.prefix = prefix
+        self.memory = memory
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.calls = {}
+        self.baseline = None
+        self.written = False
+        self._depth = 0
+        if memory is True:
+            import tracemalloc
+            tracemalloc.start(25)
+
+    def wrap(self, func):
+        """Returns 'func' wrapped so its calls are profiled. Calls made from
+        within another profiled call are profiled as part of it.
+        """
+        name = getattr(func, "__name__", repr(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.memory is True and self.baseline is None:
+                import tracemalloc
+                self.baseline = tracemalloc.take_snapshot()
+            self._depth += 1
+            if self._depth == 1:
+                self.profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.profile.disable()
+        return wrapper
+
+    def write(self):
+        """Writes the reports (once). Returns the paths written."""
+        if self.written is True:
+            return []
+        self.written = True
+        paths = [self.prefix + ".pstats", self.prefix + ".txt"]
+        if self.memory is True:
+            # before building the reports, which allocate themselves
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+
+        self.profile.dump_stats(paths[0])
+        summary = io.StringIO()
+        summary.write("Profiled calls: {}\n\n".format(
+            ", ".join(
+                "{} x{}".format(name, count)
+                for name, count in sorted(self.calls.items())
+            ) or "none"
+        ))
+        try:
+            stats = pstats.Stats(self.profile, stream=summary)
+            stats.sort_stats("cumulative").print_stats(self.top)
+        except TypeError:
+            # nothing was profiled
+            pass
+        with open(paths[1], "w") as w:
+            w.write(summary.getvalue())
+
+        if self.memory is True:
+            paths.append(self.prefix + "-memory.txt")
+            with open(paths[-1], "w") as w:
+                current, peak = tracemalloc.get_traced_memory()
+                w.write("Traced memory: {:.1f} KB current, {:.1f} KB peak\n".format(
+                    current / 1024,
+                    peak / 1024
+                ))
+                w.write("\nTop {} allocation sites:\n".format(self.top))
+                for stat in snapshot.statistics("lineno")[:self.top]:
+                    w.write("  {}\n".format(stat))
+                if self.baseline is not None:
+                    w.write("\nTop {} changes since the first profiled "
+                        "call:\n".format(self.top))
+                    for stat in snapshot.compare_to(
+                        self.baseline,
+                        "lineno"
+                    )[:self.top]:
+                        w.write("  {}\n".format(stat))
+            tracemalloc.stop()
+        return paths
@@ -0,0 +1,392 @@
+import re
+import math
+import array
+import functools
+from _database import ELEMENTS
+
+@functools.lru_cache(maxsize=32)
+def compile_pattern(pattern):
+    """Compiles a (case-insensitive) pattern once, on its first use."""
+    return re.compile(r'{}'.format(pattern), flags=re.I)
+
+def REGEXP(pattern, string):
+    """SQLite3 Regular Expression function. Returns a bool indicating
+    any matches for a Regular Expression.
+    """
+    return bool(compile_pattern(pattern).search(r'{}'.format(string)))
+
+def IN_BBOX(test_lat, test_lon, _lat1, _lon1, _lat2, _lon2):
+    """SQLite3 function that tests whether or not a given coordinate is
+    contained within a bounding box formed by two other coordinates.
+    Returns a bool reflecting the answer.
+    """
+    if min([_lat1, _lat2]) <= test_lat <= max([_lat1, _lat2]) \
+    and min([_lon1, _lon2]) <= test_lon <= max([_lon1, _lon2]):
+        return True
+    else:
+        return False
+
+def register_functions(db, wrap=None, polygon=None):
+    """Registers the custom functions used by queries on a connection.
+    'wrap', if given, is called as wrap(name, function) and its return
+    registered in place of each function (for instrumentation). 'polygon',
+    if given, is registered as IN_POLYGON(latitude, longitude).
+    """
+    functions = [
+        ("REGEXP", 2, REGEXP),
+        ("IN_BBOX", 6, IN_BBOX),
+    ]
+    if polygon is not None:
+        functions.append(("IN_POLYGON", 2, polygon.contains))
+    for name, nargs, func in functions:
+        db.create_function(
+            name,
+            nargs,
+            wrap(name, func) if wrap is not None else func
+        )
+
+def build_clauses(desc=None, country=None, lat1=None, lat1_sign=">=",
+    lon1=None, lon1_sign="<=", lat2=None, lon2=None, bbox=False, elev=None,
+    elev_sign="<=", coverage=None, polygon=None, observations=None,
+    polygon_function="IN_POLYGON"):
+    """Formulates the conditions (and their arguments) of a query on the
+    GHCNDaily table, returning ([clause, ...], [arg, ...]); a row matches
+    when every clause holds. Every filter is optional; those left as None
+    are not applied.
+
+    desc: regular expression matched (case-insensitively) against the name
+    country: a country or state abbreviation
+    lat1, lon1: with bbox False, half-plane filters applied per their sign
+    lat1, lon1, lat2, lon2: with bbox True, corners of a bounding box
+    elev: elevation (m) filter applied per its sign. Stations with unknown
+        elevation (-999.9) never match.
+    coverage: sequence of (element, first year, last year); stations match
+        if their period-of-record for each element (one of
+        _database.ELEMENTS) spans those years. Either year may be None to
+        leave that end open (both None requires any data at all). These are
+        answered from the element's indexes rather than by a full scan.
+    polygon: a _polygon.Polygon; only stations within its region match.
+        Candidates are first narrowed to its bounding box by the latitude
+        and longitude indexes, then tested by the SQLite function named
+        'polygon_function' (see register_functions).
+    observations: sequence of (element, statistic, sign, value, first year,
+        last year) filters on the stations' observations (see
+        _obsstore.summary_clause); these need an observation store attached
+        as 'obs' (see _obsstore.attach).
+    """
+    clauses = []
+    args = []
+
+    if desc is not None:
+        clauses.append("name REGEXP ?")
+        args.append(desc)
+
+    if country is not None:
+        clauses.append("(country = ? OR state = ?)")
+        args.extend([country, country])
+
+    if bbox is True:
+        if all(c is not None for c in [lat1, lon1, lat2, lon2]):
+            clauses.append("IN_BBOX(latitude, longitude, ?, ?, ?, ?)")
+            args.extend([lat1, lon1, lat2, lon2])
+    else:
+        if lat1 is not None:
+            clauses.append("latitude {} ?".format(lat1_sign))
+            args.append(lat1)
+        if lon1 is not None:
+            clauses.append("longitude {} ?".format(lon1_sign))
+            args.append(lon1)
+
+    if elev is not None:
+        if elev_sign == "<=":
+            clauses.append("(elevation > -999 AND elevation <= ?)")
+        else:
+            clauses.append("elevation {} ?".format(elev_sign))
+        args.append(elev)
+
+    for element, first, last in (coverage or []):
+        if element.upper() not in ELEMENTS:
+            raise ValueError(
+                "'{}' is not one of {}".format(element, ", ".join(ELEMENTS))
+            )
+        column = element.lower()
+        if first is None and last is None:
+            clauses.append("{}_start IS NOT NULL".format(column))
+        if first is not None:
+            clauses.append("{}_start <= ?".format(column))
+            args.append(first)
+        if last is not None:
+            clauses.append("{}_end >= ?".format(column))
+            args.append(last)
+
+    if polygon is not None:
+        south, west, north, east = polygon.bbox
+        clauses.append("latitude BETWEEN ? AND ?")
+        clauses.append("longitude BETWEEN ? AND ?")
+        clauses.append("{}(latitude, longitude)".format(polygon_function))
+        args.extend([south, north, west, east])
+
+    if observations:
+        # imported on first use to keep app startup light
+        import _obsstore
+        for observation in observations:
+            clause, clause_args = _obsstore.summary_clause(*observation)
+            clauses.append(clause)
+            args.extend(clause_args)
+
+    return clauses, args
+
+def has_filters(desc=None, country=None, lat1=None, lon1=None, lat2=None,
+    lon2=None, bbox=False, elev=None, coverage=None, polygon=None,
+    observations=None, **signs):
+    """Returns a bool indicating if build_clauses criteria narrow the
+    stations at all; otherwise every station matches. A bounding box only
+    counts once all four of its corners are given.
+    """
+    if bbox is True:
+        coordinates = None not in [lat1, lon1, lat2, lon2]
+    else:
+        coordinates = lat1 is not None or lon1 is not None
+    return coordinates or bool(coverage) or bool(observations) or any(
+        value is not None for value in [desc, country, elev, polygon]
+    )
+
+def build_query(columns="*", **criteria):
+    """Formulates the statement (and its arguments) for a query on the
+    GHCNDaily table, selecting 'columns'. See build_clauses for the accepted
+    criteria.
+    """
+    clauses, args = build_clauses(**criteria)
+    exec_statement = "SELECT {} FROM GHCNDaily".format(columns) + (
+        " WHERE " + " AND ".join(clauses) if len(clauses) > 0 else ""
+    )
+    return exec_statement, args
+
+def execute_query(db, wrap=None, columns="*", **criteria):
+    """Runs a query (see build_query for the accepted criteria) on an open
+    connection, returning the cursor of matching GHCNDaily rows. 'wrap' is
+    passed along to register_functions.
+    """
+    register_functions(db, wrap, criteria.get("polygon"))
+    exec_statement, args = build_query(columns, **criteria)
+
+    # *** DEBUG ***
+    # print("---", exec_statement, "---", args, sep="\n")
+
+    return db.execute(exec_statement, args)
+
+def batch_query(db, queries, wrap=None):
+    """Runs several queries (each a dictionary of build_clauses criteria) in
+    a single pass over the GHCNDaily table, returning a cursor of the rows
+    matching any of them. Each row is followed by a flag per query (1 if it
+    matches that query, otherwise 0).
+    """
+    register_functions(db, wrap)
+    tags = []
+    conditions = []
+    tag_args = []
+    condition_args = []
+    for n, criteria in enumerate(queries):
+        # each query's region gets a function of its own
+        polygon_function = "IN_POLYGON_{}".format(n)
+        if criteria.get("polygon") is not None:
+            contains = criteria["polygon"].contains
+            db.create_function(
+                polygon_function,
+                2,
+                wrap(polygon_function, contains) if wrap is not None \
+                    else contains
+            )
+        clauses, args = build_clauses(
+            polygon_function=polygon_function,
+            **criteria
+        )
+        condition = "({})".format(" AND ".join(clauses)) \
+            if len(clauses) > 0 else "1"
+        tags.append("{} AS q{}".format(condition, n))
+        conditions.append(condition)
+        tag_args.extend(args)
+        condition_args.extend(args)
+
+    # The conditions are only evaluated again (for the flags) on matching
+    #   rows; SQLite stops at the first condition a row meets otherwise.
+    exec_statement = "SELECT *, {} FROM GHCNDaily WHERE {}".format(
+        ", ".join(tags),
+        " OR ".join(conditions)
+    )
+    return db.execute(exec_statement, tag_args + condition_args)
+
+class StationTable:
+    """Every loaded Station in a fixed order, so a station can be referred
+    to by its position (see ResultSet).
+
+    stations: dictionary of station id to Station
+    """
+    def __init__(self, stations):
+        self.stations = list(stations.values())
+        self.positions = {
+            station.id: i for i, station in enumerate(self.stations)
+        }
+
+    def __len__(self):
+        return len(self.stations)
+
+class ResultSet:
+    """The stations a query matched, kept as an array of positions in a
+    StationTable (a few bytes each) rather than a list of records. A
+    Station is looked up only as it's indexed or iterated, and the order
+    is that of the array, so sorting rearranges integers alone.
+    """
+    def __init__(self, table, rows=()):
+        self.table = table
+        self.rows = rows if isinstance(rows, array.array) \
+            else array.array("i", rows)
+
+    @classmethod
+    def from_ids(cls, table, stnids):
+        return cls(table, (table.positions[stnid] for stnid in stnids))
+
+    @classmethod
+    def from_cursor(cls, table, cursor, batch=4096):
+        """Collects the station ids (each row's first column) of a query's
+        cursor, 'batch' rows at a time, so the rows are never all held at
+        once. Best run on a query selecting only the id column.
+        """
+        rows = array.array("i")
+        positions = table.positions
+        while True:
+            fetched = cursor.fetchmany(batch)
+            if len(fetched) == 0:
+                break
+            rows.extend(positions[row[0]] for row in fetched)
+        return cls(table, rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.table.stations[row] for row in self.rows[i]]
+        return self.table.stations[self.rows[i]]
+
+    def __iter__(self):
+        stations = self.table.stations
+        return (stations[row] for row in self.rows)
+
+    def ids(self):
+        return (station.id for station in self)
+
+    def index(self, stnid):
+        """Returns where a station is among the results; ValueError if it
+        isn't one of them.
+        """
+        if stnid not in self.table.positions:
+            raise ValueError("{} isn't among the results".format(stnid))
+        return self.rows.index(self.table.positions[stnid])
+
+    def sort(self, key=None, reverse=False):
+        """Orders the results as list.sort would, 'key' being given the
+        Station records.
+        """
+        stations = self.table.stations
+        self.rows = array.array("i", sorted(
+            self.rows,
+            key=(lambda row: key(stations[row])) if key is not None \
+                else None,
+            reverse=reverse
+        ))
+
+    def copy(self):
+        return ResultSet(self.table, array.array("i", self.rows))
+
+def sort_key(method, distances=None):
+    """Returns a key function for sorting Station records by attribute, or
+    by "distance" using a dictionary of station id to distance (falling back
+    to id when there are none; stations without one sort last).
+    """
+    if method == "distance":
+        if not distances:
+            return sort_key("id")
+        return lambda site: distances.get(site.id, math.inf)
+    if method == "state":
+        return lambda site: str(getattr(site, method))
+    return lambda site: getattr(site, method)
+
+def distance_label(distance=None):
+    """Formats a distance (km) from a proximity query's coordinate as it's
+    appended to a station's label ("" for None).
+    """
+    return " - {:.1f} km".format(distance) if distance is not None else ""
+
+def station_label(station, distance=None):
+    """Formats a Station record as it's listed among search results, with
+    its distance (km) from a proximity query's coordinate if given.
+    """
+    return "{} - {}{} - {}{}".format(
+        station.id,
+        "{} - ".format(station.state) \
+            if station.state is not None else "",
+        station.name,
+        station.size,
+        distance_label(distance)
+    )
+
+def station_info(station):
+    """Formats a Station record's details as shown by the 'View Station
+    Info' dialog.
+    """
+    import _countries
+    lines = [
+        "ID: {}".format(station.id),
+        "Name: {}".format(station.name),
+        "Country: {} ({})".format(
+            station.country,
+            _countries.dictionary.get(station.country, "?")
+        ),
+    ]
+    if station.state is not None:
+        lines.append("State: {} ({})".format(
+            station.state,
+            _countries.states.get(station.state, "?")
+        ))
+    lines.extend([
+        "Latitude: {}".format(station.latitude),
+        "Longitude: {}".format(station.longitude),
+        "Elevation: {}".format(
+            "{}m ({}ft)".format(
+                station.elevation,
+                round(station.elevation * 3.28, 1)
+            ) if station.elevation > -999 else "N/A"
+        ),
+        "",
+        "GCOS Surface Network?: {}".format("Y" if station.gsn else "N"),
+        "HCN/CRN Network?: {}".format("Y" if station.hcn_crn else "N"),
+        "WMO Id: {}".format(station.wmo_id),
+        "",
+        "Size (in KB): {}".format(station.size),
+        "",
+        "Data-Ranges",
+        "-----------",
+    ])
+    for element in ELEMENTS:
+        lines.append("{}: {}-{}".format(
+            element,
+            getattr(station, element.lower() + "_start"),
+            getattr(station, element.lower() + "_end")
+        ))
+    return "\n".join(lines) + "\n"
+
+class StationText(dict):
+    """Display strings of stations by station id, each formatted (by
+    'formatter', given the Station) on its first use and kept thereafter.
+
+    stations: dictionary of station id to Station
+    """
+    def __init__(self, stations, formatter=station_label):
+        super().__init__()
+        self.stations = stations
+        self.formatter = formatter
+
+    def __missing__(self, stnid):
+        text = self[stnid] = self.formatter(self.stations[stnid])
+        return text
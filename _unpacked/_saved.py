@@ -0,0 +1,191 @@
+import collections
+import _database
+import _obsstore
+import _polygon
+import _query
+import _spatial
+
+# Saved queries are kept in 'ghcnd.ini' as sections named 'query:NAME',
+#   alongside the settings in [DEFAULT]. A query's 'spec' is a dictionary of
+#   '_query.build_clauses' criteria plus the proximity keys 'near' ((lat,
+#   lon)), 'count', and 'radius', with 'polygon' holding the path of a region
+#   file rather than the region itself.
+PREFIX = "query:"
+
+# key : type of value in a spec
+KEYS = collections.OrderedDict([
+    ("desc", str),
+    ("country", str),
+    ("lat1", float),
+    ("lat1_sign", str),
+    ("lon1", float),
+    ("lon1_sign", str),
+    ("lat2", float),
+    ("lon2", float),
+    ("bbox", bool),
+    ("elev", float),
+    ("elev_sign", str),
+    ("coverage", list),
+    ("observations", list),
+    ("polygon", str),
+    ("near", tuple),
+    ("count", int),
+    ("radius", float),
+])
+
+# list key : type of each field of its items. Lists are saved as items
+#   separated by ';', and their fields by spaces ('-' for None).
+ITEMS = {
+    "coverage": (str.upper, int, int),
+    "observations": (str.upper, str.lower, str, float, int, int),
+}
+
+def number(value):
+    """Formats a number for saving; whole numbers without a fraction."""
+    return "{:g}".format(value) if isinstance(value, float) else str(value)
+
+def to_section(spec):
+    """Converts a query spec to the string values of its ini section."""
+    section = collections.OrderedDict()
+    for key, kind in KEYS.items():
+        value = spec.get(key)
+        if value is None or value is False:
+            continue
+        # comparisons are only kept along with their values
+        if key.endswith("_sign") and spec.get(key[:-len("_sign")]) is None:
+            continue
+        if kind is list:
+            value = "; ".join(
+                " ".join("-" if v is None else number(v) for v in item)
+                for item in value
+            )
+        elif kind is tuple:
+            value = " ".join(number(v) for v in value)
+        elif kind is bool:
+            value = "true"
+        else:
+            value = number(value)
+        # (configparser interpolates '%')
+        section[key] = value.replace("%", "%%")
+    return section
+
+def from_section(section):
+    """Converts an ini section (or any mapping of strings) to a query spec.
+    Keys besides those in KEYS (like the [DEFAULT] settings every section
+    inherits) are ignored.
+    """
+    spec = {}
+    for key, kind in KEYS.items():
+        value = section.get(key)
+        if value is None or value == "":
+            continue
+        if kind is list:
+            spec[key] = [
+                tuple(
+                    None if v == "-" else convert(v)
+                    for convert, v in zip(ITEMS[key], item.split())
+                )
+                for item in value.split(";")
+            ]
+        elif kind is tuple:
+            spec[key] = tuple(float(v) for v in value.split())
+        elif kind is bool:
+            spec[key] = value.lower() in ["true", "1", "yes", "on"]
+        else:
+            spec[key] = kind(value)
+    return spec
+
+def saved_names(config):
+    """Returns the names of the queries saved in a ConfigParser."""
+    return [
+        section[len(PREFIX):]
+        for section in config.sections()
+        if section.startswith(PREFIX)
+    ]
+
+def save_query(config, name, spec):
+    """Saves (or replaces) a named query in a ConfigParser."""
+    if name == "" or "]" in name or "\n" in name:
+        raise ValueError("'{}' can't be used as a query name".format(name))
+    config[PREFIX + name] = to_section(spec)
+
+def load_query(config, name):
+    """Returns the spec of a named query saved in a ConfigParser."""
+    return from_section(config[PREFIX + name])
+
+def delete_query(config, name):
+    config.remove_section(PREFIX + name)
+
+def resolve(spec):
+    """Splits a spec into '_query.build_clauses' criteria (with any region
+    file loaded) and '_spatial.SpatialIndex.nearest' arguments (or None).
+    """
+    criteria = {
+        key: spec[key]
+        for key in KEYS
+        if key in spec and key not in ["polygon", "near", "count", "radius"]
+    }
+    if spec.get("polygon") is not None:
+        criteria["polygon"] = _polygon.load_polygon(spec["polygon"])
+    proximity = None
+    if spec.get("near") is not None:
+        proximity = {
+            "lat": spec["near"][0],
+            "lon": spec["near"][1],
+            "count": spec.get("count"),
+            "radius": spec.get("radius"),
+        }
+    return criteria, proximity
+
+def run_batch(db, specs, wrap=None, store="ghcnd-obs.db"):
+    """Runs named query specs ({name: spec}, in order) together in a single
+    pass over the database (see '_query.batch_query'), then applies any
+    proximity limits per query. Returns an OrderedDict of name to (list of
+    Station, dictionary of station id to distance or None). The observation
+    store is attached if any query filters on observations.
+    """
+    names = list(specs)
+    resolved = [resolve(specs[name]) for name in names]
+    if any(criteria.get("observations") for criteria, _ in resolved):
+        _obsstore.attach(db, store)
+    matches = collections.OrderedDict((name, []) for name in names)
+    width = len(_database.FIELDS)
+    for row in _query.batch_query(db, [c for c, _ in resolved], wrap):
+        station = _database.Station(*row[:width])
+        for name, flag in zip(names, row[width:]):
+            if flag:
+                matches[name].append(station)
+
+    results = collections.OrderedDict()
+    for name, (_, proximity) in zip(names, resolved):
+        stations = matches[name]
+        distances = None
+        if proximity is not None:
+            nearest = _spatial.SpatialIndex.from_stations(stations).nearest(
+                **proximity
+            )
+            by_id = {station.id: station for station in stations}
+            stations = [by_id[stnid] for _, stnid in nearest]
+            distances = {stnid: km for km, stnid in nearest}
+        results[name] = (stations, distances)
+    return results
+
+def merge_batch(results):
+    """Merges the results of 'run_batch' into a list of the station ids
+    matching any query (each once, in order) and a dictionary of station id
+    to its least distance. The distances are only kept if every station has
+    one, i.e. each query was a proximity query; otherwise it's empty.
+    """
+    stnids = []
+    seen = set()
+    nearest = {}
+    for stations, distances in results.values():
+        for station in stations:
+            if station.id not in seen:
+                seen.add(station.id)
+                stnids.append(station.id)
+        for stnid, km in (distances or {}).items():
+            nearest[stnid] = min(km, nearest.get(stnid, km))
+    if len(nearest) < len(stnids):
+        return stnids, {}
+    return stnids, nearest
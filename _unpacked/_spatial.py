@@ -0,0 +1,154 @@
+import math
+import heapq
+
+# mean radius of the Earth (km)
+EARTH_RADIUS = 6371.0088
+
+def unit_vector(lat, lon):
+    """Returns the (x, y, z) unit vector of a coordinate on the sphere."""
+    lat = math.radians(lat)
+    lon = math.radians(lon)
+    coslat = math.cos(lat)
+    return (coslat * math.cos(lon), coslat * math.sin(lon), math.sin(lat))
+
+def great_circle(lat1, lon1, lat2, lon2):
+    """Returns the great-circle (haversine) distance (km) between two
+    coordinates.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 \
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(math.sqrt(a), 1))
+
+def chord_to_km(chord2):
+    """Converts a squared chord length between unit vectors to a great-circle
+    distance (km).
+    """
+    return 2 * EARTH_RADIUS * math.asin(min(math.sqrt(chord2) / 2, 1))
+
+def km_to_chord(km):
+    """Converts a great-circle distance (km) to the squared chord length
+    between unit vectors. Chord length increases with distance, so nearness
+    can be compared by chords alone.
+    """
+    return (2 * math.sin(min(km / EARTH_RADIUS, math.pi) / 2)) ** 2
+
+class SpatialIndex:
+    """A k-d tree over the 3D unit vectors of station coordinates, answering
+    great-circle nearest-neighbour and radius queries without any special
+    handling of the poles or the antimeridian.
+
+    points: iterable of (key, latitude, longitude)
+    leafsize: most points held in a leaf; leaves are scanned directly
+    """
+    def __init__(self, points, leafsize=16):
+        self.keys = []
+        self.axes = ([], [], [])
+        for key, lat, lon in points:
+            self.keys.append(key)
+            for axis, value in zip(self.axes, unit_vector(lat, lon)):
+                axis.append(value)
+        self.position = {key: i for i, key in enumerate(self.keys)}
+        self.leafsize = leafsize
+        self.root = self._build(list(range(len(self.keys)))) \
+            if len(self.keys) > 0 else None
+
+    @classmethod
+    def from_stations(cls, stations):
+        """Builds an index of Station records, keyed by station id."""
+        return cls(
+            (station.id, station.latitude, station.longitude)
+            for station in stations
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self, indexes):
+        # nodes are (axis, split, below, above); leaves (None, None, indexes,
+        #   None). Each split is made along the axis of widest spread.
+        if len(indexes) <= self.leafsize:
+            return (None, None, indexes, None)
+        spreads = []
+        for values in self.axes:
+            column = list(map(values.__getitem__, indexes))
+            spreads.append(max(column) - min(column))
+        axis = spreads.index(max(spreads))
+        indexes.sort(key=self.axes[axis].__getitem__)
+        middle = len(indexes) // 2
+        return (
+            axis,
+            self.axes[axis][indexes[middle]],
+            self._build(indexes[:middle]),
+            self._build(indexes[middle:])
+        )
+
+    def nearest(self, lat, lon, count=None, radius=None, among=None):
+        """Returns [(distance (km), key), ...] nearest-first for the 'count'
+        points closest to a coordinate, limited to those within 'radius' km.
+        Either may be None (though not both) for no limit; given, each must
+        be positive.
+
+        among: optional set of keys; only these are considered. Small sets
+            are searched directly rather than through the tree.
+        """
+        if count is None and radius is None:
+            raise ValueError("a count or radius is required")
+        if count is not None and count < 1:
+            raise ValueError("the count must be at least 1")
+        if radius is not None and radius <= 0:
+            raise ValueError("the radius must be positive")
+        qx, qy, qz = unit_vector(lat, lon)
+        xs, ys, zs = self.axes
+        keys = self.keys
+        # (squared chords are at most 4)
+        limit = km_to_chord(radius) if radius is not None else 4.0
+        found = []
+
+        def consider(d2, i):
+            nonlocal limit
+            if count is None:
+                found.append((d2, i))
+            elif len(found) < count:
+                heapq.heappush(found, (-d2, i))
+                if len(found) == count:
+                    limit = min(limit, -found[0][0])
+            else:
+                heapq.heappushpop(found, (-d2, i))
+                limit = min(limit, -found[0][0])
+
+        if among is not None and len(among) * 8 < len(keys):
+            for key in among:
+                i = self.position.get(key)
+                if i is None:
+                    continue
+                d2 = (xs[i] - qx) ** 2 + (ys[i] - qy) ** 2 + (zs[i] - qz) ** 2
+                if d2 <= limit:
+                    consider(d2, i)
+        elif self.root is not None:
+            query = (qx, qy, qz)
+
+            def visit(node):
+                axis, split, below, above = node
+                if axis is None:
+                    for i in below:
+                        d2 = (xs[i] - qx) ** 2 + (ys[i] - qy) ** 2 \
+                            + (zs[i] - qz) ** 2
+                        if d2 <= limit \
+                        and (among is None or keys[i] in among):
+                            consider(d2, i)
+                    return
+                diff = query[axis] - split
+                near, far = (below, above) if diff < 0 else (above, below)
+                visit(near)
+                # the far side can only hold closer points if the splitting
+                #   plane is nearer than the current limit
+                if diff * diff <= limit:
+                    visit(far)
+
+            visit(self.root)
+
+        if count is not None:
+            found = [(-d2, i) for d2, i in found]
+        found.sort()
+        return [(chord_to_km(d2), keys[i]) for d2, i in found]
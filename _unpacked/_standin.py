@@ -0,0 +1,125 @@
+import gzip
+import time
+import random
+import threading
+import socketserver
+import http.server
+
+def station_payload(stnid, size_kb=4):
+    """Returns deterministic gzip content of roughly 'size_kb' KB for a
+    station, resembling a 'by_station/' file.
+    """
+    rng = random.Random(stnid)
+    # ~6 bytes of compressed output per generated line
+    count = max(int(size_kb * 1024 / 6), 1)
+    values = rng.getrandbits(8 * count).to_bytes(count, "little")
+    elements = ["PRCP", "SNOW", "SNWD", "TMAX", "TMIN"]
+    text = "".join([
+        "{},{:04d}{:02d}{:02d},{},{},,,S,\n".format(
+            stnid,
+            1900 + i // 1825,
+            i // 155 % 12 + 1,
+            i // 5 % 28 + 1,
+            elements[i % 5],
+            value - 128
+        )
+        for i, value in enumerate(values)
+    ])
+    return gzip.compress(text.encode())
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # hundreds of clients may connect at once (see _asyncdownload)
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # clients giving up mid-transfer (timeouts) are expected
+        pass
+
+class StandInServer:
+    """A local HTTP stand-in for the 'by_station/' directory, serving
+    generated files for any 'XXXXXXXXXXX.csv.gz' path. Use as a context
+    manager; 'base_url' can then be passed wherever downloads happen.
+
+    sizes: optional dictionary of station id to file-size (KB)
+    latency: seconds to wait before responding to each request
+    error_rate: fraction of requests answered with '503 Service Unavailable'
+    corrupt_rate: fraction of files served truncated (but otherwise '200
+        OK'), as a dropped transfer would leave them
+    """
+    def __init__(self, sizes=None, default_kb=4, latency=0, error_rate=0,
+        corrupt_rate=0):
+        self.sizes = sizes if sizes is not None else {}
+        self.default_kb = default_kb
+        self.latency = latency
+        self.error_rate = error_rate
+        self.corrupt_rate = corrupt_rate
+        self.requests = 0
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def payload(self, stnid):
+        with self._lock:
+            if stnid not in self._payloads:
+                self._payloads[stnid] = station_payload(
+                    stnid,
+                    self.sizes.get(stnid, self.default_kb)
+                )
+            return self._payloads[stnid]
+
+    def prepare(self, stnids):
+        """Generates the files for 'stnids' ahead of time, so that serving
+        them measures transfer alone.
+        """
+        for stnid in stnids:
+            self.payload(stnid)
+
+    def __enter__(self):
+        standin = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests += 1
+                if standin.latency > 0:
+                    time.sleep(standin.latency)
+                name = self.path.rsplit("/", 1)[-1]
+                if not name.endswith(".csv.gz"):
+                    self.send_error(404)
+                    return
+                if standin.error_rate > 0 \
+                and random.random() < standin.error_rate:
+                    self.send_error(503)
+                    return
+                body = standin.payload(name[:-len(".csv.gz")])
+                if standin.corrupt_rate > 0 \
+                and random.random() < standin.corrupt_rate:
+                    body = body[:len(body) * 3 // 4]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            daemon=True
+        )
+        self.thread.start()
+        self.base_url = "http://127.0.0.1:{}/".format(
+            self.server.server_address[1]
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
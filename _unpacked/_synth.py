@@ -0,0 +1,195 @@
+import bisect
+import random
+import itertools
+import argparse
+import _database
+
+# (country, share of stations, latitude range, longitude range, states).
+#   Shares loosely follow the real GHCN-Daily station counts, which are
+#   dominated by the US (largely precipitation-only networks). States are
+#   (code, latitude, longitude, spread), their towns scattered about that
+#   rough centre by 'spread' degrees, so a state's stations lie within it.
+COUNTRIES = [
+    ("US", 0.63, (25, 49), (-124, -67), [
+        ("AL", 32.8, -86.8, 1.2), ("AZ", 34.2, -111.7, 1.6),
+        ("AR", 34.9, -92.4, 1.2), ("CA", 37.2, -119.5, 2.2),
+        ("CO", 39.0, -105.5, 1.5), ("CT", 41.6, -72.7, 0.3),
+        ("DE", 39.0, -75.5, 0.2), ("FL", 28.6, -82.4, 1.5),
+        ("GA", 32.7, -83.4, 1.2), ("ID", 44.4, -114.6, 1.5),
+        ("IL", 40.0, -89.2, 1.2), ("IN", 39.9, -86.3, 0.9),
+        ("IA", 42.1, -93.5, 1.2), ("KS", 38.5, -98.4, 1.5),
+        ("KY", 37.5, -85.3, 1.2), ("LA", 31.1, -92.0, 1.1),
+        ("ME", 45.4, -69.2, 1.0), ("MD", 39.0, -76.8, 0.5),
+        ("MA", 42.3, -71.8, 0.5), ("MI", 44.3, -85.4, 1.3),
+        ("MN", 46.3, -94.3, 1.5), ("MS", 32.7, -89.7, 1.1),
+        ("MO", 38.4, -92.5, 1.3), ("MT", 47.0, -109.6, 2.0),
+        ("NE", 41.5, -99.8, 1.5), ("NV", 39.3, -116.6, 1.7),
+        ("NH", 43.7, -71.6, 0.5), ("NJ", 40.2, -74.7, 0.4),
+        ("NM", 34.4, -106.1, 1.5), ("NY", 42.9, -75.5, 1.1),
+        ("NC", 35.5, -79.4, 1.1), ("ND", 47.5, -100.5, 1.3),
+        ("OH", 40.3, -82.8, 1.0), ("OK", 35.6, -97.5, 1.3),
+        ("OR", 43.9, -120.6, 1.6), ("PA", 40.9, -77.8, 1.0),
+        ("RI", 41.7, -71.5, 0.2), ("SC", 33.9, -80.9, 0.8),
+        ("SD", 44.4, -100.2, 1.3), ("TN", 35.9, -86.4, 1.0),
+        ("TX", 31.5, -99.3, 2.5), ("UT", 39.3, -111.7, 1.4),
+        ("VT", 44.1, -72.7, 0.4), ("VA", 37.5, -78.8, 1.0),
+        ("WA", 47.4, -120.5, 1.3), ("WV", 38.6, -80.6, 0.7),
+        ("WI", 44.6, -89.9, 1.1), ("WY", 43.0, -107.5, 1.5),
+    ]),
+    ("AS", 0.15, (-43, -11), (113, 153), None),
+    ("CA", 0.07, (42, 70), (-140, -53), [
+        ("AB", 54.5, -115.0, 2.5), ("BC", 53.7, -124.8, 3.0),
+        ("MB", 53.8, -98.8, 2.5), ("NB", 46.5, -66.2, 0.8),
+        ("NL", 52.0, -59.0, 2.5), ("NS", 45.0, -63.0, 0.8),
+        ("NT", 63.0, -118.0, 3.5), ("NU", 66.0, -90.0, 4.0),
+        ("ON", 47.0, -83.0, 3.0), ("PE", 46.3, -63.2, 0.3),
+        ("QC", 50.0, -72.0, 3.0), ("SK", 54.0, -106.0, 2.5),
+        ("YT", 63.5, -135.5, 2.0),
+    ]),
+    ("BR", 0.05, (-33, 5), (-73, -35), None),
+    ("MX", 0.03, (15, 32), (-117, -87), None),
+    ("IN", 0.02, (8, 34), (68, 97), None),
+    ("RS", 0.02, (42, 77), (28, 179), None),
+    ("GM", 0.02, (47, 55), (6, 15), None),
+    ("SF", 0.01, (-34, -22), (17, 32), None),
+]
+
+_syllables = [
+    "AB", "AL", "AN", "AR", "ASH", "BEL", "BER", "BRO", "BUR", "CAR", "CHE",
+    "CLA", "DAL", "DEN", "DOR", "EL", "FAIR", "FOR", "GLEN", "GRA", "HAM",
+    "HAR", "HIL", "KEN", "LA", "LIN", "MAR", "MIL", "MON", "NEW", "NOR",
+    "OAK", "PAR", "PINE", "RICH", "RID", "ROCK", "SAL", "SAN", "SPR", "STA",
+    "TON", "VAL", "VIL", "WAL", "WES", "WIL", "WOOD",
+]
+_suffixes = [
+    "", "", "", "", " AP", " INTL AP", " RGNL AP", " 2 SE", " 3.1 NNW",
+    " 1.5 E", " EXP STN", " DAM", " RANGER STN", " CITY", " AIRPORT",
+]
+
+def synthetic_name(rng):
+    return "".join(
+        rng.choice(_syllables)
+        for _ in range(rng.randint(2, 3))
+    ) + rng.choice(_suffixes)
+
+def synthetic_rows(count, seed=0, last_year=2022):
+    """Yields 'count' GHCNDaily rows (ordered as _database.FIELDS) with
+    plausible distributions of names, countries, states, coordinates,
+    elevations, data-ranges and file-sizes. Stations cluster around random
+    'towns' within each country, as real networks do.
+    """
+    rng = random.Random(seed)
+    cumulative = list(itertools.accumulate(
+        share for _, share, _, _, _ in COUNTRIES
+    ))
+    # country : [(state, latitude, longitude)]
+    towns = {}
+    for country, share, lats, lons, states in COUNTRIES:
+        towns[country] = []
+        for _ in range(max(int(count * share / 40), 1)):
+            if states is None:
+                towns[country].append(
+                    (None, rng.uniform(*lats), rng.uniform(*lons))
+                )
+                continue
+            state, lat, lon, spread = rng.choice(states)
+            towns[country].append((
+                state,
+                min(max(rng.gauss(lat, spread / 2), lats[0]), lats[1]),
+                min(max(rng.gauss(lon, spread / 2), lons[0]), lons[1])
+            ))
+    serials = {}
+
+    for _ in range(count):
+        country = COUNTRIES[min(
+            bisect.bisect(cumulative, rng.random() * cumulative[-1]),
+            len(COUNTRIES) - 1
+        )][0]
+        serials[country] = serials.get(country, 0) + 1
+        network = rng.choice("C1W") if country == "US" else rng.choice("0MW")
+        stnid = "{}{}{:08d}".format(country, network, serials[country])
+
+        state, town_lat, town_lon = rng.choice(towns[country])
+        lat = round(min(max(town_lat + rng.gauss(0, 0.3), -90), 90), 4)
+        lon = round(
+            min(max(town_lon + rng.gauss(0, 0.3), -179.9999), 179.9999),
+            4
+        )
+        elev = -999.9 if rng.random() < 0.03 \
+            else round(min(rng.lognormvariate(5.3, 1.0), 5500), 1)
+
+        # Element data-ranges; precipitation nearly always, temperatures and
+        #   snow for a minority of stations
+        start = int(min(max(rng.gauss(1970, 30), 1832), last_year))
+        end = last_year if rng.random() < 0.55 \
+            else rng.randint(start, last_year)
+        years = []
+        elements = 0
+        for element, chance in [
+            ("PRCP", 0.97), ("SNOW", 0.5), ("SNWD", 0.4),
+            ("TMAX", 0.35), ("TMIN", 0.35),
+        ]:
+            if rng.random() < chance:
+                elements += 1
+                years.extend([
+                    min(start + rng.randint(0, 5), end),
+                    end
+                ])
+            else:
+                years.extend([None, None])
+
+        size = round(
+            (end - start + 1) * elements * rng.uniform(0.6, 1.6),
+            1
+        ) if elements > 0 else 0.0
+
+        yield (
+            stnid, lat, lon, elev,
+            state,
+            synthetic_name(rng),
+            int(rng.random() < 0.01),
+            int(country == "US" and rng.random() < 0.02),
+            "{:05d}".format(rng.randint(1000, 99999)) \
+                if rng.random() < 0.08 else None,
+            country,
+            size,
+        ) + tuple(years) + (int(elements > 0),)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="synth",
+        description="Generate a synthetic, schema-compatible GHCNDaily "
+            "database for scale testing."
+    )
+    parser.add_argument(
+        "-n", "--stations",
+        type=int,
+        default=118000,
+        help="quantity of stations (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="random seed; the same seed gives the same data (default: "
+            "%(default)s)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        default="synthetic.db.gz",
+        help="database to write; a name not ending in '.gz' is written as a "
+            "plain sqlite3 file (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    _database.write_database(
+        synthetic_rows(args.stations, args.seed),
+        args.output
+    )
+    print("* Wrote {} synthetic stations to '{}'".format(
+        args.stations,
+        args.output
+    ))
+
+if __name__ == "__main__":
+    main()
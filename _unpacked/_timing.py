@@ -0,0 +1,40 @@
+import time
+import contextlib
+
+class PhaseTimer:
+    """Records the wall-clock duration of named phases relative to an origin
+    (by default, the moment of creation).
+    """
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager timing the enclosed block as phase 'name'."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start)
+
+    def add(self, name, start, end=None):
+        """Records phase 'name' as running from 'start' until 'end' (or now).
+        """
+        end = time.perf_counter() if end is None else end
+        self.phases.append((name, start - self.origin, end - start))
+
+    def report(self, title="startup"):
+        """Returns a breakdown of the recorded phases, formatted like the
+        output of 'python -X importtime': the duration of each phase and the
+        time elapsed (since the origin) when it finished, in microseconds.
+        """
+        lines = ["{} time: self [us] | cumulative | phase".format(title)]
+        for name, offset, duration in self.phases:
+            lines.append("{} time: {:>9} | {:>10} | {}".format(
+                title,
+                int(duration * 1e6),
+                int((offset + duration) * 1e6),
+                name
+            ))
+        return "\n".join(lines)
@@ -0,0 +1,237 @@
+import os
+import sys
+import gzip
+import time
+import heapq
+import shutil
+import tempfile
+import argparse
+import itertools
+import collections
+import concurrent.futures
+import _download
+import _verify
+import _archive
+
+# 'by_year/YYYY.csv.gz' files hold every station's observations for a year,
+#   laid out as the 'by_station/' files are (station, date, element, value,
+#   flags, observation time). Station ids and dates are fixed-width, so
+#   sorting the lines as text orders them by station, date, then element.
+
+TransposeSummary = collections.namedtuple(
+    "TransposeSummary",
+    ["files", "runs", "lines", "stations", "seconds"]
+)
+
+def sort_runs(path, tmpdir, chunk=1000000, stations=None):
+    """Splits a yearly file into sorted runs of at most 'chunk' lines,
+    written (gzip, level 1) to 'tmpdir'. Runs in a worker process; returns
+    (path, [run path, ...], lines read).
+
+    stations: optional set of station ids; other lines are dropped
+    """
+    runs = []
+    count = 0
+    with gzip.open(path, "rt", newline="") as r:
+        while True:
+            lines = list(itertools.islice(r, chunk))
+            if len(lines) == 0:
+                break
+            count += len(lines)
+            if stations is not None:
+                lines = [
+                    line for line in lines
+                    if line[:line.find(",")] in stations
+                ]
+            # (a last line without its newline would join the next)
+            lines = [
+                line if line.endswith("\n") else line + "\n"
+                for line in lines if line.strip()
+            ]
+            if len(lines) == 0:
+                continue
+            lines.sort()
+            fd, run = tempfile.mkstemp(suffix=".run.gz", dir=tmpdir)
+            # (GzipFile leaves a file object it's given open)
+            with os.fdopen(fd, "wb") as raw, \
+                gzip.open(raw, "wt", compresslevel=1) as w:
+                w.writelines(lines)
+            runs.append(run)
+    return path, runs, count
+
+def merge_runs(runs, tmpdir, fan_in=128):
+    """Merges sorted runs down to at most 'fan_in', each merge writing a
+    longer run, so the final merge never holds too many files open.
+    Returns the remaining run paths.
+    """
+    runs = list(runs)
+    while len(runs) > fan_in:
+        group, runs = runs[:fan_in], runs[fan_in:]
+        fd, merged = tempfile.mkstemp(suffix=".run.gz", dir=tmpdir)
+        with os.fdopen(fd, "wb") as raw, \
+            gzip.open(raw, "wt", compresslevel=1) as w:
+            readers = [gzip.open(run, "rt", newline="") for run in group]
+            try:
+                w.writelines(heapq.merge(*readers))
+            finally:
+                for r in readers:
+                    r.close()
+        for run in group:
+            os.remove(run)
+        runs.append(merged)
+    return runs
+
+def write_stations(runs, dest="", overwrite=True):
+    """Merges sorted runs into a file per station, named as downloads are
+    (see _download.save_name). Yields each name as it's written.
+    """
+    readers = [gzip.open(run, "rt", newline="") for run in runs]
+    try:
+        merged = heapq.merge(*readers)
+        for stnid, lines in itertools.groupby(
+            merged,
+            key=lambda line: line[:line.find(",")]
+        ):
+            name = _download.save_name(stnid, overwrite, dest)
+            with gzip.open(name, "wt", compresslevel=6, newline="") as w:
+                w.writelines(lines)
+            yield name
+    finally:
+        for r in readers:
+            r.close()
+
+def transpose(paths, dest="", workers=None, chunk=1000000, tmpdir=None,
+    stations=None, overwrite=True, fan_in=128, progress=None):
+    """Transposes 'by_year/' files into 'by_station/' style files (see
+    write_stations) by an external merge sort, so memory stays bounded
+    however many years there are. Returns a TransposeSummary.
+
+    The yearly files are split into sorted runs of 'chunk' lines on a pool
+    of 'workers' processes (each holding one chunk at a time), spilled to
+    a temporary directory within 'tmpdir', then merged with heapq.merge,
+    'fan_in' runs at a time.
+
+    dest: created if it doesn't exist
+    stations: optional set of station ids to keep
+    progress: optional callback, given a message for each step done
+    """
+    started = time.perf_counter()
+    if dest:
+        os.makedirs(dest, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(prefix="ghcnd-transpose-", dir=tmpdir)
+    try:
+        runs = []
+        count = 0
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(sort_runs, path, tmpdir, chunk, stations)
+                for path in paths
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                path, path_runs, lines = future.result()
+                runs.extend(path_runs)
+                count += lines
+                if progress is not None:
+                    progress("sorted '{}' into {} run{}".format(
+                        path,
+                        len(path_runs),
+                        "s" if len(path_runs) != 1 else ""
+                    ))
+        sorted_runs = len(runs)
+        runs = merge_runs(runs, tmpdir, fan_in)
+        written = 0
+        for name in write_stations(runs, dest, overwrite):
+            written += 1
+            if progress is not None and written % 1000 == 0:
+                progress("wrote {} stations".format(written))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return TransposeSummary(
+        len(paths),
+        sorted_runs,
+        count,
+        written,
+        time.perf_counter() - started
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="transpose",
+        description="Turn 'by_year/YYYY.csv.gz' files into per-station "
+            "'.csv.gz' files like those downloaded, with an external merge "
+            "sort that spills to temporary files rather than holding the "
+            "years in memory."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="yearly '.csv.gz' files, or directories holding them"
+    )
+    parser.add_argument(
+        "--dest",
+        default="",
+        help="directory to write station files to (default: current "
+            "directory)"
+    )
+    parser.add_argument(
+        "--stations",
+        metavar="FILE",
+        help="only write the stations listed in FILE ('-' for stdin), one "
+            "per line; 'query' output works"
+    )
+    parser.add_argument(
+        "--no-overwrite",
+        action="store_true",
+        help="append the time to the names of written files, as downloads "
+            "do"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes sorting chunks (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=1000000,
+        help="lines sorted in memory at once, per worker (default: "
+            "%(default)s; roughly 100 bytes each)"
+    )
+    parser.add_argument(
+        "--temp",
+        metavar="DIR",
+        help="where to spill sorted runs; they take about a fifth of the "
+            "input's uncompressed size (default: the system's temporary "
+            "directory)"
+    )
+    args = parser.parse_args(argv)
+
+    stations = None
+    if args.stations is not None:
+        stations = set(_archive.read_station_ids(args.stations))
+    paths = _verify.archive_paths(args.paths)
+    summary = transpose(
+        paths,
+        args.dest,
+        args.workers,
+        args.chunk,
+        args.temp,
+        stations,
+        not args.no_overwrite,
+        progress=lambda message: print("* {}".format(message),
+            file=sys.stderr)
+    )
+    print("* Wrote {} station files from {} lines of {} yearly file{} in "
+        "{:.2f}s ({} sorted runs)".format(
+            summary.stations,
+            summary.lines,
+            summary.files,
+            "s" if summary.files != 1 else "",
+            summary.seconds,
+            summary.runs
+        ), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    main()
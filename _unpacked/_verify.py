@@ -0,0 +1,185 @@
+import os
+import sys
+import csv
+import zlib
+import hashlib
+import argparse
+import collections
+import concurrent.futures
+import _download
+
+# A checked archive: 'ok' is False (with 'error' saying why) for one that's
+#   unreadable, truncated, or fails its CRC/length trailer. 'sha256' is the
+#   hash of the file as saved, 'size' its bytes and 'length' the bytes of
+#   CSV it holds (as far as it could be read).
+Verification = collections.namedtuple(
+    "Verification",
+    ["path", "ok", "sha256", "size", "length", "error"]
+)
+
+def station_id(path):
+    """Returns the station id a saved file is named after (see
+    _download.save_name).
+    """
+    return os.path.basename(path).split(".")[0].split("_")[0]
+
+def archive_paths(paths):
+    """Expands any directories among 'paths' into the '.csv.gz' files they
+    hold.
+    """
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded.extend(sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.endswith(".csv.gz")
+            ))
+        else:
+            expanded.append(path)
+    return expanded
+
+def verify_file(path, chunksize=1 << 20):
+    """Streams a saved '.csv.gz' through zlib, which checks each gzip
+    member's CRC-32 and length trailer, hashing the file along the way.
+    """
+    digest = hashlib.sha256()
+    size = length = 0
+    try:
+        with open(path, "rb") as r:
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            while True:
+                data = r.read(chunksize)
+                if data == b"":
+                    break
+                digest.update(data)
+                size += len(data)
+                while data:
+                    length += len(d.decompress(data))
+                    if d.eof is False:
+                        break
+                    # (another gzip member may follow; 'gzip' allows it)
+                    data = d.unused_data
+                    if data:
+                        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            length += len(d.flush())
+            if d.eof is False:
+                raise EOFError(
+                    "the gzip stream ends early" if size > 0 else "empty file"
+                )
+    except (OSError, EOFError, zlib.error) as e:
+        return Verification(path, False, digest.hexdigest(), size, length, e)
+    return Verification(path, True, digest.hexdigest(), size, length, None)
+
+def verify_files(paths, workers=None):
+    """Verifies many saved files on a pool of threads (zlib and hashlib
+    release the GIL while they work). Yields a Verification as each
+    completes.
+    """
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for future in concurrent.futures.as_completed(
+            [pool.submit(verify_file, path) for path in paths]
+        ):
+            yield future.result()
+
+def redownload(paths, base_url=_download.BASE_URL, timeout=5, workers=4):
+    """Fetches corrupt files again, over themselves, then verifies them.
+    Yields a Verification for each; a failed fetch's is not 'ok'.
+    """
+    import urllib.error
+
+    def refetch(path):
+        try:
+            _download.fetch(
+                _download.station_url(station_id(path), base_url),
+                path,
+                timeout
+            )
+        except (urllib.error.URLError, OSError) as e:
+            return Verification(path, False, None, None, None, e)
+        return verify_file(path)
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for future in concurrent.futures.as_completed(
+            [pool.submit(refetch, path) for path in paths]
+        ):
+            yield future.result()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="verify",
+        description="Check that downloaded station archives are complete "
+            "(gzip CRC and length), listing each file's SHA-256."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="'.csv.gz' files, or directories holding them"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="threads to verify on (default: CPUs + 4, up to 32)"
+    )
+    parser.add_argument(
+        "--redownload",
+        action="store_true",
+        help="download corrupt files again, over themselves"
+    )
+    parser.add_argument(
+        "--base-url",
+        default=_download.BASE_URL,
+        help="with --redownload, location of the 'by_station/' files "
+            "(default: %(default)s)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="write the CSV manifest here (default: stdout)"
+    )
+    args = parser.parse_args(argv)
+
+    paths = archive_paths(args.paths)
+    results = {v.path: v for v in verify_files(paths, args.workers)}
+    corrupt = [path for path in paths if results[path].ok is False]
+    for path in corrupt:
+        print("* '{}' is corrupt! ({})".format(path, results[path].error),
+            file=sys.stderr)
+    if args.redownload and corrupt:
+        for v in redownload(corrupt, args.base_url):
+            results[v.path] = v
+            print("* Redownload of '{}' {}".format(
+                v.path,
+                "Successful!" if v.ok else "FAILED! ({})".format(v.error)
+            ), file=sys.stderr)
+
+    fp = open(args.output, "w", newline="") if args.output is not None \
+        else sys.stdout
+    try:
+        writer = csv.writer(fp, lineterminator="\n")
+        writer.writerow(["path", "ok", "sha256", "size", "length", "error"])
+        for path in paths:
+            v = results[path]
+            writer.writerow([
+                v.path,
+                "true" if v.ok else "false",
+                v.sha256 or "",
+                "" if v.size is None else v.size,
+                "" if v.length is None else v.length,
+                v.error or ""
+            ])
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+
+    failed = sum(1 for v in results.values() if v.ok is False)
+    print("* {} of {} files verified{}".format(
+        len(paths) - failed,
+        len(paths),
+        ", {} corrupt".format(failed) if failed else ""
+    ), file=sys.stderr)
+    return 1 if failed > 0 else 0
+
+if __name__ == "__main__":
+    main()
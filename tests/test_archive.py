@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import gzip
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _archive
+
+def dly_line(stnid, year, month, element, values):
+    """A '.dly' line, with 'values' ({day: value}) and -9999 otherwise."""
+    return "{}{}{:02d}{}{}\n".format(
+        stnid, year, month, element, "".join(
+            "{:>5}  S".format(values.get(day, -9999))
+            for day in range(1, 32)
+        )
+    )
+
+def add_member(tar, stnid):
+    data = dly_line(stnid, 2020, 1, "PRCP", {1: 5, 2: 0}).encode()
+    info = tarfile.TarInfo("ghcnd_all/{}.dly".format(stnid))
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+class DlyToCsvTest(unittest.TestCase):
+    def test_convert(self):
+        data = (
+            dly_line("USC00000001", 2020, 1, "TMAX", {2: 120, 1: 100})
+            + dly_line("USC00000001", 2020, 1, "PRCP", {1: 5})
+        ).encode()
+        self.assertEqual(_archive.dly_to_csv(data).decode(), (
+            "USC00000001,20200101,TMAX,100,,,S,\n"
+            "USC00000001,20200101,PRCP,5,,,S,\n"
+            "USC00000001,20200102,TMAX,120,,,S,\n"
+        ))
+
+class ExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.dest = os.path.join(self.tmpdir, "out")
+        os.mkdir(self.dest)
+        self.stations = ["USC{:08d}".format(n) for n in range(6)]
+        self.tar = os.path.join(self.tmpdir, "ghcnd_all.tar")
+        with tarfile.open(self.tar, "w") as tar:
+            for stnid in self.stations[:4]:
+                add_member(tar, stnid)
+
+    def extract(self, archive, stnids, **kwargs):
+        return [
+            (stnid, name is not None, type(error))
+            for stnid, name, error in _archive.extract_from_archive(
+                archive, stnids, self.dest, **kwargs
+            )
+        ]
+
+    def test_stream(self):
+        compressed = self.tar + ".gz"
+        with open(self.tar, "rb") as r, gzip.open(compressed, "wb") as w:
+            shutil.copyfileobj(r, w)
+        self.assertEqual(
+            self.extract(compressed, ["USC00000002", "XXX00000000"]),
+            [
+                ("USC00000002", True, type(None)),
+                ("XXX00000000", False, LookupError),
+            ]
+        )
+        self.assertEqual(os.listdir(self.dest), ["USC00000002.dly"])
+
+    def test_index(self):
+        entries = []
+        self.assertEqual(self.extract(self.tar, [], entries=entries), [])
+        self.assertEqual(
+            [entry.station for entry in entries],
+            self.stations[:4]
+        )
+        self.assertEqual(
+            _archive.read_index(_archive.index_path(self.tar)),
+            {entry.station: entry for entry in entries}
+        )
+        self.assertEqual(
+            self.extract(self.tar, ["USC00000003", "USC00000001"]),
+            [
+                ("USC00000003", True, type(None)),
+                ("USC00000001", True, type(None)),
+            ]
+        )
+        with open(os.path.join(self.dest, "USC00000003.dly")) as r:
+            self.assertTrue(r.read().startswith("USC00000003202001PRCP"))
+
+    def test_stale_index(self):
+        self.extract(self.tar, [], entries=[])
+        with tarfile.open(self.tar, "a") as tar:
+            for stnid in self.stations[4:]:
+                add_member(tar, stnid)
+        # stations the index predates are streamed for
+        self.assertEqual(
+            self.extract(self.tar, ["USC00000005", "USC00000000"], as_csv=True),
+            [
+                ("USC00000000", True, type(None)),
+                ("USC00000005", True, type(None)),
+            ]
+        )
+        self.assertEqual(
+            sorted(os.listdir(self.dest)),
+            ["USC00000000.csv.gz", "USC00000005.csv.gz"]
+        )
+
+    def test_mismatched_index(self):
+        self.extract(self.tar, [], entries=[])
+        with tarfile.open(self.tar, "w") as tar:
+            for stnid in reversed(self.stations):
+                add_member(tar, stnid)
+        with self.assertRaises(ValueError):
+            self.extract(self.tar, ["USC00000001"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import asyncio
+import unittest
+import http.server
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _asyncdownload
+import _standin
+import _verify
+
+class Redirector:
+    """A local server answering every request with '301 Moved
+    Permanently' to 'target' + the requested file's name, or (with
+    target None) to itself, forever.
+    """
+    def __init__(self, target=None):
+        self.target = target
+
+    def __enter__(self):
+        redirector = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                name = self.path.rsplit("/", 1)[-1]
+                location = redirector.target + name \
+                    if redirector.target is not None else "/again/" + name
+                self.send_response(301)
+                self.send_header("Location", location)
+                self.send_header("Content-Length", "5")
+                self.end_headers()
+                self.wfile.write(b"moved")
+
+            def log_message(self, *args):
+                pass
+
+        # (threaded, as each worker keeps its connection open)
+        self.server = _standin._Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = "http://127.0.0.1:{}/pub/".format(
+            self.server.server_address[1]
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dest)
+        self.stations = ["USC{:08d}".format(n) for n in range(8)]
+
+    def download(self, base_url, **kwargs):
+        return sorted(_asyncdownload.download_stations(
+            self.stations,
+            dest=self.dest,
+            base_url=base_url,
+            concurrency=3,
+            **kwargs
+        ))
+
+    def test_download(self):
+        batches = []
+        with _standin.StandInServer() as server:
+            results = self.download(server.base_url, started=batches.append)
+        self.assertEqual([error for _, _, error in results], [None] * 8)
+        for stnid, name, _ in results:
+            self.assertEqual(name, os.path.join(self.dest, stnid + ".csv.gz"))
+            self.assertTrue(_verify.verify_file(name).ok)
+        self.assertEqual(len(batches), 1)
+        self.assertTrue(batches[0].done)
+        self.assertEqual(
+            (batches[0].completed, batches[0].failed),
+            (8, 0)
+        )
+
+    def test_redirect(self):
+        with _standin.StandInServer() as server, \
+            Redirector(server.base_url) as redirector:
+            results = self.download(redirector.base_url)
+            self.assertEqual(server.requests, 8)
+        self.assertEqual([error for _, _, error in results], [None] * 8)
+        self.assertTrue(all(
+            _verify.verify_file(name).ok for _, name, _ in results
+        ))
+
+    def test_redirect_loop(self):
+        with Redirector() as redirector:
+            results = self.download(redirector.base_url)
+        for _, name, error in results:
+            self.assertIsNone(name)
+            self.assertIsInstance(error, _asyncdownload.DownloadError)
+            self.assertIn("redirects", str(error))
+        self.assertEqual(os.listdir(self.dest), [])
+
+    def test_unsaveable(self):
+        missing = os.path.join(self.dest, "missing", "USC00000000.csv.gz")
+        with _standin.StandInServer() as server:
+            url = urllib.parse.urlsplit(
+                _asyncdownload.station_url("USC00000000", server.base_url)
+            )
+            loop = asyncio.new_event_loop()
+            self.addCleanup(loop.close)
+            connection = loop.run_until_complete(
+                _asyncdownload._Connection.open(
+                    "http", url.hostname, url.port, 5
+                )
+            )
+            try:
+                with self.assertRaises(FileNotFoundError):
+                    loop.run_until_complete(
+                        connection.download(url.path, missing)
+                    )
+                # (the response's body is left unread)
+                self.assertFalse(connection.reusable)
+            finally:
+                connection.close()
+                loop.run_until_complete(asyncio.sleep(0))
+
+    def test_http_error(self):
+        with _standin.StandInServer(error_rate=1) as server:
+            results = self.download(server.base_url, adaptive=False)
+        for _, name, error in results:
+            self.assertIsNone(name)
+            self.assertEqual(error.status, 503)
+            self.assertTrue(_asyncdownload.throttled(error))
+
+class AIMDTest(unittest.TestCase):
+    def test_slow_start(self):
+        controller = _asyncdownload.AIMD(64, initial=4)
+        for _ in range(10):
+            controller.update(latency=0.01)
+        self.assertEqual(controller.allowed, 14)
+        for _ in range(100):
+            controller.update(latency=0.01)
+        self.assertEqual(controller.allowed, 64)
+
+    def test_throttled(self):
+        controller = _asyncdownload.AIMD(64, initial=32)
+        busy = _asyncdownload.DownloadError("HTTP 503", 503)
+        # (a failure or two is tolerated)
+        controller.update(error=busy)
+        self.assertEqual(controller.allowed, 32)
+        for _ in range(4):
+            controller.update(error=busy)
+        self.assertLess(controller.allowed, 32)
+        self.assertGreater(controller.decreases, 0)
+        for _ in range(50):
+            controller.update(error=busy)
+        self.assertEqual(controller.allowed, 1)
+
+    def test_not_throttled(self):
+        controller = _asyncdownload.AIMD(64, initial=8)
+        missing = _asyncdownload.DownloadError("HTTP 404", 404)
+        unsaveable = OSError(28, "No space left on device")
+        for error in [missing, unsaveable]:
+            self.assertFalse(_asyncdownload.throttled(error))
+            for _ in range(20):
+                controller.update(latency=0.01, error=error)
+        self.assertEqual(controller.allowed, 8)
+        self.assertEqual(controller.decreases, 0)
+
+    def test_throttled_kinds(self):
+        for error, expected in [
+            (_asyncdownload.DownloadError("HTTP 429", 429), True),
+            (_asyncdownload.DownloadError("HTTP 503", 503), True),
+            (_asyncdownload.DownloadError("HTTP 500", 500), False),
+            (_asyncdownload.DownloadError("malformed response"), False),
+            (ConnectionResetError("reset"), True),
+            (asyncio.IncompleteReadError(b"", 10), True),
+            (PermissionError("denied"), False),
+        ]:
+            self.assertEqual(_asyncdownload.throttled(error), expected, error)
+
+    def test_slowdown(self):
+        controller = _asyncdownload.AIMD(64, initial=16)
+        controller.update(latency=0.01)
+        self.assertEqual(controller.allowed, 17)
+        for _ in range(10):
+            controller.update(latency=1.0)
+        # (cut once; not again within a smoothed latency)
+        self.assertEqual(controller.decreases, 1)
+        self.assertEqual(controller.allowed, 8)
+
+    def test_additive_after_decrease(self):
+        controller = _asyncdownload.AIMD(64, initial=10)
+        controller.update(error=_asyncdownload.DownloadError("HTTP 429", 429))
+        for _ in range(5):
+            controller.update(error=ConnectionResetError("reset"))
+        limit = controller.limit
+        controller.errors = 0.0
+        for _ in range(int(limit)):
+            controller.update()
+        # about one more per round once it has slowed down
+        self.assertEqual(controller.allowed, int(limit) + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _database
+
+def station_line(stnid, lat, lon, elev, state, name, gsn="", hcn="", wmo=""):
+    """A 'ghcnd-stations.txt' line, laid out as NOAA's readme describes."""
+    return "{:11} {:8.4f} {:9.4f} {:6.1f} {:2} {:30} {:3} {:3} {:5}\n".format(
+        stnid, lat, lon, elev, state, name, gsn, hcn, wmo
+    )
+
+def inventory_line(stnid, element, first, last):
+    return "{:11} {:8.4f} {:9.4f} {:4} {:4d} {:4d}\n".format(
+        stnid, 0, 0, element, first, last
+    )
+
+STATIONS = [
+    station_line("USW00013872", 35.4319, -82.5375, 645.0, "NC",
+        "ASHEVILLE RGNL AP", "", "HCN", "72315"),
+    station_line("CA001012010", 48.6500, -123.4333, 20.0, "BC",
+        "SAANICHTON CDA", "GSN"),
+    station_line("ASN00001000", -15.3000, 128.1000, -999.9, "",
+        "KARUNJIE"),
+]
+INVENTORY = [
+    inventory_line("USW00013872", "TMAX", 1902, 2022),
+    inventory_line("USW00013872", "PRCP", 1902, 2022),
+    inventory_line("USW00013872", "AWND", 1984, 2022),
+    inventory_line("CA001012010", "SNOW", 1914, 1990),
+]
+
+class DatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.stations = self.write("ghcnd-stations.txt", STATIONS)
+        self.inventory = self.write("ghcnd-inventory.txt", INVENTORY)
+        self.db = os.path.join(self.tmpdir, "GHCNDaily.db.gz")
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as w:
+            w.writelines(lines)
+        return path
+
+    def load(self):
+        tmp = _database.extract_database(self.db)
+        try:
+            return _database.load_stations(tmp.name)
+        finally:
+            os.remove(tmp.name)
+
+    def test_read_stations(self):
+        stations = _database.read_stations(self.stations)
+        self.assertEqual(list(stations), [
+            "USW00013872", "CA001012010", "ASN00001000"
+        ])
+        self.assertEqual(
+            stations["USW00013872"],
+            (35.4319, -82.5375, 645.0, "NC", "ASHEVILLE RGNL AP", 0, 1,
+                "72315", "US")
+        )
+        self.assertEqual(
+            stations["ASN00001000"],
+            (-15.3, 128.1, -999.9, None, "KARUNJIE", 0, 0, None, "AS")
+        )
+
+    def test_read_inventory(self):
+        inventory = _database.read_inventory(self.inventory)
+        # only the core elements are kept
+        self.assertEqual(inventory["USW00013872"], {
+            "TMAX": (1902, 2022),
+            "PRCP": (1902, 2022),
+        })
+        self.assertNotIn("ASN00001000", inventory)
+
+    def test_build(self):
+        count = _database.build_database(
+            self.stations,
+            self.inventory,
+            self.db,
+            sizes={"USW00013872": 1234.5}
+        )
+        self.assertEqual(count, 3)
+        stations = self.load()
+        self.assertEqual(len(stations), 3)
+        asheville = stations["USW00013872"]
+        self.assertEqual(asheville.size, 1234.5)
+        self.assertEqual(
+            (asheville.prcp_start, asheville.prcp_end),
+            (1902, 2022)
+        )
+        self.assertIsNone(asheville.snow_start)
+        self.assertEqual(asheville.is_available, 1)
+        self.assertEqual(stations["CA001012010"].gsn, 1)
+        self.assertEqual(stations["CA001012010"].size, 0.0)
+        self.assertEqual(stations["ASN00001000"].is_available, 0)
+
+        # every index is built
+        tmp = _database.extract_database(self.db)
+        try:
+            db = sqlite3.connect(tmp.name)
+            indexes = {name for name, in db.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'index' AND sql IS NOT NULL"
+            )}
+            db.close()
+        finally:
+            os.remove(tmp.name)
+        self.assertEqual(indexes, {
+            statement.split()[5] for statement in _database.INDEXES
+        })
+
+    def test_refresh(self):
+        _database.build_database(
+            self.stations,
+            self.inventory,
+            self.db,
+            sizes={"USW00013872": 1234.5}
+        )
+        stations = self.write("ghcnd-stations-new.txt", [
+            station_line("USW00013872", 35.4319, -82.5375, 645.0, "NC",
+                "ASHEVILLE AIRPORT", "", "HCN", "72315"),
+            STATIONS[1],
+            station_line("USC00310301", 35.5, -82.5, 600.0, "NC",
+                "ASHEVILLE"),
+        ])
+        inventory = self.write("ghcnd-inventory-new.txt", INVENTORY + [
+            inventory_line("USC00310301", "PRCP", 1890, 2022),
+        ])
+
+        summary = _database.refresh_database(
+            stations, inventory, self.db, dry_run=True
+        )
+        self.assertEqual(
+            [row[0] for row in summary.inserted],
+            ["USC00310301"]
+        )
+        self.assertEqual(
+            [row[0] for row in summary.changed],
+            ["USW00013872"]
+        )
+        self.assertEqual(summary.removed, ["ASN00001000"])
+        # a dry run writes nothing
+        self.assertIn("ASN00001000", self.load())
+
+        _database.refresh_database(stations, inventory, self.db)
+        refreshed = self.load()
+        self.assertEqual(
+            sorted(refreshed),
+            ["CA001012010", "USC00310301", "USW00013872"]
+        )
+        self.assertEqual(
+            refreshed["USW00013872"].name,
+            "ASHEVILLE AIRPORT"
+        )
+        # sizes aren't in the metadata files; the recorded one is kept
+        self.assertEqual(refreshed["USW00013872"].size, 1234.5)
+
+        summary = _database.refresh_database(stations, inventory, self.db)
+        self.assertFalse(any(summary))
+
+    def test_refresh_plain(self):
+        self.db = os.path.join(self.tmpdir, "stations.db")
+        _database.build_database(self.stations, self.inventory, self.db)
+        stations = self.write("ghcnd-stations-new.txt", STATIONS[:2])
+        summary = _database.refresh_database(
+            stations, self.inventory, self.db
+        )
+        self.assertEqual(summary.removed, ["ASN00001000"])
+        # still a plain sqlite3 file
+        db = sqlite3.connect(self.db)
+        try:
+            self.assertEqual(
+                db.execute("SELECT COUNT(*) FROM GHCNDaily").fetchone(),
+                (2,)
+            )
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    unittest.main()
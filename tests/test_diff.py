@@ -0,0 +1,178 @@
+import io
+import os
+import sys
+import gzip
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _obsstore
+import _diff
+
+def row(stnid, date, element, value, qflag=None):
+    return (stnid, date, element, value, None, qflag, "S", None)
+
+def write_diff(path, members):
+    """Writes a diff archive of {member name: [CSV line, ...]}."""
+    with tarfile.open(path, "w:gz") as tar:
+        for name, lines in sorted(members.items()):
+            data = "".join(line + "\n" for line in lines).encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+class ApplyToStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.db = _obsstore.connect(":memory:")
+        self.addCleanup(self.db.close)
+        self.db.executemany(
+            "INSERT INTO Observations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                row("USC00000001", 20200101, "TMAX", 100),
+                row("USC00000001", 20200102, "TMAX", 120),
+                row("USC00000002", 20200101, "TMAX", 50),
+            ]
+        )
+        self.db.execute(
+            "INSERT INTO Files VALUES ('USC00000001', 'a', 'x', 2, NULL)"
+        )
+        _obsstore.summarize(self.db)
+
+    def values(self, stnid="USC00000001"):
+        return self.db.execute(
+            "SELECT date, element, value FROM Observations "
+            "WHERE station = ? ORDER BY date, element",
+            (stnid,)
+        ).fetchall()
+
+    def summary(self, stnid="USC00000001"):
+        return self.db.execute(
+            "SELECT element, year, count, max, min, total FROM YearSummary "
+            "WHERE station = ? ORDER BY element, year",
+            (stnid,)
+        ).fetchall()
+
+    def test_kinds(self):
+        counts = _diff.apply_to_store(self.db, [
+            ("insert", row("USC00000001", 20200103, "TMAX", 140)),
+            ("update", row("USC00000001", 20200101, "TMAX", 90)),
+            ("delete", row("USC00000001", 20200102, "TMAX", 120)),
+        ])
+        self.assertEqual(counts, {"insert": 1, "update": 1, "delete": 1})
+        self.assertEqual(self.values(), [
+            (20200101, "TMAX", 90),
+            (20200103, "TMAX", 140),
+        ])
+        self.assertEqual(self.summary(), [("TMAX", 2020, 2, 140, 90, 230)])
+        self.assertEqual(self.db.execute(
+            "SELECT observations FROM Files WHERE station = 'USC00000001'"
+        ).fetchone(), (2,))
+        # other stations are left alone
+        self.assertEqual(self.values("USC00000002"), [(20200101, "TMAX", 50)])
+        self.assertEqual(
+            self.summary("USC00000002"),
+            [("TMAX", 2020, 1, 50, 50, 50)]
+        )
+
+    def test_last_change_wins(self):
+        for batch in [50000, 1]:
+            self.setUp()
+            _diff.apply_to_store(self.db, [
+                ("update", row("USC00000001", 20200101, "TMAX", 90)),
+                ("delete", row("USC00000001", 20200101, "TMAX", 90)),
+                ("insert", row("USC00000001", 20200104, "TMAX", 10)),
+                ("update", row("USC00000001", 20200104, "TMAX", 20)),
+            ], batch)
+            self.assertEqual(self.values(), [
+                (20200102, "TMAX", 120),
+                (20200104, "TMAX", 20),
+            ])
+
+    def test_applied_twice(self):
+        changes = [
+            ("insert", row("USC00000001", 20200103, "TMAX", 140)),
+            ("update", row("USC00000001", 20200101, "TMAX", 90)),
+        ]
+        _diff.apply_to_store(self.db, changes)
+        first = self.values(), self.summary()
+        _diff.apply_to_store(self.db, changes)
+        self.assertEqual((self.values(), self.summary()), first)
+
+    def test_summary_skips_flagged(self):
+        _diff.apply_to_store(self.db, [
+            ("update", row("USC00000001", 20200102, "TMAX", 999, "X")),
+            ("insert", row("USC00000001", 20210101, "TMAX", -9999)),
+        ])
+        self.assertEqual(self.summary(), [("TMAX", 2020, 1, 100, 100, 100)])
+
+class ApplyDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(
+            self.tmpdir,
+            "superghcnd_diff_20200101_to_20200102.tar.gz"
+        )
+        write_diff(self.path, {
+            "insert.csv": [
+                "USC00000001,20200103,TMAX,140,,,S,",
+                "USC00000009,20200103,TMAX,1,,,S,",
+            ],
+            "update.csv": ["USC00000001,20200101,TMAX,90,,,S,0700"],
+            "delete.csv": ["USC00000001,20200102,TMAX,120,,,S,"],
+        })
+
+    def test_read_diff(self):
+        self.assertEqual(
+            sorted(_diff.read_diff(self.path, {"USC00000001"})),
+            [
+                ("delete", row("USC00000001", 20200102, "TMAX", 120)),
+                ("insert", row("USC00000001", 20200103, "TMAX", 140)),
+                ("update", ("USC00000001", 20200101, "TMAX", 90, None, None,
+                    "S", "0700")),
+            ]
+        )
+
+    def test_file_patched(self):
+        station = os.path.join(self.tmpdir, "USC00000001.csv.gz")
+        with gzip.open(station, "wt") as w:
+            w.write(
+                "USC00000001,20200101,TMAX,100,,,S,\n"
+                "USC00000001,20200102,TMAX,120,,,S,\n"
+                "USC00000001,20200104,TMAX,160,,,S,\n"
+            )
+        summary = _diff.apply_diff(
+            self.path,
+            files={"USC00000001": station}
+        )
+        self.assertEqual(
+            (summary.inserted, summary.updated, summary.deleted, summary.files),
+            (1, 1, 1, 1)
+        )
+        with gzip.open(station, "rt") as r:
+            self.assertEqual(r.read(), (
+                "USC00000001,20200101,TMAX,90,,,S,0700\n"
+                "USC00000001,20200103,TMAX,140,,,S,\n"
+                "USC00000001,20200104,TMAX,160,,,S,\n"
+            ))
+
+    def test_recorded_once(self):
+        db = _obsstore.connect(":memory:")
+        self.addCleanup(db.close)
+        db.execute(
+            "INSERT INTO Files VALUES ('USC00000001', 'a', 'x', 0, NULL)"
+        )
+        summary = _diff.apply_diff(self.path, db)
+        self.assertTrue(summary.applied)
+        # (only stations in the store are applied)
+        self.assertEqual(summary.inserted, 1)
+        self.assertEqual(db.execute(
+            "SELECT name, inserted, updated, deleted FROM Diffs"
+        ).fetchall(), [("superghcnd_diff_20200101_to_20200102", 1, 1, 1)])
+        self.assertFalse(_diff.apply_diff(self.path, db).applied)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _database
+import _export
+
+STATIONS = [
+    _database.Station(
+        "USW00013872", 35.4319, -82.5375, 645.0, "NC", "ASHEVILLE RGNL AP",
+        0, 1, "72315", "US", 1234.5, 1902, 2022, 1948, 2022, None, None,
+        1902, 2022, 1902, 2022, 1
+    ),
+    _database.Station(
+        "ASN00001000", -15.3, 128.1, -999.9, None, 'KARUNJIE "OLD", WA', 1,
+        0, None, "AS", 0.0, None, None, None, None, None, None, None, None,
+        None, None, 0
+    ),
+]
+DISTANCES = {"USW00013872": 12.34567, "ASN00001000": 15000.0}
+
+def typed(fields, values):
+    """Converts CSV strings back to a Station's types ("" is None)."""
+    converted = []
+    for field, value in zip(fields, values):
+        if value == "":
+            converted.append(None)
+        elif field in ["latitude", "longitude", "elevation", "size",
+            "distance"]:
+            converted.append(float(value))
+        elif field.endswith(("_start", "_end")) \
+        or field in ["gsn", "hcn_crn", "is_available"]:
+            converted.append(int(value))
+        else:
+            converted.append(value)
+    return dict(zip(fields, converted))
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def expected(self, distances=None):
+        return [
+            dict(
+                station._asdict(),
+                **({"distance": round(distances[station.id], 3)}
+                    if distances else {})
+            )
+            for station in STATIONS
+        ]
+
+    def test_format_for(self):
+        self.assertEqual(_export.format_for("a.CSV"), "csv")
+        self.assertEqual(_export.format_for("a.ndjson"), "jsonl")
+        self.assertEqual(_export.format_for("a.json"), "geojson")
+        self.assertEqual(_export.format_for("a.txt", "jsonl"), "jsonl")
+
+    def test_csv(self):
+        for distances in [None, DISTANCES]:
+            path = os.path.join(self.tmpdir, "stations.csv")
+            self.assertEqual(
+                _export.export_stations(STATIONS, path, distances=distances),
+                2
+            )
+            with open(path, newline="") as r:
+                rows = list(csv.reader(r))
+            self.assertEqual(rows[0][:len(_database.FIELDS)],
+                list(_database.FIELDS))
+            self.assertEqual(
+                [typed(rows[0], row) for row in rows[1:]],
+                self.expected(distances)
+            )
+
+    def test_jsonl(self):
+        for distances in [None, DISTANCES]:
+            path = os.path.join(self.tmpdir, "stations.jsonl")
+            _export.export_stations(STATIONS, path, distances=distances)
+            with open(path) as r:
+                self.assertEqual(
+                    [json.loads(line) for line in r],
+                    self.expected(distances)
+                )
+
+    def test_geojson(self):
+        for stations in [STATIONS, []]:
+            path = os.path.join(self.tmpdir, "stations.geojson")
+            _export.export_stations(stations, path, distances=DISTANCES)
+            with open(path) as r:
+                collection = json.load(r)
+            self.assertEqual(collection["type"], "FeatureCollection")
+            features = collection["features"]
+            self.assertEqual(
+                [feature["properties"] for feature in features],
+                self.expected(DISTANCES)[:len(stations)]
+            )
+            self.assertEqual(
+                [
+                    (feature["id"], feature["geometry"]["coordinates"])
+                    for feature in features
+                ],
+                [(s.id, [s.longitude, s.latitude]) for s in stations]
+            )
+
+    def test_streamed(self):
+        fp = io.StringIO()
+        written = _export.write_stations(iter(STATIONS), fp, "jsonl")
+        self.assertEqual(fp.getvalue(), "")
+        self.assertEqual(next(written), STATIONS[0])
+        self.assertEqual(fp.getvalue().count("\n"), 1)
+        with self.assertRaises(ValueError):
+            list(_export.write_stations(STATIONS, fp, "xml"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _database
+import _listing
+
+# (both the table and the pre-formatted styles of Apache listings)
+LISTING = """<html><body><table>
+<tr><td><a href="USC00000001.csv.gz">USC00000001.csv.gz</a></td>
+<td align="right">2022-05-01 12:30  </td><td align="right">1.5M</td></tr>
+<tr><td><a href="USC00000002.csv.gz">USC00000002.csv.gz</a></td>
+<td align="right">2022-05-02 08:00  </td><td align="right">512</td></tr>
+</table>
+<pre><a href="../">Parent Directory</a>
+<a href="USC00000003.csv.gz">USC00000003.csv.gz</a>  2021-01-03 10:15:00  20K
+</pre></body></html>
+"""
+
+def row(stnid, size):
+    return (stnid, 35.0, -80.0, 100.0, "NC", "STATION", 0, 0, None, "US",
+        size) + (None,) * 10 + (0,)
+
+class ListingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.listing = os.path.join(self.tmpdir, "by_station.html")
+        with open(self.listing, "w") as w:
+            w.write(LISTING)
+
+    def test_parse(self):
+        self.assertEqual(_listing.parse_listing(self.listing, chunksize=16), {
+            "USC00000001": (1536.0, "2022-05-01 12:30"),
+            "USC00000002": (0.5, "2022-05-02 08:00"),
+            "USC00000003": (20.0, "2021-01-03 10:15"),
+        })
+
+    def test_cache(self):
+        cache = self.listing + ".json"
+        self.assertEqual(len(_listing.load_listing(self.listing)), 3)
+        with open(cache) as r:
+            cached = json.load(r)
+        cached["stations"] = {"USC00000009": [1.0, "2020-01-01 00:00"]}
+        with open(cache, "w") as w:
+            json.dump(cached, w)
+        # the cache is used while the listing is unchanged
+        self.assertEqual(
+            _listing.load_listing(self.listing),
+            {"USC00000009": (1.0, "2020-01-01 00:00")}
+        )
+        os.utime(self.listing, (0, 0))
+        self.assertEqual(len(_listing.load_listing(self.listing)), 3)
+
+    def update(self, name):
+        path = os.path.join(self.tmpdir, name)
+        _database.write_database(
+            [row("USC00000001", 1536.0), row("USC00000009", 7.0)],
+            path
+        )
+        self.assertEqual(_listing.update_sizes(self.listing, path), (3, 0))
+        os.remove(self.listing + ".json")
+        _database.write_database(
+            [row("USC00000001", 1.0), row("USC00000002", 0.0)],
+            path
+        )
+        self.assertEqual(_listing.update_sizes(self.listing, path), (3, 2))
+        tmp = _database.extract_database(path)
+        try:
+            stations = _database.load_stations(tmp.name)
+        finally:
+            os.remove(tmp.name)
+        self.assertEqual(
+            {stnid: station.size for stnid, station in stations.items()},
+            {"USC00000001": 1536.0, "USC00000002": 0.5}
+        )
+        return path
+
+    def test_update_sizes(self):
+        self.update("GHCNDaily.db.gz")
+
+    def test_update_sizes_plain(self):
+        path = self.update("stations.db")
+        # still a plain sqlite3 file
+        db = sqlite3.connect(path)
+        try:
+            self.assertEqual(db.execute(
+                "SELECT modified FROM ByStation WHERE id = 'USC00000003'"
+            ).fetchone(), ("2021-01-03 10:15",))
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _mapview
+
+class ClusterIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.points = [
+            (rng.uniform(-90, 90), rng.uniform(-180, 180))
+            for _ in range(3000)
+        ] + [
+            (35 + rng.gauss(0, 0.5), -80 + rng.gauss(0, 0.5))
+            for _ in range(1000)
+        ] + [(90, 180), (-90, -180), (35.25, -80.25), (35.25, -80.25)]
+        self.index = _mapview.ClusterIndex(self.points)
+        self.views = [
+            (-90, -180, 90, 180),
+            (30, -85, 40, -75),
+            (34.9, -80.6, 35.3, -80.1),
+            (-10, 170, 10, 180),
+        ]
+
+    def in_cells(self, view, level):
+        """The points within the level's cells overlapping a view."""
+        (row0, col0), (row1, col1) = (
+            self.index.cell(view[0], view[1], level),
+            self.index.cell(view[2], view[3], level)
+        )
+        return [
+            point for point in self.points
+            if row0 <= self.index.cell(*point, level)[0] <= row1
+            and col0 <= self.index.cell(*point, level)[1] <= col1
+        ]
+
+    def test_counts(self):
+        # clusters cover every point in view, and only points in cells
+        #   overlapping it
+        for view in self.views:
+            for level in _mapview.LEVELS:
+                scale = _mapview.CELL_PX / level
+                self.assertEqual(self.index.level(scale), level)
+                clusters = self.index.clusters(*view, scale)
+                expected = self.in_cells(view, level)
+                self.assertEqual(
+                    sum(count for _, _, count, _ in clusters),
+                    len(expected),
+                    (view, level)
+                )
+                self.assertGreaterEqual(len(expected), sum(
+                    1 for lat, lon in self.points
+                    if view[0] <= lat <= view[2] and view[1] <= lon <= view[3]
+                ))
+
+    def test_whole_world(self):
+        for level in _mapview.LEVELS:
+            clusters = self.index.clusters(
+                -90, -180, 90, 180, _mapview.CELL_PX / level
+            )
+            self.assertEqual(
+                sum(count for _, _, count, _ in clusters),
+                len(self.points)
+            )
+
+    def test_positions(self):
+        level = _mapview.LEVELS[2]
+        for lat, lon, count, first in self.index.clusters(
+            -90, -180, 90, 180, _mapview.CELL_PX / level
+        ):
+            # (placed at the mean of its points, within its cell)
+            self.assertEqual(
+                self.index.cell(lat, lon, level),
+                self.index.cell(*self.points[first], level)
+            )
+            if count == 1:
+                self.assertEqual((lat, lon), self.points[first])
+
+    def test_individual(self):
+        # zoomed past the finest grid, each point is returned alone
+        view = (34.9, -80.6, 35.3, -80.1)
+        scale = 2 * _mapview.CELL_PX / _mapview.LEVELS[-1]
+        clusters = self.index.clusters(*view, scale)
+        self.assertEqual({count for _, _, count, _ in clusters}, {1})
+        self.assertEqual(
+            sorted((lat, lon) for lat, lon, _, _ in clusters),
+            sorted(self.in_cells(view, _mapview.LEVELS[-1]))
+        )
+        self.assertEqual(
+            sorted(first for _, _, _, first in clusters),
+            sorted(set(first for _, _, _, first in clusters))
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import io
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _database
+import _obsstore
+import _cli
+
+def write_station(path, stnid, tmax, mtime=None):
+    """Writes a 'by_station/' file of daily TMAX values ({date: value})."""
+    with gzip.open(path, "wt") as w:
+        for date, value in sorted(tmax.items()):
+            w.write("{},{},TMAX,{},,,S,\n".format(stnid, date, value))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+def station_row(stnid):
+    return (stnid, 35.0, -80.0, 100.0, "NC", "STATION", 0, 0, None, "US",
+        1.0) + (None,) * 10 + (1,)
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = os.path.join(self.tmpdir, "ghcnd-obs.db")
+        self.db = _obsstore.connect(self.store)
+        self.addCleanup(self.db.close)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def ingest(self, paths):
+        return _obsstore.ingest(self.db, paths, workers=1)
+
+    def values(self, stnid):
+        return self.db.execute(
+            "SELECT date, value FROM Observations WHERE station = ? "
+            "ORDER BY date",
+            (stnid,)
+        ).fetchall()
+
+    def test_ingest(self):
+        paths = [
+            write_station(self.path("USC00000001.csv.gz"), "USC00000001", {
+                20200101: 300, 20200102: 350, 20210101: -9999,
+            }),
+            write_station(self.path("USC00000002.csv.gz"), "USC00000002", {
+                20200101: 100,
+            }),
+        ]
+        corrupt = self.path("USC00000003.csv.gz")
+        with open(corrupt, "wb") as w:
+            w.write(gzip.compress(b"USC00000003,20200101,TMAX,1,,,S,\n")[:-6])
+        summary = self.ingest(paths + [corrupt])
+        self.assertEqual(
+            (summary.loaded, summary.skipped, summary.observations),
+            (2, 0, 4)
+        )
+        self.assertEqual([v.path for v in summary.corrupt], [corrupt])
+        self.assertEqual(self.db.execute(
+            "SELECT * FROM YearSummary ORDER BY station, year"
+        ).fetchall(), [
+            ("TMAX", 2020, "USC00000001", 2, 350, 300, 650),
+            ("TMAX", 2020, "USC00000002", 1, 100, 100, 100),
+        ])
+
+        # unchanged files are skipped; changed ones replace what was loaded
+        write_station(paths[1], "USC00000002", {20200105: 120})
+        summary = self.ingest(paths)
+        self.assertEqual((summary.loaded, summary.skipped), (1, 1))
+        self.assertEqual(self.values("USC00000002"), [(20200105, 120)])
+        summary_rows = self.db.execute(
+            "SELECT * FROM YearSummary ORDER BY station, year"
+        ).fetchall()
+        _obsstore.summarize(self.db)
+        self.assertEqual(self.db.execute(
+            "SELECT * FROM YearSummary ORDER BY station, year"
+        ).fetchall(), summary_rows)
+
+    def test_newest_file(self):
+        # (a file saved without overwriting, older than the plain name)
+        older = write_station(
+            self.path("USC00000001_20240101-120000.csv.gz"),
+            "USC00000001", {20200101: 1}, mtime=1000000000
+        )
+        newer = write_station(
+            self.path("USC00000001.csv.gz"),
+            "USC00000001", {20200101: 2}, mtime=1100000000
+        )
+        self.ingest([older, newer])
+        self.assertEqual(self.values("USC00000001"), [(20200101, 2)])
+        self.assertEqual(self.db.execute(
+            "SELECT path FROM Files"
+        ).fetchone(), (os.path.abspath(newer),))
+
+        os.utime(older, (1200000000, 1200000000))
+        self.ingest([newer, older])
+        self.assertEqual(self.values("USC00000001"), [(20200101, 1)])
+
+    def test_query(self):
+        self.ingest([
+            write_station(self.path("USC00000001.csv.gz"), "USC00000001", {
+                20200101: 300, 20200102: 350,
+            }),
+            write_station(self.path("USC00000002.csv.gz"), "USC00000002", {
+                20200101: 100, 20210101: 400,
+            }),
+        ])
+        database = self.path("stations.db")
+        _database.write_database(
+            [station_row("USC0000000{}".format(n)) for n in [1, 2, 3]],
+            database
+        )
+
+        def query(*obs):
+            output = self.path("out.csv")
+            with contextlib.redirect_stderr(io.StringIO()):
+                _cli.query_main([
+                    "--database", database, "--store", self.store,
+                    "--obs", *obs, "-o", output
+                ])
+            with open(output) as r:
+                return [line.split(",")[0] for line in r.readlines()[1:]]
+
+        self.assertEqual(
+            query("TMAX", "max", ">=", "30", "2020", "2020"),
+            ["USC00000001"]
+        )
+        self.assertEqual(
+            query("TMAX", "max", ">=", "30", "-", "-"),
+            ["USC00000001", "USC00000002"]
+        )
+        self.assertEqual(
+            query("TMAX", "mean", "<=", "25", "2020", "2021"),
+            ["USC00000002"]
+        )
+        # (stations not in the store never match)
+        self.assertEqual(
+            query("TMAX", "min", "<=", "20", "-", "-"),
+            ["USC00000002"]
+        )
+
+if __name__ == "__main__":
+    unittest.main()
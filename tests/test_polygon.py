@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import math
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _polygon
+
+SQUARE = [(0, 0), (0, 10), (10, 10), (10, 0)]
+HOLE = [(4, 4), (4, 6), (6, 6), (6, 4)]
+
+class ContainsTest(unittest.TestCase):
+    def test_square(self):
+        square = _polygon.Polygon([SQUARE])
+        self.assertEqual(square.bbox, (0, 0, 10, 10))
+        self.assertTrue(square.contains(5, 5))
+        self.assertFalse(square.contains(5, 11))
+        self.assertFalse(square.contains(-1, 5))
+        # a closing vertex repeating the first is dropped
+        closed = _polygon.Polygon([SQUARE + SQUARE[:1]])
+        self.assertEqual(closed.rings, square.rings)
+
+    def test_hole(self):
+        donut = _polygon.Polygon([SQUARE, HOLE])
+        self.assertTrue(donut.contains(2, 2))
+        self.assertFalse(donut.contains(5, 5))
+        self.assertTrue(donut.contains(5, 8))
+        # (separate rings are separate parts)
+        parts = _polygon.Polygon([HOLE, [(20, 20), (20, 30), (30, 25)]])
+        self.assertTrue(parts.contains(5, 5))
+        self.assertTrue(parts.contains(22, 25))
+        self.assertFalse(parts.contains(15, 15))
+
+    def test_edges(self):
+        # a point on an edge shared by neighbouring regions is in only one
+        west = _polygon.Polygon([SQUARE])
+        east = _polygon.Polygon([[(0, 10), (0, 20), (10, 20), (10, 10)]])
+        north = _polygon.Polygon([[(10, 0), (10, 10), (20, 10), (20, 0)]])
+        for lat in [0, 2.5, 5, 9.99]:
+            self.assertEqual(
+                [west.contains(lat, 10), east.contains(lat, 10)].count(True),
+                1
+            )
+        for lon in [0, 2.5, 5, 9.99]:
+            self.assertEqual(
+                [west.contains(10, lon), north.contains(10, lon)].count(True),
+                1
+            )
+        # (as are points on a hole's edges)
+        donut = _polygon.Polygon([SQUARE, HOLE])
+        hole = _polygon.Polygon([HOLE])
+        for lat, lon in [(4, 5), (6, 5), (5, 4), (5, 6), (4, 4)]:
+            self.assertNotEqual(
+                donut.contains(lat, lon),
+                hole.contains(lat, lon)
+            )
+
+    def test_bands(self):
+        # a star of many vertices, tested against a single band (every
+        #   edge tested for every point)
+        rng = random.Random(0)
+        star = [
+            (
+                (10 + 8 * (i % 2)) * math.sin(i * math.pi / 200),
+                (10 + 8 * (i % 2)) * math.cos(i * math.pi / 200)
+            )
+            for i in range(400)
+        ]
+        banded = _polygon.Polygon([star])
+        single = _polygon.Polygon([star], bands=1)
+        self.assertGreater(len(banded.bands), 1)
+        for _ in range(2000):
+            lat, lon = rng.uniform(-20, 20), rng.uniform(-20, 20)
+            self.assertEqual(
+                banded.contains(lat, lon),
+                single.contains(lat, lon)
+            )
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            _polygon.Polygon([])
+        with self.assertRaises(ValueError):
+            _polygon.Polygon([[(0, 0), (1, 1), (0, 0)]])
+
+class ParseTest(unittest.TestCase):
+    def assertRings(self, polygon, rings):
+        self.assertEqual(
+            polygon.rings,
+            [[(float(lat), float(lon)) for lat, lon in ring] for ring in rings]
+        )
+
+    def test_wkt(self):
+        self.assertRings(
+            _polygon.parse_polygon(
+                "POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0), "
+                "(4 4, 6 4, 6 6, 4 6, 4 4))"
+            ),
+            [
+                [(0, 0), (0, 10), (10, 10), (10, 0)],
+                [(4, 4), (4, 6), (6, 6), (6, 4)],
+            ]
+        )
+        multi = _polygon.parse_polygon(
+            "multipolygon (((-80 35, -79 35, -79 36, -80 35)), "
+            "((10 -5.5, 11 -5.5, 11 -4, 10 -5.5)))"
+        )
+        self.assertEqual(len(multi.rings), 2)
+        self.assertTrue(multi.contains(35.2, -79.5))
+        self.assertFalse(multi.contains(-5, 12))
+
+    def test_geojson(self):
+        polygon = {
+            "type": "Polygon",
+            "coordinates": [
+                [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]],
+                [[4, 4, 100], [6, 4, 100], [6, 6, 100], [4, 6, 100]],
+            ],
+        }
+        for document in [
+            polygon,
+            {"type": "Feature", "properties": {}, "geometry": polygon},
+            {"type": "FeatureCollection", "features": [
+                {"type": "Feature", "geometry": None},
+                {"type": "Feature", "geometry": polygon},
+            ]},
+            {"type": "GeometryCollection", "geometries": [polygon]},
+            {"type": "MultiPolygon", "coordinates": [
+                polygon["coordinates"]
+            ]},
+        ]:
+            self.assertRings(
+                _polygon.parse_polygon("  " + json.dumps(document)),
+                [
+                    [(0, 0), (0, 10), (10, 10), (10, 0)],
+                    [(4, 4), (4, 6), (6, 6), (6, 4)],
+                ]
+            )
+
+    def test_vertices(self):
+        self.assertRings(
+            _polygon.parse_polygon("35.5, -84\n36.6 -75.5\n-33.8,.5"),
+            [[(35.5, -84), (36.6, -75.5), (-33.8, 0.5)]]
+        )
+        with self.assertRaises(ValueError):
+            _polygon.parse_vertices("35, -84 36")
+
+    def test_load(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "region.wkt")
+        with open(path, "w") as w:
+            w.write("POLYGON ((0 0, 10 0, 10 10, 0 0))\n")
+        self.assertTrue(_polygon.load_polygon(path).contains(1, 5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import sys
+import sqlite3
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _database
+import _query
+
+def station(stnid, lat, lon, elev, state, name, prcp=(None, None),
+    tmax=(None, None)):
+    return _database.Station(
+        stnid, lat, lon, elev, state, name, 0, 0, None, stnid[:2], 10.0,
+        prcp[0], prcp[1], None, None, None, None, tmax[0], tmax[1], None,
+        None, 1
+    )
+
+STATIONS = [
+    station("USC00000001", 35.6, -82.5, 650.0, "NC", "ASHEVILLE",
+        (1890, 2020), (1900, 2020)),
+    station("USW00000002", 35.2, -80.8, 230.0, "NC", "CHARLOTTE AP",
+        (1930, 2020)),
+    station("USW00000003", 36.1, -86.7, 180.0, "TN", "NASHVILLE AP",
+        (1950, 1990), (1950, 2020)),
+    station("CA000000004", 49.3, -123.2, -999.9, "BC", "VANCOUVER AIRPORT",
+        (1937, 2020)),
+    station("ASN00000005", -33.9, 151.2, 40.0, None, "SYDNEY"),
+]
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.addCleanup(self.db.close)
+        _database.create_schema(self.db)
+        self.db.executemany(
+            "INSERT INTO GHCNDaily VALUES ({})".format(
+                ", ".join("?" * len(_database.FIELDS))
+            ),
+            STATIONS
+        )
+
+    def query(self, **criteria):
+        return sorted(
+            stnid for stnid, in _query.execute_query(
+                self.db, columns="id", **criteria
+            )
+        )
+
+    def test_filters(self):
+        self.assertEqual(self.query(), sorted(s.id for s in STATIONS))
+        self.assertEqual(
+            self.query(desc=r"airport|\bAP\b"),
+            ["CA000000004", "USW00000002", "USW00000003"]
+        )
+        self.assertEqual(
+            self.query(country="NC"),
+            ["USC00000001", "USW00000002"]
+        )
+        self.assertEqual(self.query(country="AS"), ["ASN00000005"])
+        self.assertEqual(
+            self.query(lat1=36, lat1_sign=">=", lon1=-100, lon1_sign="<="),
+            ["CA000000004"]
+        )
+        # unknown elevations never match
+        self.assertEqual(
+            self.query(elev=200),
+            ["ASN00000005", "USW00000003"]
+        )
+        self.assertEqual(
+            self.query(elev=200, elev_sign=">="),
+            ["USC00000001", "USW00000002"]
+        )
+
+    def test_bbox(self):
+        self.assertEqual(
+            self.query(bbox=True, lat1=37, lon1=-87, lat2=35, lon2=-81),
+            ["USC00000001", "USW00000003"]
+        )
+        # corners in either order
+        self.assertEqual(
+            self.query(bbox=True, lat1=35, lon1=-81, lat2=37, lon2=-87),
+            ["USC00000001", "USW00000003"]
+        )
+        # (an incomplete box isn't applied)
+        self.assertEqual(len(self.query(bbox=True, lat1=37)), len(STATIONS))
+
+    def test_coverage(self):
+        self.assertEqual(
+            self.query(coverage=[("PRCP", 1900, 2000)]),
+            ["USC00000001"]
+        )
+        self.assertEqual(
+            self.query(coverage=[("PRCP", None, 2020), ("TMAX", None, None)]),
+            ["USC00000001"]
+        )
+        self.assertEqual(
+            self.query(coverage=[("PRCP", 1950, None)]),
+            ["CA000000004", "USC00000001", "USW00000002", "USW00000003"]
+        )
+        with self.assertRaises(ValueError):
+            self.query(coverage=[("WSFG", 1950, None)])
+
+    def test_has_filters(self):
+        self.assertFalse(_query.has_filters())
+        self.assertFalse(_query.has_filters(lat1_sign=">=", elev_sign="<="))
+        self.assertFalse(_query.has_filters(bbox=True, lat1=1, lon1=2))
+        self.assertTrue(
+            _query.has_filters(bbox=True, lat1=1, lon1=2, lat2=3, lon2=4)
+        )
+        self.assertTrue(_query.has_filters(lat1=1))
+        self.assertTrue(_query.has_filters(country="NC"))
+        self.assertFalse(_query.has_filters(coverage=[]))
+        self.assertTrue(_query.has_filters(coverage=[("PRCP", None, None)]))
+
+class ResultSetTest(unittest.TestCase):
+    def setUp(self):
+        self.table = _query.StationTable({s.id: s for s in STATIONS})
+
+    def test_from_cursor(self):
+        db = sqlite3.connect(":memory:")
+        self.addCleanup(db.close)
+        cursor = db.execute(
+            "SELECT column1 FROM (VALUES ('ASN00000005'), ('USC00000001'))"
+        )
+        results = _query.ResultSet.from_cursor(self.table, cursor, batch=1)
+        self.assertEqual(list(results.ids()), ["ASN00000005", "USC00000001"])
+        self.assertEqual(results.index("USC00000001"), 1)
+        with self.assertRaises(ValueError):
+            results.index("USW00000002")
+
+    def test_sort(self):
+        results = _query.ResultSet(self.table, range(len(STATIONS)))
+        # (states are compared as strings; stations without one as "None")
+        results.sort(key=_query.sort_key("state"))
+        self.assertEqual(
+            [s.state for s in results],
+            ["BC", "NC", "NC", None, "TN"]
+        )
+        results.sort(key=_query.sort_key("elevation"), reverse=True)
+        self.assertEqual(results[0].id, "USC00000001")
+        self.assertEqual(
+            [s.id for s in results[-2:]],
+            ["ASN00000005", "CA000000004"]
+        )
+        distances = {"USW00000003": 5.0, "USC00000001": 1.0}
+        results.sort(key=_query.sort_key("distance", distances))
+        self.assertEqual(
+            list(results.ids())[:2],
+            ["USC00000001", "USW00000003"]
+        )
+        # without distances it's by id
+        results.sort(key=_query.sort_key("distance"))
+        self.assertEqual(
+            list(results.ids()),
+            sorted(s.id for s in STATIONS)
+        )
+
+if __name__ == "__main__":
+    unittest.main()
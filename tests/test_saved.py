@@ -0,0 +1,186 @@
+import io
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import collections
+import configparser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _database
+import _export
+import _query
+import _saved
+
+def station(stnid, lat, lon, state, name, prcp=(1900, 2020)):
+    return _database.Station(
+        stnid, lat, lon, 100.0, state, name, 0, 0, None, "US", 10.0,
+        prcp[0], prcp[1], None, None, None, None, None, None, None, None, 1
+    )
+
+STATIONS = [
+    station("USC00000001", 35.6, -82.5, "NC", "ASHEVILLE"),
+    station("USC00000002", 35.2, -80.8, "NC", "CHARLOTTE AP"),
+    station("USC00000003", 36.1, -86.7, "TN", "NASHVILLE AP"),
+    station("USC00000004", 35.9, -83.9, "TN", "KNOXVILLE", (1950, 2000)),
+    station("USC00000005", 34.0, -81.0, "SC", "COLUMBIA"),
+]
+
+def connect():
+    db = sqlite3.connect(":memory:")
+    _database.create_schema(db)
+    db.executemany(
+        "INSERT INTO GHCNDaily VALUES ({})".format(
+            ", ".join("?" * len(_database.FIELDS))
+        ),
+        STATIONS
+    )
+    return db
+
+class SectionTest(unittest.TestCase):
+    def test_round_trip(self):
+        spec = {
+            "desc": "100% (AP|AIRPORT)",
+            "country": "NC",
+            "lat1": 35.5,
+            "lat1_sign": ">=",
+            "lon1": -80.0,
+            "lon1_sign": "<=",
+            "elev": 300.0,
+            "elev_sign": ">=",
+            "coverage": [("PRCP", 1950, None), ("TMAX", None, 2020)],
+            "observations": [("TMAX", "max", ">=", 40.0, None, 2020)],
+            "polygon": "/tmp/region.geojson",
+            "near": (35.6, -82.5),
+            "count": 10,
+            "radius": 250.5,
+        }
+        config = configparser.ConfigParser()
+        config["DEFAULT"] = {"sort": "name"}
+        _saved.save_query(config, "nc airports", spec)
+        _saved.save_query(config, "bbox", {
+            "bbox": True, "lat1": 30.0, "lon1": -85.0, "lat2": 40.0,
+            "lon2": -75.0,
+        })
+        fp = io.StringIO()
+        config.write(fp)
+
+        config = configparser.ConfigParser()
+        config.read_string(fp.getvalue())
+        self.assertEqual(_saved.saved_names(config), ["nc airports", "bbox"])
+        self.assertEqual(_saved.load_query(config, "nc airports"), spec)
+        self.assertEqual(_saved.load_query(config, "bbox"), {
+            "bbox": True, "lat1": 30.0, "lon1": -85.0, "lat2": 40.0,
+            "lon2": -75.0,
+        })
+        _saved.delete_query(config, "bbox")
+        self.assertEqual(_saved.saved_names(config), ["nc airports"])
+
+    def test_signs_kept_with_values(self):
+        self.assertEqual(
+            dict(_saved.to_section({"lat1_sign": "<=", "lon1": -80.0,
+                "lon1_sign": ">="})),
+            {"lon1": "-80", "lon1_sign": ">="}
+        )
+
+    def test_names(self):
+        config = configparser.ConfigParser()
+        for name in ["", "a]b", "a\nb"]:
+            with self.assertRaises(ValueError):
+                _saved.save_query(config, name, {"country": "NC"})
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.db = connect()
+        self.addCleanup(self.db.close)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_matches_separate_queries(self):
+        region = os.path.join(self.tmpdir, "region.txt")
+        with open(region, "w") as w:
+            w.write("37 -87\n37 -82\n35 -82\n35 -87\n")
+        specs = collections.OrderedDict([
+            ("nc", {"country": "NC"}),
+            ("airports", {"desc": r"\bAP\b"}),
+            ("region", {"polygon": region}),
+            ("old prcp", {"coverage": [("PRCP", 1900, 2020)]}),
+            ("nothing", {"country": "XX"}),
+            ("everything", {}),
+            ("west of -82", {"lon1": -82.0, "lon1_sign": "<="}),
+        ])
+        batch = _saved.run_batch(self.db, specs)
+        self.assertEqual(list(batch), list(specs))
+        for name, spec in specs.items():
+            criteria, _ = _saved.resolve(spec)
+            expected = [
+                _database.Station(*row)
+                for row in _query.execute_query(self.db, **criteria)
+            ]
+            stations, distances = batch[name]
+            self.assertEqual(
+                sorted(stations),
+                sorted(expected),
+                name
+            )
+            self.assertIsNone(distances)
+        self.assertEqual(
+            [s.id for s in batch["region"][0]],
+            ["USC00000001", "USC00000003", "USC00000004"]
+        )
+
+class MixedBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.db = connect()
+        self.addCleanup(self.db.close)
+
+    def test_mixed(self):
+        batch = _saved.run_batch(self.db, {
+            "near": {"near": (35.6, -82.5), "count": 2},
+            "tn": {"country": "TN"},
+        })
+        stnids, distances = _saved.merge_batch(batch)
+        self.assertEqual(
+            stnids,
+            ["USC00000001", "USC00000004", "USC00000003"]
+        )
+        # (Nashville has no distance, so none are kept)
+        self.assertEqual(distances, {})
+
+        # lone distances still sort and export
+        partial = {"USC00000004": 130.0, "USC00000001": 0.0}
+        stations = [STATIONS[2], STATIONS[3], STATIONS[0]]
+        self.assertEqual(
+            [s.id for s in sorted(
+                stations,
+                key=_query.sort_key("distance", partial)
+            )],
+            ["USC00000001", "USC00000004", "USC00000003"]
+        )
+        fp = io.StringIO()
+        list(_export.write_stations(stations, fp, "csv", partial))
+        self.assertEqual(
+            [line.rsplit(",", 1)[1] for line in fp.getvalue().splitlines()],
+            ["distance", "", "130.0", "0.0"]
+        )
+
+    def test_proximity_only(self):
+        batch = _saved.run_batch(self.db, {
+            "asheville": {"near": (35.6, -82.5), "count": 2},
+            "charlotte": {"near": (35.2, -80.8), "radius": 200},
+        })
+        stnids, distances = _saved.merge_batch(batch)
+        self.assertEqual(sorted(stnids), sorted(distances))
+        self.assertEqual(
+            stnids,
+            ["USC00000001", "USC00000004", "USC00000002", "USC00000005"]
+        )
+        # the least of a station's distances is kept
+        self.assertEqual(distances["USC00000002"], 0.0)
+        self.assertEqual(distances["USC00000001"], 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
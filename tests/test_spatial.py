@@ -0,0 +1,87 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _spatial
+
+class SpatialIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.points = [
+            ("S{:05d}".format(n), rng.uniform(-90, 90), rng.uniform(-180, 180))
+            for n in range(2000)
+        ]
+        # (a cluster, the poles and the antimeridian, and a duplicate)
+        self.points += [
+            ("C{:05d}".format(n), 35 + rng.random(), -80 + rng.random())
+            for n in range(300)
+        ] + [
+            ("N", 90, 0), ("P", -90, 45), ("E", 10, 180), ("W", 10, -179.9),
+            ("D", 35.5, -79.5),
+        ]
+        self.index = _spatial.SpatialIndex(self.points, leafsize=8)
+        self.queries = [
+            (35.5, -79.5), (0, 0), (89, 100), (-60, 179.5), (10, -180),
+        ]
+
+    def brute(self, lat, lon, among=None):
+        return sorted(
+            (_spatial.great_circle(lat, lon, plat, plon), key)
+            for key, plat, plon in self.points
+            if among is None or key in among
+        )
+
+    def assertSame(self, found, expected):
+        self.assertEqual(
+            [key for _, key in found],
+            [key for _, key in expected]
+        )
+        for (km, _), (expected_km, _) in zip(found, expected):
+            self.assertAlmostEqual(km, expected_km, places=6)
+
+    def test_count(self):
+        for lat, lon in self.queries:
+            for count in [1, 5, 40, len(self.points) + 1]:
+                self.assertSame(
+                    self.index.nearest(lat, lon, count=count),
+                    self.brute(lat, lon)[:count]
+                )
+
+    def test_radius(self):
+        for lat, lon in self.queries:
+            for radius in [1, 150, 1500, 30000]:
+                self.assertSame(
+                    self.index.nearest(lat, lon, radius=radius),
+                    [p for p in self.brute(lat, lon) if p[0] <= radius]
+                )
+
+    def test_count_and_radius(self):
+        for lat, lon in self.queries:
+            self.assertSame(
+                self.index.nearest(lat, lon, count=10, radius=500),
+                [p for p in self.brute(lat, lon) if p[0] <= 500][:10]
+            )
+
+    def test_among(self):
+        for among in [{"C00001", "S00002", "N"}, set(self.index.keys[::2])]:
+            self.assertSame(
+                self.index.nearest(35.5, -79.5, count=20, among=among),
+                self.brute(35.5, -79.5, among)[:20]
+            )
+
+    def test_invalid(self):
+        for limits in [{}, {"count": 0}, {"count": -1}, {"radius": 0},
+            {"radius": -5}]:
+            with self.assertRaises(ValueError):
+                self.index.nearest(35, -80, **limits)
+
+    def test_empty(self):
+        index = _spatial.SpatialIndex([])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.nearest(35, -80, count=3), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _transpose
+
+def yearly_lines(year, stations, rng):
+    lines = [
+        "{},{}{:02d}{:02d},{},{},,,S,\n".format(
+            stnid, year, month, day, element, rng.randint(-100, 400)
+        )
+        for stnid in stations
+        for month in [1, 6, 12]
+        for day in [1, 15, 28]
+        for element in ["PRCP", "TMAX", "TMIN"]
+    ]
+    rng.shuffle(lines)
+    return lines
+
+class TransposeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        rng = random.Random(0)
+        self.stations = ["USC{:08d}".format(n) for n in range(12)]
+        self.paths = []
+        self.lines = []
+        for year in [2019, 2020, 2021]:
+            lines = yearly_lines(year, self.stations, rng)
+            path = os.path.join(self.tmpdir, "{}.csv.gz".format(year))
+            with gzip.open(path, "wt") as w:
+                # (the last line without its newline, as some files end)
+                w.write("".join(lines).rstrip("\n"))
+            self.paths.append(path)
+            self.lines.extend(lines)
+
+    def read(self, path):
+        with gzip.open(path, "rt") as r:
+            return r.readlines()
+
+    def test_sort_runs(self):
+        path, runs, count = _transpose.sort_runs(
+            self.paths[0], self.tmpdir, chunk=50
+        )
+        self.assertEqual(count, len(self.lines) // 3)
+        self.assertEqual(len(runs), -(-count // 50))
+        merged = []
+        for run in runs:
+            lines = self.read(run)
+            self.assertEqual(lines, sorted(lines))
+            merged.extend(lines)
+        self.assertEqual(sorted(merged), sorted(self.lines[:count]))
+
+    def test_merge_runs(self):
+        runs = []
+        for path in self.paths:
+            runs.extend(_transpose.sort_runs(path, self.tmpdir, chunk=40)[1])
+        merged = _transpose.merge_runs(runs, self.tmpdir, fan_in=3)
+        self.assertLessEqual(len(merged), 3)
+        self.assertLess(len(merged), len(runs))
+        lines = []
+        for run in merged:
+            run_lines = self.read(run)
+            self.assertEqual(run_lines, sorted(run_lines))
+            lines.extend(run_lines)
+        self.assertEqual(sorted(lines), sorted(self.lines))
+        # the merged runs are removed as they're merged
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.tmpdir)
+                if name.endswith(".run.gz")),
+            sorted(os.path.basename(run) for run in merged)
+        )
+
+    def test_transpose(self):
+        dest = os.path.join(self.tmpdir, "by_station")
+        summary = _transpose.transpose(
+            self.paths, dest, workers=1, chunk=64, fan_in=4
+        )
+        self.assertEqual(summary.files, 3)
+        self.assertEqual(summary.lines, len(self.lines))
+        self.assertEqual(summary.stations, len(self.stations))
+        self.assertEqual(
+            sorted(os.listdir(dest)),
+            [stnid + ".csv.gz" for stnid in self.stations]
+        )
+        for stnid in self.stations:
+            lines = self.read(os.path.join(dest, stnid + ".csv.gz"))
+            self.assertEqual(lines, sorted(
+                line for line in self.lines if line.startswith(stnid + ",")
+            ))
+            # ordered by date, then element
+            keys = [line.split(",")[1:3] for line in lines]
+            self.assertEqual(keys, sorted(keys))
+
+    def test_stations(self):
+        dest = os.path.join(self.tmpdir, "by_station")
+        wanted = set(self.stations[3:5])
+        summary = _transpose.transpose(
+            self.paths, dest, workers=1, stations=wanted
+        )
+        self.assertEqual(summary.stations, 2)
+        self.assertEqual(
+            sorted(os.listdir(dest)),
+            sorted(stnid + ".csv.gz" for stnid in wanted)
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import gzip
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "_unpacked"))
+
+import _verify
+
+CSV = b"".join(
+    "USC00000001,2020{:02d}01,PRCP,{},,,7,\n".format(month, month).encode()
+    for month in range(1, 13)
+)
+
+class VerifyFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as w:
+            w.write(data)
+        return path
+
+    def test_intact(self):
+        data = gzip.compress(CSV)
+        v = _verify.verify_file(self.write("USC00000001.csv.gz", data))
+        self.assertTrue(v.ok)
+        self.assertIsNone(v.error)
+        self.assertEqual(v.size, len(data))
+        self.assertEqual(v.length, len(CSV))
+        self.assertEqual(v.sha256, hashlib.sha256(data).hexdigest())
+
+    def test_several_members(self):
+        data = gzip.compress(CSV[:100]) + gzip.compress(CSV[100:])
+        v = _verify.verify_file(self.write("USC00000001.csv.gz", data))
+        self.assertTrue(v.ok)
+        self.assertEqual(v.length, len(CSV))
+
+    def test_small_chunks(self):
+        data = gzip.compress(CSV) + gzip.compress(CSV)
+        path = self.write("USC00000001.csv.gz", data)
+        v = _verify.verify_file(path, chunksize=7)
+        self.assertTrue(v.ok)
+        self.assertEqual(v.length, 2 * len(CSV))
+
+    def test_truncated(self):
+        data = gzip.compress(CSV)
+        v = _verify.verify_file(self.write("USC00000001.csv.gz", data[:-6]))
+        self.assertFalse(v.ok)
+        self.assertIsInstance(v.error, EOFError)
+
+    def test_bad_crc(self):
+        data = bytearray(gzip.compress(CSV))
+        # the CRC-32 is the trailer's first four bytes
+        data[-8] ^= 0xFF
+        v = _verify.verify_file(self.write("USC00000001.csv.gz", bytes(data)))
+        self.assertFalse(v.ok)
+
+    def test_empty(self):
+        v = _verify.verify_file(self.write("USC00000001.csv.gz", b""))
+        self.assertFalse(v.ok)
+        self.assertEqual(str(v.error), "empty file")
+
+    def test_missing(self):
+        v = _verify.verify_file(os.path.join(self.tmpdir, "missing.csv.gz"))
+        self.assertFalse(v.ok)
+        self.assertIsInstance(v.error, OSError)
+
+    def test_verify_files(self):
+        good = self.write("USC00000001.csv.gz", gzip.compress(CSV))
+        bad = self.write("USC00000002.csv.gz", gzip.compress(CSV)[:-6])
+        results = {v.path: v.ok for v in _verify.verify_files([good, bad])}
+        self.assertEqual(results, {good: True, bad: False})
+
+class PathsTest(unittest.TestCase):
+    def test_station_id(self):
+        self.assertEqual(
+            _verify.station_id("x/USC00000001.csv.gz"),
+            "USC00000001"
+        )
+        # (as saved without overwriting)
+        self.assertEqual(
+            _verify.station_id("USC00000001_20200101-120000.csv.gz"),
+            "USC00000001"
+        )
+
+    def test_archive_paths(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name in ["b.csv.gz", "a.csv.gz", "notes.txt"]:
+            open(os.path.join(tmpdir, name), "w").close()
+        self.assertEqual(
+            _verify.archive_paths([tmpdir, "other.csv.gz"]),
+            [
+                os.path.join(tmpdir, "a.csv.gz"),
+                os.path.join(tmpdir, "b.csv.gz"),
+                "other.csv.gz",
+            ]
+        )
+
+if __name__ == "__main__":
+    unittest.main()